@@ -0,0 +1,117 @@
+import asyncio
+import logging
+
+import serial
+
+import framing
+from device import DeviceProtocol, encode_request, with_commands
+
+logger = logging.getLogger(__name__)
+
+# read timeout of ports read in the executor, a read returns as soon as bytes come,
+# without a timeout an idle port would be read in a busy loop
+EXECUTOR_READ_TIMEOUT = 0.05
+
+
+def _command_coroutine(spec):
+    async def method(self, *args, print=logger.info):
+        return spec.parse(await self._transact(spec.command.value, encode_request(spec, *args)), print)
+
+    method.__name__ = method.__qualname__ = spec.name
+    method.__doc__ = spec.doc or None
+    return method
+
+
+@with_commands(_command_coroutine)
+class AsyncMSDesktopDevice(DeviceProtocol):
+    """Coroutine twin of MSDesktopDevice.
+
+    On POSIX the port file descriptor is watched by the event loop, so one loop can serve
+    any number of ports and ptys. Ports without a file descriptor, as on Windows, are read in
+    the default executor with blocking reads of EXECUTOR_READ_TIMEOUT."""
+    def __init__(self, port, crc, timeout=1):
+        if isinstance(port, str):
+            self.ser = serial.Serial(port=port, timeout=0)
+        else:
+            self.ser = port
+        super().__init__(crc)
+        self.timeout = timeout
+        self._lock = None
+        self._frames = None
+        self._loop = None
+        self._reader_task = None
+
+    def _fileno(self):
+        try:
+            return self.ser.fileno()
+        except (AttributeError, OSError, NotImplementedError):
+            return None
+
+    def _start_reading(self):
+        # Loop objects are created here, inside the running loop, as python 3.8 binds them at creation
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        self._frames = asyncio.Queue()
+        fileno = self._fileno()
+        if fileno is not None and hasattr(self._loop, "add_reader"):
+            self._loop.add_reader(fileno, self._on_readable)
+        else:
+            self.ser.timeout = EXECUTOR_READ_TIMEOUT
+            self._reader_task = self._loop.create_task(self._read_in_executor())
+
+    def _feed(self, red):
+        self.reader.feed(red)
+        for frame in self.reader.frames():
+            self._frames.put_nowait(frame)
+
+    def _on_readable(self):
+        try:
+            red = self.ser.read(max(self.ser.in_waiting, 1))
+        except serial.SerialException as e:
+            logger.debug(f"Port read failed: {e!r}")
+            self._loop.remove_reader(self._fileno())
+            return
+        self._feed(red)
+
+    async def _read_in_executor(self):
+        while True:
+            red = await self._loop.run_in_executor(None, lambda: self.ser.read(max(self.ser.in_waiting, 1)))
+            self._feed(red)
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        elif self._loop is not None and self._fileno() is not None:
+            self._loop.remove_reader(self._fileno())
+        self.ser.close()
+
+    async def _get_frame(self):
+        try:
+            return await asyncio.wait_for(self._frames.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise framing.FrameTimeoutError(f"No complete frame in answer, {len(self.reader.buffer)} bytes pending")
+
+    async def _transact(self, command_num, useful=b""):
+        self._start_reading()
+        async with self._lock:
+            self.ser.write(self._send_command(command_num, useful))
+            answer = None
+            while answer is None:
+                answer = self._accept_answer(await self._get_frame(), command_num)
+            return answer
+
+    async def batch(self, *names, print=logger.info):
+        self._start_reading()
+        async with self._lock:
+            specs, to_send = self._batch_request(names)
+            need_commands = [spec.command.value for spec in specs]
+            self.ser.write(to_send)
+            answers = [None] * len(need_commands)
+            first_counter = self.get_counter
+            waiting = len(need_commands)
+            while waiting:
+                if self._accept_batch_answer(await self._get_frame(), need_commands, answers, first_counter):
+                    waiting -= 1
+        return tuple(spec.parse(answer, print) for spec, answer in zip(specs, answers))
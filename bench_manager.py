@@ -0,0 +1,106 @@
+import re
+import time
+import logging
+import pathlib
+import argparse
+import threading
+import typing
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from device import MSDesktopDevice, CRCCalculator, PlaceHolderDevice
+from device_service import poll_device
+from logger import DataLogger, BinaryDataLogger
+
+logger = logging.getLogger(__name__)
+
+
+class Bench():
+    def __init__(self, port, data_logger_path, binary=False):
+        self.port = port
+        if port != "test":
+            self.device = MSDesktopDevice(port, CRCCalculator())
+        else:
+            self.device = PlaceHolderDevice()
+        self.data_logger_path = pathlib.Path(data_logger_path) / re.sub(r"[^\w.-]+", "_", port).strip("_")
+        self.data_logger_path.mkdir(parents=True, exist_ok=True)
+        self.data_logger = (BinaryDataLogger if binary else DataLogger)(self.data_logger_path)
+        self.poll_future: typing.Optional[Future] = None
+        self.cycles = 0
+        self.errors = 0
+
+
+class BenchManager():
+    """Polls several devices side by side, every bench has own port, lock, counters and log file.
+
+    Polls run in a thread pool with one worker per bench, a bench is not polled
+    again while its previous poll is still in flight."""
+    def __init__(self, ports, data_logger_path, binary=False):
+        self.benches = [Bench(port, data_logger_path, binary) for port in ports]
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.benches), 1), thread_name_prefix="Bench")
+        self.started = time.monotonic()
+
+    def poll(self, gas_state="", conc_set="-3"):
+        for bench in self.benches:
+            if bench.poll_future is None or bench.poll_future.done():
+                bench.poll_future = self._executor.submit(poll_device, bench.device)
+                bench.poll_future.add_done_callback(
+                    lambda future, bench=bench: self._save_cycle(bench, future, gas_state, conc_set))
+
+    def _save_cycle(self, bench, future, gas_state, conc_set):
+        try:
+            state, t_ambient, cycle = future.result()
+        except Exception as e:
+            bench.errors += 1
+            logger.info(f"Bench {bench.port} poll failed: {e!r}")
+            return
+        if cycle is not None:
+            bench.data_logger.save_data(cycle.resistances,
+                                        cycle.h2conc,
+                                        gas_state,
+                                        cycle.temperatures,
+                                        t_ambient,
+                                        cycle.heater_cal_transform.k,
+                                        cycle.heater_cal_transform.b,
+                                        conc_set)
+            bench.cycles += 1
+
+    def cycles_per_minute(self):
+        return sum(bench.cycles for bench in self.benches) * 60 / (time.monotonic() - self.started)
+
+    def run(self, interval=1.0, stop_event: typing.Optional[threading.Event] = None):
+        stop_event = threading.Event() if stop_event is None else stop_event
+        next_tick = time.monotonic()
+        while not stop_event.is_set():
+            self.poll()
+            next_tick += interval
+            stop_event.wait(max(next_tick - time.monotonic(), 0))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for bench in self.benches:
+            bench.device.ser.close()
+            bench.data_logger.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect cycles from several devices without UI")
+    parser.add_argument("--port", action="append", required=True, help="Device port, repeat for every bench")
+    parser.add_argument("--logs", default=".", help="Directory for logs, every bench gets its own subdirectory")
+    parser.add_argument("--interval", type=float, default=1.0, help="Poll interval, s")
+    parser.add_argument("--binary", action="store_true", help="Write binary .mslog session logs instead of text")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    manager = BenchManager(args.port, args.logs, args.binary)
+    try:
+        manager.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.close()
+        for bench in manager.benches:
+            logger.info(f"{bench.port}: {bench.cycles} cycles, {bench.errors} errors, log {bench.data_logger.file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Trigger and poll loop against the simulator with and without AnswerCache: commands sent,
+cache hits and time per cycle. Checks that trigger_measurement keeps the cached heater
+calibration transform, so it is read from the device once.
+
+Run from repository root: python benchmarks/bench_answer_cache.py
+"""
+import sys
+import time
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import MSDesktopDevice, CRCCalculator
+from device_service import poll_device
+import simulator
+
+CYCLES = 20
+FIRMWARE = {"measuring": 0.005, "purging": 0.005}
+
+
+def run(name, cached):
+    device = MSDesktopDevice(name, CRCCalculator())
+    if not cached:
+        device.cache.ttls = {}
+    started = time.perf_counter()
+    for _ in range(CYCLES):
+        device.trigger_measurement(0.005)
+        fetched = False
+        # the next trigger is taken in IDLE only
+        while True:
+            state, _, cycle = poll_device(device)
+            fetched = fetched or cycle is not None
+            if fetched and state == 0:
+                break
+            time.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    snapshot = device.metrics.snapshot()
+    transform_reads = sum(phases["frame"]["count"] for command, phases in snapshot["commands"].items()
+                          if "get_heater_cal_transform" in command.split("+"))
+    device.ser.close()
+    return snapshot["counters"], transform_reads, elapsed
+
+
+def main():
+    process, (name,) = simulator.spawn(1, firmware_options=FIRMWARE, latency=0.0001)
+    try:
+        print(f"{'cache':<8}{'commands':>10}{'hits':>8}{'transform reads':>17}{'ms/cycle':>10}")
+        for cached in (False, True):
+            counters, transform_reads, elapsed = run(name, cached)
+            print(f"{'on' if cached else 'off':<8}{counters['commands']:>10}{counters['cache_hits']:>8}"
+                  f"{transform_reads:>17}{elapsed / CYCLES * 1e3:>10.1f}")
+        assert counters["cache_hits"] >= CYCLES - 1, "trigger_measurement cleared the cache"
+        assert transform_reads == 1, "heater cal transform was read from the device again"
+    finally:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
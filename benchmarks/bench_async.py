@@ -0,0 +1,72 @@
+"""Command throughput for 1, 4 and 16 pty devices: one thread per MSDesktopDevice
+against one event loop driving AsyncMSDesktopDevice instances.
+
+Linux only. Run from repository root: python benchmarks/bench_async.py
+"""
+import sys
+import time
+import asyncio
+import pathlib
+import threading
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import MSDesktopDevice, CRCCalculator
+from async_device import AsyncMSDesktopDevice
+import simulator
+
+DURATION = 2.0
+DEVICE_NUMBERS = (1, 4, 16)
+
+
+def threaded(names):
+    devices = [MSDesktopDevice(name, CRCCalculator()) for name in names]
+    counts = [0] * len(devices)
+    deadline = time.perf_counter() + DURATION
+
+    def worker(idx, device):
+        while time.perf_counter() < deadline:
+            device.get_state(print=lambda *_: None)
+            counts[idx] += 1
+
+    threads = [threading.Thread(target=worker, args=item) for item in enumerate(devices)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for device in devices:
+        device.ser.close()
+    return sum(counts) / DURATION
+
+
+async def asynchronous(names):
+    devices = [AsyncMSDesktopDevice(name, CRCCalculator()) for name in names]
+    deadline = time.perf_counter() + DURATION
+
+    async def worker(device):
+        count = 0
+        while time.perf_counter() < deadline:
+            await device.get_state(print=lambda *_: None)
+            count += 1
+        return count
+
+    counts = await asyncio.gather(*(worker(device) for device in devices))
+    for device in devices:
+        await device.close()
+    return sum(counts) / DURATION
+
+
+def main():
+    print(f"{'devices':>8} {'threads, cmd/s':>15} {'asyncio, cmd/s':>15}")
+    for number in DEVICE_NUMBERS:
+        process, names = simulator.spawn(number, latency=0.0025)
+        try:
+            threaded_rate = threaded(names)
+            async_rate = asyncio.run(asynchronous(names))
+        finally:
+            process.terminate()
+        print(f"{number:>8} {threaded_rate:>15.0f} {async_rate:>15.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Wall time of one poll tick: seven sequential round trips against two pipelined batches.
+
+Run from repository root: python benchmarks/bench_batch.py
+"""
+import sys
+import time
+import pathlib
+import statistics
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import MSDesktopDevice, CRCCalculator
+from fake_device import FakeSerial
+
+TICKS = 30
+
+
+def sequential_tick(device):
+    device.get_state()
+    device.get_ambient_temp()
+    device.get_have_data()
+    device.get_have_result()
+    device.get_cycle()
+    device.get_result()
+    device.get_heater_cal_transform()
+
+
+def batch_tick(device):
+    device.batch("get_state", "get_ambient_temp", "get_have_data", "get_have_result")
+    device.batch("get_cycle", "get_result", "get_heater_cal_transform")
+
+
+def measure(tick, **link):
+    device = MSDesktopDevice(FakeSerial(**link), CRCCalculator())
+    times = []
+    for _ in range(TICKS):
+        start = time.perf_counter()
+        tick(device)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    # baudrate None is a USB CDC link where transfer time is negligible against turnaround
+    print(f"{'baudrate':>9} {'turnaround, ms':>15} {'sequential, ms':>15} {'batch, ms':>10} {'speedup':>8}")
+    for baudrate in (None, 115200):
+        for turnaround in (0.001, 0.004, 0.016):
+            sequential = measure(sequential_tick, turnaround=turnaround, baudrate=baudrate)
+            batch = measure(batch_tick, turnaround=turnaround, baudrate=baudrate)
+            print(f"{str(baudrate):>9} {turnaround * 1e3:>15.0f} {sequential * 1e3:>15.1f} {batch * 1e3:>10.1f} "
+                  f"{sequential / batch:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Aggregate cycles/minute of BenchManager against the number of pty devices.
+
+Every simulated device has a new cycle on every poll, so the rate is bounded by the link only.
+Linux only. Run from repository root: python benchmarks/bench_bench_manager.py
+"""
+import sys
+import pathlib
+import tempfile
+import threading
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from bench_manager import BenchManager
+import simulator
+
+DURATION = 3.0
+DEVICE_NUMBERS = (1, 2, 4, 8)
+# cycles this short give a new cycle on every poll
+FIRMWARE = {"autorun": True, "idle": 0.001, "exhale": 0.001, "measuring": 0.001, "purging": 0.001}
+
+
+def main():
+    print(f"{'devices':>8} {'cycles/min':>11} {'per device':>11} {'scaling':>8}")
+    single = None
+    for number in DEVICE_NUMBERS:
+        process, names = simulator.spawn(number, firmware_options=FIRMWARE, latency=0.0205)
+        try:
+            with tempfile.TemporaryDirectory() as logs:
+                manager = BenchManager(names, logs)
+                stop_event = threading.Event()
+                threading.Timer(DURATION, stop_event.set).start()
+                manager.run(interval=0.002, stop_event=stop_event)
+                manager.close()
+                rate = manager.cycles_per_minute()
+        finally:
+            process.terminate()
+        single = rate if single is None else single
+        print(f"{number:>8} {rate:>11.0f} {rate / number:>11.0f} {rate / single / number:>7.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Host-side cost of one command call (encode, frame, parse) against a fake port with zero link latency.
+
+Run from repository root: python benchmarks/bench_commands.py
+"""
+import sys
+import timeit
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import MSDesktopDevice, CRCCalculator, DOTS_NUMBER
+from fake_device import FakeSerial
+
+CALLS = (
+    ("get_state", ()),
+    ("get_have_data", ()),
+    ("get_ambient_temp", ()),
+    ("get_heater_cal_transform", ()),
+    ("get_cycle", ()),
+    ("set_cycle", ([300.0] * DOTS_NUMBER,)),
+    ("chunk_ota", (bytes(2000),)),
+)
+
+
+def main():
+    device = MSDesktopDevice(FakeSerial(turnaround=0, processing=0, baudrate=None), CRCCalculator())
+    quiet = lambda *_: None
+    print(f"{'command':>25} {'us/call':>8}")
+    for name, args in CALLS:
+        method = getattr(device, name)
+        timer = timeit.Timer(lambda: method(*args, print=quiet))
+        number, _ = timer.autorange()
+        print(f"{name:>25} {min(timer.repeat(5, number)) / number * 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Latency and allocations of cycle and heater calibration decoding alone,
+struct.unpack into tuples against np.frombuffer views.
+
+Run from repository root: python benchmarks/bench_decode.py
+"""
+import sys
+import struct
+import timeit
+import pathlib
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import DOTS_NUMBER, DOTS_IN_PASHA_CALIBRATION, _parse_cycle, _parse_heater_calibration
+
+
+def legacy_cycle(answer):
+    data = struct.unpack("<" + "f" * DOTS_NUMBER * 2, answer)
+    data = np.array(data).reshape(-1, 2)
+    resistances, temperatures = data[:, 0], data[:, 1]
+    times = np.arange(temperatures.shape[0])
+    return times, temperatures, resistances
+
+
+def legacy_heater_calibration(answer):
+    data = struct.unpack("<" + "f" * DOTS_IN_PASHA_CALIBRATION, answer)
+    voltages = np.array(data)
+    temperatures = np.arange(DOTS_IN_PASHA_CALIBRATION) + 40
+    return voltages, temperatures
+
+
+def latency_us(func, answer):
+    timer = timeit.Timer(lambda: func(answer))
+    number, _ = timer.autorange()
+    return min(timer.repeat(5, number)) / number * 1e6
+
+
+def allocated_bytes(func, answer):
+    func(answer)
+    tracemalloc.start()
+    func(answer)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    cycle_answer = bytearray(np.random.rand(DOTS_NUMBER * 2).astype("<f4").tobytes())
+    calibration_answer = bytearray(np.random.rand(DOTS_IN_PASHA_CALIBRATION).astype("<f4").tobytes())
+    print(f"{'decode':>22} {'legacy, us':>11} {'views, us':>10} {'legacy, B':>10} {'views, B':>9}")
+    for name, legacy, current, answer in (("get_cycle", legacy_cycle, _parse_cycle, cycle_answer),
+                                          ("get_heater_calibration", legacy_heater_calibration,
+                                           _parse_heater_calibration, calibration_answer)):
+        for legacy_array, array in zip(legacy(answer), current(answer)):
+            assert np.array_equal(legacy_array, array)
+        print(f"{name:>22} {latency_us(legacy, answer):>11.1f} {latency_us(current, answer):>10.1f} "
+              f"{allocated_bytes(legacy, answer):>10} {allocated_bytes(current, answer):>9}")
+
+
+if __name__ == '__main__':
+    main()
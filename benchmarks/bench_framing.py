@@ -0,0 +1,79 @@
+"""Frames/sec of the framing codec against the per-byte implementation it replaced.
+
+Run from repository root: python benchmarks/bench_framing.py
+"""
+import os
+import sys
+import timeit
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import framing
+
+PAYLOAD_SIZES = (16, 2400, 4096)
+
+
+def legacy_escape(data):
+    escaped = bytearray()
+    for byte in data:
+        if byte in (0x7E, 0x81, 0x55):
+            escaped.extend(b"\x55" + byte.to_bytes(1, "little"))
+        else:
+            escaped.append(byte)
+    return escaped
+
+
+def legacy_unescape(frame):
+    buffer = bytearray()
+    reading = False
+    escaped = False
+    for red in frame:
+        if not escaped:
+            if red == 0x7E:
+                reading = True
+                continue
+            elif red == 0x81:
+                break
+            elif red == 0x55:
+                escaped = True
+                continue
+        else:
+            escaped = False
+        if reading:
+            buffer.append(red)
+    return buffer
+
+
+def legacy_encode(body):
+    frame = legacy_escape(body)
+    frame.append(0x81)
+    frame.insert(0, 0x7E)
+    return frame
+
+
+def frames_per_second(func, arg, min_time=0.2):
+    timer = timeit.Timer(lambda: func(arg))
+    number, elapsed = timer.autorange()
+    while elapsed < min_time:
+        number *= 2
+        elapsed = timer.timeit(number)
+    return number / elapsed
+
+
+def main():
+    print(f"{'payload':>8} {'op':>7} {'legacy fps':>12} {'codec fps':>12} {'speedup':>8}")
+    for size in PAYLOAD_SIZES:
+        body = os.urandom(size)
+        frame = framing.encode_frame(body)
+        assert frame == legacy_encode(body)
+        assert framing.decode_frame(frame) == legacy_unescape(frame) == body
+        for name, legacy, codec, arg in (("encode", legacy_encode, framing.encode_frame, body),
+                                         ("decode", legacy_unescape, framing.decode_frame, frame)):
+            legacy_fps = frames_per_second(legacy, arg)
+            codec_fps = frames_per_second(codec, arg)
+            print(f"{size:>8} {name:>7} {legacy_fps:>12.0f} {codec_fps:>12.0f} {codec_fps / legacy_fps:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
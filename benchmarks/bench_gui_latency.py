@@ -0,0 +1,75 @@
+"""Qt event loop latency while polling a slow device, with device calls on the GUI thread
+and through DeviceService worker thread.
+
+Latency is how late a 5 ms probe timer fires. Runs headless:
+QT_QPA_PLATFORM=offscreen python benchmarks/bench_gui_latency.py
+"""
+import os
+import sys
+import time
+import pathlib
+
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from PySide2 import QtCore, QtWidgets
+
+from device import MSDesktopDevice, CRCCalculator
+from device_service import DeviceService, Priority, poll_device
+from fake_device import FakeSerial
+
+PROBE_INTERVAL_MS = 5
+POLL_INTERVAL_MS = 250
+DURATION_MS = 5000
+
+
+def run(use_service):
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    device = MSDesktopDevice(FakeSerial(turnaround=0.016, baudrate=115200), CRCCalculator())
+    service = DeviceService(device) if use_service else None
+    futures = []
+
+    def poll():
+        if service is None:
+            poll_device(device)
+        elif not futures or futures[-1].done():
+            futures.append(service.submit(poll_device, priority=Priority.POLL))
+
+    lateness = []
+    last = [time.perf_counter()]
+
+    def probe():
+        now = time.perf_counter()
+        lateness.append((now - last[0]) * 1e3 - PROBE_INTERVAL_MS)
+        last[0] = now
+
+    poll_timer = QtCore.QTimer()
+    poll_timer.setInterval(POLL_INTERVAL_MS)
+    poll_timer.timeout.connect(poll)
+    probe_timer = QtCore.QTimer()
+    probe_timer.setTimerType(QtCore.Qt.PreciseTimer)
+    probe_timer.setInterval(PROBE_INTERVAL_MS)
+    probe_timer.timeout.connect(probe)
+
+    poll_timer.start()
+    probe_timer.start()
+    QtCore.QTimer.singleShot(DURATION_MS, app.quit)
+    app.exec_()
+    poll_timer.stop()
+    probe_timer.stop()
+    if service is not None:
+        service.close(wait=True)
+    return np.percentile(np.clip(lateness, 0, None), (50, 99, 100))
+
+
+def main():
+    print(f"{'mode':>14} {'p50, ms':>8} {'p99, ms':>8} {'max, ms':>8}")
+    for name, use_service in (("GUI thread", False), ("DeviceService", True)):
+        p50, p99, worst = run(use_service)
+        print(f"{name:>14} {p50:>8.1f} {p99:>8.1f} {worst:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Heater calibration of every sensor: configparser and np.loadtxt per sensor as in the old
+MainWidget.plot_heater_calibration against heater_calibration with its cache and broadcasting,
+and the time the GUI thread spends on the CSV export.
+
+Run from repository root: python benchmarks/bench_heater_calibration.py
+"""
+import sys
+import time
+import pathlib
+import tempfile
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import heater_calibration
+
+SENSORS = 16
+POINTS = 2000
+
+
+def write_files(directory):
+    rng = np.random.default_rng(1)
+    temperatures = np.linspace(25, 500, POINTS)[:, None] + rng.normal(0, 0.5, (POINTS, SENSORS))
+    voltages = 0.01 * temperatures + rng.normal(0, 0.01, (POINTS, SENSORS))
+    resistances = 100 + 0.3 * temperatures
+    cal = np.stack((voltages, resistances, temperatures), axis=2).reshape(POINTS, -1)
+    filename = directory / "sensors.cal"
+    np.savetxt(filename, cal, header=" ".join(f"U{i} R{i} T{i}" for i in range(SENSORS)), comments="")
+    lines = ["[R0]", *(f"R0_{i} = {rng.uniform(9000, 11000):.1f}".replace(".", ",") for i in range(SENSORS)),
+             "[Rc]", *(f"Rc_{i} = {rng.uniform(100, 200):.1f}".replace(".", ",") for i in range(SENSORS)),
+             "[a]", *(f"a0_{i} = {rng.uniform(0.002, 0.004):.5f}".replace(".", ",") for i in range(SENSORS)),
+             "[T0]", "T0 = 25"]
+    filename_par = directory / "sensors.par"
+    filename_par.write_text("\n".join(lines) + "\n")
+    return filename, filename_par
+
+
+def old_sensor(filename, filename_par, sensor_number):
+    config = configparser.ConfigParser()
+    config.read(filename_par)
+    R0 = float(config["R0"][f"R0_{sensor_number}"].replace(",", ".")) / 100
+    Rc = float(config["Rc"][f"Rc_{sensor_number}"].replace(",", ".")) / 100
+    alpha = float(config["a"][f"a0_{sensor_number}"].replace(",", "."))
+    T0 = float(config["T0"]["T0"].replace(",", "."))
+    data = np.loadtxt(filename, skiprows=1)
+    ms_temperatures = data[:, sensor_number * 3 + 2]
+    R = (1 + alpha * (ms_temperatures - T0)) * (R0 - Rc) + Rc
+    return data[:, sensor_number * 3] * R / (R + 20)
+
+
+def timed(function, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        filename, filename_par = write_files(directory)
+        device_temperatures = np.linspace(20, 520, 64)
+        device_voltages = 0.01 * device_temperatures
+
+        old, old_recalc = timed(lambda: [old_sensor(filename, filename_par, n) for n in range(SENSORS)])
+        first, _ = timed(lambda: heater_calibration.sensor_curves(heater_calibration._parse_cal(filename),
+                                                                  heater_calibration._parse_par(filename_par)), 1)
+        heater_calibration.load_curves(filename, filename_par)
+        cached, curves = timed(lambda: heater_calibration.load_curves(filename, filename_par))
+        assert np.allclose(np.column_stack(old_recalc), curves.voltages_recalc)
+        fitting, fit = timed(lambda: heater_calibration.fit_sensors(curves, device_voltages, device_temperatures))
+
+        print(f"{SENSORS} sensors, {POINTS} points")
+        print(f"{'all sensors, old per sensor':<36}{old * 1e3:>10.1f} ms")
+        print(f"{'all sensors, parsed once':<36}{first * 1e3:>10.1f} ms")
+        print(f"{'all sensors, cached':<36}{cached * 1e3:>10.2f} ms")
+        print(f"{'fit of all sensors':<36}{fitting * 1e3:>10.2f} ms")
+        print(f"{'k of sensors':<36}{np.array2string(fit.k[:4], precision=3)} ...")
+
+        export = (directory, device_voltages, device_temperatures, device_voltages, curves, fit, 0)
+        synchronous, _ = timed(lambda: heater_calibration.export_report(*export))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            submitted, future = timed(lambda: executor.submit(heater_calibration.export_report, *export))
+            future.result()
+        print(f"{'GUI thread, export in place':<36}{synchronous * 1e3:>10.2f} ms")
+        print(f"{'GUI thread, export submitted':<36}{submitted * 1e3:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
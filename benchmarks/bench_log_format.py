@@ -0,0 +1,59 @@
+"""Size, write and load time of text DataLogger logs against binary BinaryDataLogger logs.
+
+Run from repository root: python benchmarks/bench_log_format.py
+"""
+import sys
+import time
+import pathlib
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import DOTS_NUMBER
+from logger import DataLogger, BinaryDataLogger, read_binary_log
+
+CYCLES = 2000
+
+
+def write(data_logger, rng):
+    resistances = rng.uniform(1e3, 1e6, DOTS_NUMBER).astype(np.float32)
+    temperatures = rng.uniform(20, 500, DOTS_NUMBER).astype(np.float32)
+    started = time.perf_counter()
+    for i in range(CYCLES):
+        data_logger.save_data(resistances, 1.5, i % 3, temperatures, 25.0, 1.01, -0.5, "-3")
+    elapsed = time.perf_counter() - started
+    data_logger.close()
+    return elapsed
+
+
+def main():
+    rng = np.random.default_rng(1)
+    print(f"{CYCLES} cycles of {DOTS_NUMBER} points")
+    print(f"{'format':>7} {'size, KiB':>10} {'write/cycle, us':>16} {'load all, ms':>13} {'cycle i, us':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        text, binary = DataLogger(directory), BinaryDataLogger(directory)
+        for name, data_logger in (("text", text), ("binary", binary)):
+            write_time = write(data_logger, rng)
+            started = time.perf_counter()
+            if data_logger is text:
+                data = np.loadtxt(data_logger.file)
+            else:
+                data = np.array(read_binary_log(data_logger.file))
+            load_time = time.perf_counter() - started
+            assert len(data) == CYCLES
+            started = time.perf_counter()
+            for i in range(0, CYCLES, 100):
+                if data_logger is text:
+                    with data_logger.file.open() as fd:
+                        row = np.array(next(line for j, line in enumerate(fd) if j == i).split(), dtype=float)
+                else:
+                    row = read_binary_log(data_logger.file)[i]
+            random_time = (time.perf_counter() - started) / len(range(0, CYCLES, 100))
+            print(f"{name:>7} {data_logger.file.stat().st_size / 1024:>10.0f} {write_time / CYCLES * 1e6:>16.1f} "
+                  f"{load_time * 1e3:>13.1f} {random_time * 1e6:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Loading text DataLogger logs: np.loadtxt against log_loader, parallel and from cache,
+and selection of one gas state by a boolean mask against LogIndex.
+
+Run from repository root: python benchmarks/bench_log_loader.py
+"""
+import sys
+import time
+import pathlib
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import DOTS_NUMBER
+from logger import DataLogger
+import log_loader
+
+FILES = 8
+CYCLES = 1000
+STATES = (-1, 2, 4, 6)
+
+
+def write_logs(directory):
+    rng = np.random.default_rng(1)
+    filenames = []
+    for i in range(FILES):
+        data_logger = DataLogger(directory)
+        data_logger.file = data_logger.file.with_name(f"session{i}.log")
+        records = [data_logger.format_record(1.6e9 + i * CYCLES + j,
+                                             rng.uniform(1e3, 1e6, DOTS_NUMBER).astype(np.float32),
+                                             rng.uniform(0, 20), STATES[j % len(STATES)],
+                                             rng.uniform(20, 500, DOTS_NUMBER).astype(np.float32),
+                                             25.0, 1.01, -0.5, "-3")
+                   for j in range(CYCLES)]
+        data_logger.write_records(records)
+        filenames.append(data_logger.file)
+    return filenames
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = write_logs(directory)
+        size = sum(filename.stat().st_size for filename in filenames)
+        print(f"{FILES} files, {CYCLES} cycles each, {size / 2 ** 20:.0f} MiB")
+        cases = (("np.loadtxt", lambda: [np.loadtxt(filename) for filename in filenames]),
+                 ("parse_text_log", lambda: [log_loader.parse_text_log(filename) for filename in filenames]),
+                 ("load_logs, parallel", lambda: log_loader.load_logs(filenames)),
+                 ("load_logs, cached", lambda: log_loader.load_logs(filenames)))
+        print(f"{'loader':>20} {'time, s':>8} {'MiB/s':>7}")
+        for name, function in cases:
+            elapsed, result = timed(function)
+            print(f"{name:>20} {elapsed:>8.3f} {size / 2 ** 20 / elapsed:>7.0f}")
+
+        records = np.concatenate(result)
+        index_time, index = timed(lambda: log_loader.LogIndex(records))
+        repeats = 1000
+        mask_time, _ = timed(lambda: [records[records["state"] == 6] for _ in range(repeats)])
+        slice_time, _ = timed(lambda: [index.cycles_at(6) for _ in range(repeats)])
+        print(f"index build {index_time * 1e3:.1f} ms, state 6 of {len(records)} cycles: "
+              f"mask {mask_time / repeats * 1e6:.0f} us, index {slice_time / repeats * 1e6:.1f} us")
+
+
+if __name__ == '__main__':
+    main()
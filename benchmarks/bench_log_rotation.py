@@ -0,0 +1,65 @@
+"""Rotated session logs: write stalls while closed segments are compressed, compression ratio
+and read-back speed of the whole session through the manifest.
+
+Run from repository root: python benchmarks/bench_log_rotation.py
+"""
+import sys
+import time
+import pathlib
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import DOTS_NUMBER
+from logger import DataLogger, BinaryDataLogger
+from log_rotation import RotatingDataLogger, read_session
+from metrics import Histogram
+
+CYCLES = 3000
+BATCH = 10
+MAX_BYTES = 4 * 1024 * 1024
+
+
+def write_session(directory, data_logger_class, compression):
+    rng = np.random.default_rng(1)
+    temperatures = np.linspace(20, 500, DOTS_NUMBER, dtype=np.float32)
+    data_logger = RotatingDataLogger(directory, data_logger_class, max_bytes=MAX_BYTES, compression=compression)
+    writes = Histogram()
+    for i in range(0, CYCLES, BATCH):
+        # sensor like data: smooth curve with noise
+        records = [data_logger.format_record(1.6e9 + i + j,
+                                             (1e6 * np.exp(-temperatures / 120) *
+                                              rng.normal(1, 0.01, DOTS_NUMBER)).astype(np.float32),
+                                             rng.uniform(0, 20), 2 * (i // 500 % 4), temperatures, 25.0, 1.01,
+                                             -0.5, "-3")
+                   for j in range(BATCH)]
+        started = time.perf_counter()
+        data_logger.write_records(records)
+        writes.observe(time.perf_counter() - started)
+    data_logger.close(wait=True)
+    return data_logger, writes
+
+
+def main():
+    print(f"{CYCLES} cycles in {MAX_BYTES // 2 ** 20} MiB segments, written {BATCH} per write_records")
+    print(f"{'format':>7} {'compression':>12} {'segments':>9} {'ratio':>6} {'write max, ms':>14} "
+          f"{'read, MiB/s':>12}")
+    for data_logger_class in (DataLogger, BinaryDataLogger):
+        for compression in (None, "zlib", "lzma"):
+            with tempfile.TemporaryDirectory() as directory:
+                data_logger, writes = write_session(directory, data_logger_class, compression)
+                size = sum(segment["size"] for segment in data_logger.segments)
+                stored = sum(segment["stored_size"] or segment["size"] for segment in data_logger.segments)
+                started = time.perf_counter()
+                records = read_session(data_logger.manifest)
+                elapsed = time.perf_counter() - started
+                assert len(records) == CYCLES
+            name = "text" if data_logger_class is DataLogger else "binary"
+            print(f"{name:>7} {compression or '-':>12} {len(data_logger.segments):>9} {size / stored:>6.2f} "
+                  f"{writes.max * 1e3:>14.1f} {size / 2 ** 20 / elapsed:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
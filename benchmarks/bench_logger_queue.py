@@ -0,0 +1,88 @@
+"""Acquisition rate and save_data stalls with synchronous DataLogger against QueuedDataLogger.
+
+Cycles are polled like in poll_device from a simulated device running cycles back to back,
+the disk is slowed down by DISK_DELAY per write like a busy network share.
+Linux only. Run from repository root: python benchmarks/bench_logger_queue.py
+"""
+import sys
+import time
+import pathlib
+import tempfile
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import MSDesktopDevice, CRCCalculator
+from device_service import poll_device
+from logger import DataLogger, BinaryDataLogger, QueuedDataLogger
+from metrics import Histogram
+import simulator
+
+DURATION = 3.0
+DISK_DELAYS = (0.0, 0.005, 0.02)
+FIRMWARE = {"autorun": True, "idle": 0.001, "exhale": 0.001, "measuring": 0.001, "purging": 0.001}
+
+
+class SlowDisk():
+    def __init__(self, data_logger, delay):
+        self.data_logger = data_logger
+        self.delay = delay
+        self.file = data_logger.file
+
+    def format_record(self, *args):
+        return self.data_logger.format_record(*args)
+
+    def write_records(self, records, fsync=False):
+        time.sleep(self.delay)
+        self.data_logger.write_records(records, fsync)
+
+    def save_data(self, *args):
+        time.sleep(self.delay)
+        self.data_logger.save_data(*args)
+
+    def close(self):
+        self.data_logger.close()
+
+
+def acquire(device, data_logger):
+    saves = Histogram()
+    cycles = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < DURATION:
+        state, t_ambient, cycle = poll_device(device)
+        if cycle is not None:
+            save_started = time.perf_counter()
+            data_logger.save_data(cycle.resistances, cycle.h2conc, state, cycle.temperatures, t_ambient,
+                                  cycle.heater_cal_transform.k, cycle.heater_cal_transform.b, "-3")
+            saves.observe(time.perf_counter() - save_started)
+            cycles += 1
+    rate = cycles / (time.perf_counter() - started)
+    data_logger.close()
+    return rate, saves
+
+
+def main():
+    process, (name,) = simulator.spawn(1, firmware_options=FIRMWARE, latency=0.0001)
+    try:
+        device = MSDesktopDevice(name, CRCCalculator())
+        print(f"{'format':>7} {'disk, ms':>9} {'logger':>7} {'cycles/s':>9} {'save p99, ms':>13} "
+              f"{'written p99, ms':>16} {'dropped':>8}")
+        for data_logger_class in (DataLogger, BinaryDataLogger):
+            for delay in DISK_DELAYS:
+                for queued in (False, True):
+                    with tempfile.TemporaryDirectory() as directory:
+                        data_logger = SlowDisk(data_logger_class(directory), delay)
+                        if queued:
+                            data_logger = QueuedDataLogger(data_logger, max_queue=1000)
+                        rate, saves = acquire(device, data_logger)
+                    written = f"{data_logger.latency.quantile(0.99) * 1e3:.1f}" if queued else "-"
+                    dropped = data_logger.counters["dropped"] if queued else 0
+                    print(f"{data_logger_class.__name__[:-10] or 'Text':>7} {delay * 1e3:>9.0f} "
+                          f"{'queued' if queued else 'sync':>7} {rate:>9.0f} {saves.quantile(0.99) * 1e3:>13.2f} "
+                          f"{written:>16} {dropped:>8}")
+        device.ser.close()
+    finally:
+        process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Firmware upload time with the old fixed 0.5 s readiness sleep against adaptive OTA_GET_READY polling.
+
+The simulated firmware answers BUSY to OTA_GET_READY until FLASH_TIME after every chunk.
+Run from repository root: python benchmarks/bench_ota.py
+"""
+import os
+import sys
+import time
+import pathlib
+import tempfile
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import MSDesktopDevice, CRCCalculator
+from fake_device import FakeSerial
+import upload
+
+IMAGE_SIZE = 32 << 10
+FLASH_TIME = 0.03
+BAUDRATES = (None, 921600, 115200)
+
+
+def upload_time(filename, baudrate, poll_interval):
+    device = MSDesktopDevice(FakeSerial(baudrate=baudrate, firmware_options={"ota_flash_time": FLASH_TIME}),
+                             CRCCalculator())
+    started = time.perf_counter()
+    upload.upload_firmware_file(device, filename, print=lambda *_: None, poll_interval=poll_interval)
+    return time.perf_counter() - started
+
+
+def main():
+    print(f"image {IMAGE_SIZE >> 10} KiB, flash {FLASH_TIME * 1e3:.0f} ms/chunk")
+    print(f"{'baudrate':>9} {'fixed 0.5 s, s':>15} {'adaptive, s':>12} {'speedup':>8} {'adaptive, KiB/s':>16}")
+    with tempfile.NamedTemporaryFile() as fd:
+        fd.write(os.urandom(IMAGE_SIZE))
+        fd.flush()
+        for baudrate in BAUDRATES:
+            fixed = upload_time(fd.name, baudrate, 0.5)
+            adaptive = upload_time(fd.name, baudrate, None)
+            print(f"{baudrate or 'USB':>9} {fixed:>15.2f} {adaptive:>12.2f} {fixed / adaptive:>7.1f}x "
+                  f"{IMAGE_SIZE / adaptive / 1024:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
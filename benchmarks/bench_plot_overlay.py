@@ -0,0 +1,68 @@
+"""Time to show a new cycle: PlotWidget.plot_answer with persistent curves and an overlay of
+the last N cycles, against recreating the plot items on every cycle.
+
+Time includes the repaint. Runs headless:
+QT_QPA_PLATFORM=offscreen python benchmarks/bench_plot_overlay.py
+"""
+import os
+import sys
+import time
+import pathlib
+
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from PySide2 import QtWidgets
+
+from device import DOTS_NUMBER
+from plot_widget import PlotWidget
+
+CYCLES = 200
+OVERLAYS = (0, 10, 50, 100)
+
+
+def recreate(widget, times, resistances):
+    """plot_answer before persistent curves"""
+    widget.getPlotItem().clear()
+    widget.legenditem.setVisible(False)
+    widget.getPlotItem().setLogMode(y=True)
+    widget.getPlotItem().setLabel("left", "Resistance", units="Ω")
+    widget.getPlotItem().setLabel("bottom", "Time", units="ds")
+    widget.plot(x=times, y=resistances)
+
+
+def run(app, plot, overlay=0):
+    widget = PlotWidget()
+    widget.resize(800, 600)
+    widget.show()
+    widget.set_overlay(overlay)
+    rng = np.random.default_rng(1)
+    times = np.arange(1, DOTS_NUMBER)
+    curve = np.logspace(6, 4, DOTS_NUMBER - 1)
+    elapsed = []
+    for i in range(CYCLES):
+        resistances = curve * (1 + 0.001 * i) * rng.normal(1, 0.01, DOTS_NUMBER - 1)
+        started = time.perf_counter()
+        plot(widget, times, resistances)
+        widget.repaint()
+        app.processEvents()
+        elapsed.append(time.perf_counter() - started)
+    widget.close()
+    # the first cycles fill the overlay
+    elapsed = np.array(elapsed[CYCLES // 2:])
+    return np.median(elapsed), np.percentile(elapsed, 99)
+
+
+def main():
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    print(f"{'plot':>10} {'overlay':>8} {'median, ms':>11} {'p99, ms':>8}")
+    cases = [("recreate", recreate, 0)] + [("setData", PlotWidget.plot_answer, overlay) for overlay in OVERLAYS]
+    for name, plot, overlay in cases:
+        median, p99 = run(app, plot, overlay)
+        print(f"{name:>10} {overlay:>8} {median * 1e3:>11.2f} {p99 * 1e3:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
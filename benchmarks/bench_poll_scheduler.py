@@ -0,0 +1,63 @@
+"""Polls per measurement cycle and state change detection latency, fixed 1 s polling against PollScheduler.
+
+Runs on a virtual clock: the device goes through IDLE, EXHALE, MEASURING and PURGING with
+jittered durations, every poll takes POLL_TIME.
+Run from repository root: python benchmarks/bench_poll_scheduler.py
+"""
+import sys
+import random
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import DEVICE_STATE
+from poll_scheduler import PollScheduler
+
+DURATIONS = {DEVICE_STATE.IDLE: 5.0, DEVICE_STATE.EXHALE: 10.0, DEVICE_STATE.MEASURING: 20.0,
+             DEVICE_STATE.PURGING: 40.0}
+JITTER = 0.05
+CYCLES = 50
+POLL_TIME = 0.05
+
+
+def timeline(seed=1):
+    """(start, state) of every state of CYCLES cycles"""
+    rng = random.Random(seed)
+    now, states = 0.0, []
+    for _ in range(CYCLES):
+        for state, duration in DURATIONS.items():
+            states.append((now, state))
+            now += duration * (1 + rng.uniform(-JITTER, JITTER))
+    return states, now
+
+
+def run(next_delay):
+    states, end = timeline()
+    now, index, polls, latencies, seen = 0.0, 0, 0, [], None
+    while now < end:
+        while index + 1 < len(states) and states[index + 1][0] <= now:
+            index += 1
+        started, state = states[index]
+        polls += 1
+        now += POLL_TIME
+        if state != seen:
+            if seen is not None:
+                latencies.append(now - started)
+            seen = state
+        now += next_delay(state, now)
+    return polls / CYCLES, sum(latencies) / len(latencies), max(latencies)
+
+
+def main():
+    scheduler = PollScheduler(clock=lambda: 0)
+    scheduler.expect(DEVICE_STATE.IDLE, DURATIONS[DEVICE_STATE.IDLE])
+    scheduler.expect(DEVICE_STATE.EXHALE, DURATIONS[DEVICE_STATE.EXHALE])
+    print(f"{'polling':>10} {'polls/cycle':>12} {'mean latency, s':>16} {'max latency, s':>15}")
+    for name, next_delay in (("fixed 1 s", lambda state, now: 1.0),
+                             ("scheduler", lambda state, now: scheduler.update(state, now))):
+        polls, mean_latency, max_latency = run(next_delay)
+        print(f"{name:>10} {polls:>12.1f} {mean_latency:>16.3f} {max_latency:>15.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Lost cycles and goodput on a noisy link, without and with resending of GET class commands.
+
+Cycles are fetched like in poll_device from a simulated device that flips bits in its answers
+and loses some of them. Linux only. Run from repository root: python benchmarks/bench_reliability.py
+"""
+import sys
+import time
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import MSDesktopDevice, CRCCalculator, DeviceAnswerError
+import framing
+import simulator
+
+CYCLES = 300
+TIMEOUT = 0.1
+LINKS = ((1e-5, 0.002), (1e-4, 0.01), (3e-4, 0.02))
+
+
+def fetch_cycles(name, retry_budget):
+    device = MSDesktopDevice(name, CRCCalculator(), retry_budget=retry_budget)
+    device.ser.timeout = TIMEOUT
+    lost = 0
+    started = time.perf_counter()
+    for _ in range(CYCLES):
+        try:
+            device.batch("get_cycle", "get_result", "get_heater_cal_transform", print=lambda *_: None)
+        except (DeviceAnswerError, framing.FrameTimeoutError):
+            lost += 1
+            device._drain()
+    elapsed = time.perf_counter() - started
+    device.ser.close()
+    return lost, device.metrics.counters["payload_in"] / elapsed, device.metrics.counters["retries"]
+
+
+def main():
+    print(f"{CYCLES} cycles, {TIMEOUT} s answer timeout")
+    print(f"{'bit flip':>9} {'drop':>6} {'lost, no resend':>16} {'lost, resend':>13} "
+          f"{'goodput, KiB/s':>15} {'resend goodput':>15} {'retries':>8}")
+    for corrupt, drop in LINKS:
+        results = []
+        for retry_budget in (0, 2.0):
+            process, (name,) = simulator.spawn(1, baudrate=921600, corrupt=corrupt, drop=drop, seed=1)
+            try:
+                results.append(fetch_cycles(name, retry_budget))
+            finally:
+                process.terminate()
+        (lost, goodput, _), (lost_resend, goodput_resend, retries) = results
+        print(f"{corrupt:>9.0e} {drop:>6.3f} {lost / CYCLES:>16.1%} {lost_resend / CYCLES:>13.1%} "
+              f"{goodput / 1024:>15.1f} {goodput_resend / 1024:>15.1f} {retries:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Concentration trend with millions of points: adding a point to MinMaxPyramid and redrawing
+TrendWidget for the whole session and for a zoomed range, against drawing all points.
+
+Times include the repaint. Runs headless:
+QT_QPA_PLATFORM=offscreen python benchmarks/bench_trend.py
+"""
+import os
+import sys
+import time
+import pathlib
+
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from PySide2 import QtWidgets
+
+from trend_widget import TrendWidget, MinMaxPyramid
+
+POINTS = (100000, 1000000, 5000000)
+SAMPLES = 10
+APPENDS = 10000
+
+
+def measure(app, widget, action):
+    elapsed = []
+    for _ in range(SAMPLES):
+        started = time.perf_counter()
+        action()
+        widget.repaint()
+        app.processEvents()
+        elapsed.append(time.perf_counter() - started)
+    return np.median(elapsed)
+
+
+def main():
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    rng = np.random.default_rng(1)
+    print(f"{'points':>8} {'append, us':>11} {'all points, ms':>15} {'pyramid, ms':>12} {'zoomed, ms':>11}")
+    for points in POINTS:
+        times = 1.6e9 + np.arange(points, dtype=float)
+        values = 10 + np.cumsum(rng.normal(0, 0.01, points))
+
+        widget = TrendWidget()
+        widget.resize(1000, 600)
+        widget.show()
+        curve = widget.curves["h2conc"]
+        full = measure(app, widget, lambda: curve.setData(times, values))
+
+        pyramid = MinMaxPyramid()
+        pyramid.extend(times[:-APPENDS], values[:-APPENDS])
+        started = time.perf_counter()
+        for i in range(points - APPENDS, points):
+            pyramid.extend(times[i], values[i])
+        # includes growing the buffers
+        append = (time.perf_counter() - started) / APPENDS
+        widget.series["h2conc"] = pyramid
+        decimated = measure(app, widget, widget.update_curves)
+        widget.concentration_plot.setXRange(times[points // 2], times[points // 2 + points // 100], padding=0)
+        zoomed = measure(app, widget, widget.update_curves)
+        widget.close()
+        print(f"{points:>8} {append * 1e6:>11.0f} {full * 1e3:>15.1f} {decimated * 1e3:>12.1f} {zoomed * 1e3:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Model upload of growing images against a fake port: peak Python memory and host overhead per chunk,
+reading the whole file and sending chunk by chunk against mmap streaming with chunks prepared in advance.
+
+Link latency per chunk is simulated, so background preparation has something to overlap with.
+Run from repository root: python benchmarks/bench_upload.py
+"""
+import os
+import sys
+import time
+import pathlib
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import MSDesktopDevice, CRCCalculator, COMMAND_NUM, MODEL_CHUNK_SIZE
+from fake_device import FakeSerial
+import upload
+
+SIZES = (64 << 10, 1 << 20, 8 << 20)
+TURNAROUND = 0.001
+
+
+def legacy_upload(device, filename):
+    """Upload as it was done before: whole file in memory, every chunk encoded right before its write"""
+    with open(filename, "rb") as fd:
+        values = fd.read()
+    device.post_model_update_init(1, len(values), device.crc.calc(values), print=lambda *_: None)
+    host = 0
+    with open(filename, "rb") as fd:
+        red = fd.read(MODEL_CHUNK_SIZE)
+        while len(red) != 0:
+            started = time.perf_counter()
+            command = device._send_command(COMMAND_NUM.CMD_MODEL_CHUNK.value, red)
+            host += time.perf_counter() - started
+            device.ser.write(command)
+            device._get_answer(COMMAND_NUM.CMD_MODEL_CHUNK.value)
+            red = fd.read(MODEL_CHUNK_SIZE)
+    return host / -(-len(values) // MODEL_CHUNK_SIZE)
+
+
+def streamed_upload(device, filename):
+    with upload.ImageFile(filename, MODEL_CHUNK_SIZE) as image:
+        device.post_model_update_init(1, len(image), image.crc(device.crc), print=lambda *_: None)
+        stats = upload.UploadStats()
+        for _ in upload.stream_chunks(device, "post_model_chunk_send", image, stats):
+            pass
+    return sum(stats.host) / stats.chunks
+
+
+def measure(func, filename):
+    device = MSDesktopDevice(FakeSerial(turnaround=TURNAROUND, processing=0, baudrate=None), CRCCalculator())
+    tracemalloc.start()
+    host = func(device, filename)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, host
+
+
+def main():
+    print(f"{'image, KiB':>11} {'legacy peak, KiB':>17} {'stream peak, KiB':>17} "
+          f"{'legacy host, us':>16} {'stream host, us':>16}")
+    for size in SIZES:
+        with tempfile.NamedTemporaryFile() as fd:
+            fd.write(os.urandom(size))
+            fd.flush()
+            legacy_peak, legacy_host = measure(legacy_upload, fd.name)
+            stream_peak, stream_host = measure(streamed_upload, fd.name)
+        print(f"{size >> 10:>11} {legacy_peak >> 10:>17} {stream_peak >> 10:>17} "
+              f"{legacy_host * 1e6:>16.1f} {stream_host * 1e6:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
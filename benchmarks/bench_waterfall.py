@@ -0,0 +1,69 @@
+"""Time to add a cycle to the session waterfall and to repaint it on zoom, WaterfallWidget
+against setting the whole float image with levels on every cycle.
+
+Times include the repaint. Runs headless:
+QT_QPA_PLATFORM=offscreen python benchmarks/bench_waterfall.py
+"""
+import os
+import sys
+import time
+import pathlib
+
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from PySide2 import QtWidgets
+
+from device import DOTS_NUMBER
+from waterfall_widget import WaterfallWidget
+
+ROWS = (1000, 10000, 50000)
+SAMPLES = 20
+
+
+class RebuildWaterfall(WaterfallWidget):
+    """Whole log image converted with levels on every cycle"""
+    def add_cycle(self, times, resistances):
+        row = np.log10(np.asarray(resistances, dtype=np.float32))[np.newaxis]
+        self._log_resistances = row if self._log_resistances is None else \
+            np.concatenate((self._log_resistances, row))
+        self.rows = len(self._log_resistances)
+        self.image_item.setImage(self._log_resistances, levels=(3.5, 6.5))
+
+
+def measure(app, widget, action):
+    elapsed = []
+    for _ in range(SAMPLES):
+        started = time.perf_counter()
+        action()
+        widget.repaint()
+        app.processEvents()
+        elapsed.append(time.perf_counter() - started)
+    return np.median(elapsed)
+
+
+def main():
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    times = np.arange(1, DOTS_NUMBER)
+    curve = np.logspace(6, 4, DOTS_NUMBER - 1)
+    rng = np.random.default_rng(1)
+    print(f"{'widget':>10} {'rows':>6} {'add, ms':>8} {'zoom, ms':>9}")
+    for widget_class in (RebuildWaterfall, WaterfallWidget):
+        widget = widget_class()
+        widget.resize(800, 600)
+        widget.show()
+        for rows in ROWS:
+            while widget.rows < rows - SAMPLES:
+                widget.add_cycle(times, curve * (1 + 1e-5 * widget.rows))
+            add = measure(app, widget, lambda: widget.add_cycle(times, curve * rng.normal(1, 0.01, len(curve))))
+            view_box = widget.getPlotItem().getViewBox()
+            zoom = measure(app, widget, lambda: view_box.scaleBy((0.99, 0.99)))
+            name = "rebuild" if widget_class is RebuildWaterfall else "waterfall"
+            print(f"{name:>10} {widget.rows:>6} {add * 1e3:>8.2f} {zoom * 1e3:>9.2f}")
+        widget.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""In-process stand-in for the device serial port, used by the benchmarks.
+
+Commands are answered by simulator.SimulatedFirmware, with some answers replaced by
+fixed replies, so a poll finds a cycle every time. Answers are delayed like by a real
+link: link turnaround, per-command processing and transfer time at the given baud rate.
+"""
+import sys
+import time
+import struct
+import pathlib
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import framing
+from device import COMMAND_NUM, DOTS_NUMBER
+from simulator import SimulatedFirmware
+
+
+def default_replies():
+    cycle = np.empty((DOTS_NUMBER, 2), dtype="<f4")
+    cycle[:, 0] = np.logspace(4, 6, DOTS_NUMBER)
+    cycle[:, 1] = np.linspace(100, 500, DOTS_NUMBER)
+    return {
+        COMMAND_NUM.GET_STATE.value: b"\x03",
+        COMMAND_NUM.CMD_GET_AMBIENT_TEMP.value: struct.pack("<f", 296.5),
+        COMMAND_NUM.HAVE_DATA.value: b"\x00",
+        COMMAND_NUM.GET_HAVE_RESULT.value: b"\x00",
+        COMMAND_NUM.GET.value: cycle.tobytes(),
+        COMMAND_NUM.GET_RESULT.value: struct.pack("<f", 12.5),
+        COMMAND_NUM.CMD_GET_HEATER_CAL_TRANSFORM.value: struct.pack("<ff", 1.01, -0.02),
+    }
+
+
+def replying_firmware(replies=None, **firmware_options) -> SimulatedFirmware:
+    """SimulatedFirmware answering commands of replies with fixed payloads"""
+    firmware = SimulatedFirmware(**firmware_options)
+    for command, reply in (default_replies() if replies is None else replies).items():
+        firmware.handlers[COMMAND_NUM(command)] = lambda payload, reply=reply: reply
+    return firmware
+
+
+class FakeSerial():
+    def __init__(self, replies=None, turnaround=0.002, processing=0.0005, baudrate=115200, firmware_options=None):
+        self.firmware = replying_firmware(replies, **(firmware_options or {}))
+        self.reader = framing.FrameReader()
+        self.turnaround = turnaround
+        self.processing = processing
+        self.baudrate = baudrate
+        self.timeout = 1
+        self._pending = []
+        self._out = bytearray()
+        self._ready_at = 0
+
+    def _transfer_time(self, size):
+        return size * 10 / self.baudrate if self.baudrate else 0
+
+    def write(self, data):
+        now = time.perf_counter()
+        arrive = now + self._transfer_time(len(data)) + self.turnaround
+        self.reader.feed(data)
+        for frame in self.reader.frames():
+            body = self.firmware.answer(frame)
+            if body is None:
+                continue
+            encoded = framing.encode_frame(body)
+            self._ready_at = max(arrive, self._ready_at) + self.processing + self._transfer_time(len(encoded))
+            self._pending.append((self._ready_at, encoded))
+        return len(data)
+
+    def _collect(self):
+        now = time.perf_counter()
+        while self._pending and self._pending[0][0] <= now:
+            self._out.extend(self._pending.pop(0)[1])
+
+    @property
+    def in_waiting(self):
+        self._collect()
+        return len(self._out)
+
+    def read(self, size=1):
+        self._collect()
+        if not self._out and self._pending:
+            wait = self._pending[0][0] - time.perf_counter()
+            if wait <= self.timeout:
+                time.sleep(max(wait, 0))
+                self._collect()
+        red = bytes(self._out[:size])
+        del self._out[:size]
+        return red
+
+    def reset_input_buffer(self):
+        self._pending.clear()
+        self._out.clear()
+
+    def close(self):
+        pass
@@ -0,0 +1,236 @@
+"""Benchmark suite of the protocol and acquisition hot paths, in isolation and end to end.
+
+Every case is timed in small batches until MIN_TIME passes, latency percentiles are
+per call. Runs headless, Qt uses the offscreen platform.
+
+Run from repository root:
+    python benchmarks/suite.py                                  print the table
+    python benchmarks/suite.py -k crc -k escape                 only cases with these substrings
+    python benchmarks/suite.py --output results.json            save results
+    python benchmarks/suite.py --save-baseline benchmarks/baseline.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json --threshold 0.3
+The last one exits with code 1 when p50 of any case is more than threshold slower than the baseline.
+"""
+import os
+import sys
+import json
+import time
+import pathlib
+import argparse
+import platform
+import tempfile
+import contextlib
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from device import MSDesktopDevice, CRCCalculator, COMMAND_NUM, DOTS_NUMBER, escape_data, _parse_cycle
+from device_service import poll_device
+from logger import DataLogger
+import framing
+from fake_device import FakeSerial, default_replies
+
+MIN_TIME = 0.5
+BATCH_TIME = 0.002
+PERCENTILES = (50, 90, 99)
+# simulated device running cycles of 4 ms on its own, polls find a new cycle often
+BUSY_FIRMWARE = {"autorun": True, "idle": 0.001, "exhale": 0.001, "measuring": 0.001, "purging": 0.001}
+
+CASES = {}
+
+
+def case(name):
+    """Registers a context manager yielding the function to time"""
+    def register(func):
+        CASES[name] = contextlib.contextmanager(func)
+        return func
+
+    return register
+
+
+def cycle_payload():
+    return default_replies()[COMMAND_NUM.GET.value]
+
+
+class ReplaySerial():
+    """Port that returns the same answer frame on every read"""
+    def __init__(self, frame):
+        self.frame = bytes(frame)
+        self.in_waiting = len(self.frame)
+
+    def read(self, size=1):
+        return self.frame[:size]
+
+
+@case("escape_data")
+def escape_case():
+    payload = cycle_payload()
+    yield lambda: escape_data(payload)
+
+
+@case("crc")
+def crc_case():
+    crc = CRCCalculator()
+    payload = cycle_payload()
+    yield lambda: crc(payload)
+
+
+@case("send_command")
+def send_command_case():
+    device = MSDesktopDevice(None, CRCCalculator())
+    payload = np.full(DOTS_NUMBER, 300, dtype="<f4").tobytes()
+    yield lambda: device._send_command(COMMAND_NUM.SET_CYCLE.value, payload)
+
+
+@case("get_answer")
+def get_answer_case():
+    crc = CRCCalculator()
+    body = bytearray((COMMAND_NUM.GET.value,))
+    body.extend(cycle_payload())
+    body.append(0)
+    body.extend(crc(body))
+    device = MSDesktopDevice(ReplaySerial(framing.encode_frame(body)), crc)
+    yield lambda: device._get_answer(COMMAND_NUM.GET.value)
+
+
+@case("get_cycle_decode")
+def get_cycle_decode_case():
+    payload = bytearray(cycle_payload())
+    yield lambda: _parse_cycle(payload)
+
+
+@case("save_data")
+def save_data_case():
+    with tempfile.TemporaryDirectory() as path:
+        data_logger = DataLogger(path)
+        resistances = np.logspace(4, 6, DOTS_NUMBER)
+        temperatures = np.linspace(100, 500, DOTS_NUMBER)
+        yield lambda: data_logger.save_data(resistances, 12.5, 2, temperatures, 296.5, 1.01, -0.02, "10")
+
+
+@case("plot_answer")
+def plot_answer_case():
+    from PySide2 import QtWidgets
+    from plot_widget import PlotWidget
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    widget = PlotWidget()
+    widget.resize(800, 600)
+    widget.show()
+    times = np.arange(1, DOTS_NUMBER)
+    resistances = np.logspace(4, 6, DOTS_NUMBER - 1)
+
+    def plot():
+        widget.plot_answer(times, resistances)
+        app.processEvents()
+
+    yield plot
+    widget.close()
+
+
+@case("poll_tick")
+def poll_tick_case():
+    device = MSDesktopDevice(FakeSerial(turnaround=0, processing=0, baudrate=None), CRCCalculator())
+    yield lambda: poll_device(device)
+
+
+@case("poll_tick_pty")
+def poll_tick_pty_case():
+    import simulator
+
+    process, (name,) = simulator.spawn(1, firmware_options=BUSY_FIRMWARE, latency=0)
+    device = MSDesktopDevice(name, CRCCalculator())
+    try:
+        yield lambda: poll_device(device)
+    finally:
+        device.ser.close()
+        process.terminate()
+
+
+def measure(func, min_time=MIN_TIME):
+    func()
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        batch = time.perf_counter() - started
+        if batch >= BATCH_TIME:
+            break
+        number *= 2
+    samples = [batch / number]
+    deadline = time.perf_counter() + min_time
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number)
+    samples = np.array(samples)
+    result = {f"p{percentile}_us": float(np.percentile(samples, percentile) * 1e6) for percentile in PERCENTILES}
+    result["mean_us"] = float(samples.mean() * 1e6)
+    result["ops_per_s"] = float(1 / samples.mean())
+    result["calls"] = int(len(samples) * number)
+    return result
+
+
+def run(names, min_time=MIN_TIME):
+    results = {}
+    for name in names:
+        try:
+            with CASES[name]() as func:
+                results[name] = measure(func, min_time)
+        except OSError as e:
+            print(f"{name}: skipped, {e!r}", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns names of cases whose p50 regressed more than threshold"""
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result["p50_us"] > baseline[name]["p50_us"] * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Protocol and acquisition benchmarks")
+    parser.add_argument("-k", action="append", default=[], help="Run only cases containing this substring")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="Time per case, s")
+    parser.add_argument("--output", help="Save results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed p50 slowdown against baseline")
+    parser.add_argument("--save-baseline", help="Save results as a new baseline to this JSON file")
+    args = parser.parse_args()
+
+    names = [name for name in CASES if not args.k or any(k in name for k in args.k)]
+    results = run(names, args.min_time)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)["results"]
+
+    print(f"{'case':>17} {'ops/s':>10} {'p50, us':>9} {'p90, us':>9} {'p99, us':>9} {'baseline p50':>13}")
+    for name, result in results.items():
+        reference = f"{baseline[name]['p50_us']:.1f}" if name in baseline else "-"
+        print(f"{name:>17} {result['ops_per_s']:>10.0f} {result['p50_us']:>9.1f} {result['p90_us']:>9.1f} "
+              f"{result['p99_us']:>9.1f} {reference:>13}")
+
+    document = {"python": platform.python_version(), "machine": platform.machine(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+    for filename in (args.output, args.save_baseline):
+        if filename:
+            with open(filename, "w") as fd:
+                json.dump(document, fd, indent=2)
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"Regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
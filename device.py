@@ -1,3 +1,4 @@
+import time
 import typing
 
 import serial
@@ -11,6 +12,9 @@ import logging
 
 from collections import namedtuple
 
+import framing
+from metrics import LinkMetrics, MeteredPort
+
 logger = logging.getLogger(__name__)
 
 HeaterParamsTuple = namedtuple("HeaterParamsTuple", "tempco, rt_resistance, rt_temp, r_corr, cal_curve_ambient, gain, offset, cal_calib_interval, cal_calibration_enable")
@@ -22,18 +26,16 @@ class CRCCalculator():
     def __call__(self, data):
         return struct.pack("<I", self.calc(data))
 
+    def update(self, data, crc=0) -> int:
+        """Continues crc over data, so CRC of a stream can be computed block by block"""
+        return self.calc(data, crc)
+
 
 bytes_to_escape = tuple(b"\x7E\x81\x55")
 
 
 def escape_data(data):
-    escaped = bytearray()
-    for byte in data:
-        if byte in bytes_to_escape:
-            escaped.extend(b"\x55" + byte.to_bytes(1, "little"))
-        else:
-            escaped.append(byte)
-    return escaped
+    return framing.escape(data)
 
 DOTS_NUMBER = 301
 DOTS_IN_PASHA_CALIBRATION = 410
@@ -68,485 +70,603 @@ class COMMAND_NUM(enum.Enum):
     CMD_MODEL_CHUNK = 0xA5
     CMD_MODEL_FINALIZE = 0xA6
 
-def form_error_bytes(num):
-    return (1 << num).to_bytes(4, 'little')
+class STATUS_CODE(enum.IntEnum):
+    OK = 0
+    ERROR = 1
+    BUSY = 2
+
+
+class DEVICE_STATE(enum.IntEnum):
+    IDLE = 0
+    EXHALE = 1
+    MEASURING = 2
+    PURGING = 3
+    ERROR = 4
+
+
+class COMMAND_KIND(enum.Enum):
+    GET = "get"  # reads device, safe to repeat
+    SET = "set"  # changes stored device parameters
+    ACTION = "action"  # starts something on device
+
 
+class DeviceAnswerError(ValueError):
+    pass
 
-lock = threading.Lock()
+
+class AnswerCRCError(DeviceAnswerError):
+    pass
+
+
+def form_error_bytes(num):
+    return (1 << num).to_bytes(4, 'little')
 
 
 def locked(func):
+    """Serializes calls on one device instance, other devices are not blocked"""
     @functools.wraps(func)
-    def _wrapper(*args, **kwargs):
-        with lock:
-            return func(*args, **kwargs)
+    def _wrapper(self, *args, **kwargs):
+        with self.lock:
+            return func(self, *args, **kwargs)
 
     return _wrapper
 
 
+def _status_parser(codes, strange=None):
+    """codes: {answer byte: (message, value to return)}, value None returns the answer itself.
+    Unknown answer prints "Strange answer" and returns strange or the answer itself"""
+    codes = {bytes((code,)): item for code, item in codes.items()}
+
+    def parse(answer, print=logger.info):
+        message, value = codes.get(bytes(answer), ("Strange answer", strange))
+        print(message)
+        return answer if value is None else value
+
+    return parse
+
+
+_parse_trigger = _status_parser({STATUS_CODE.OK: ("Started trigger measurement", None),
+                                 STATUS_CODE.ERROR: ("Something bad", None)})
+_parse_set = _status_parser({STATUS_CODE.OK: ("Status OK", None),
+                             STATUS_CODE.ERROR: ("Status ERROR", None)})
+_parse_have_data = _status_parser({STATUS_CODE.OK: ("Data Have I", None),
+                                   STATUS_CODE.ERROR: ("There is no data", None)})
+_parse_have_result = _status_parser({STATUS_CODE.OK: ("Result Have I", None),
+                                     STATUS_CODE.ERROR: ("The is no new result", None)})
+_parse_state = _status_parser({state: (state.name, int(state)) for state in DEVICE_STATE})
+_parse_ota = _status_parser({STATUS_CODE.OK: ("OK", int(STATUS_CODE.OK)),
+                             STATUS_CODE.ERROR: ("ERROR", int(STATUS_CODE.ERROR))})
+_parse_ota_ready = _status_parser({STATUS_CODE.OK: ("OK", int(STATUS_CODE.OK)),
+                                   STATUS_CODE.BUSY: ("BUSY", int(STATUS_CODE.BUSY))})
+_parse_model = _status_parser({STATUS_CODE.OK: ("OK", int(STATUS_CODE.OK)),
+                               STATUS_CODE.ERROR: ("ERROR", int(STATUS_CODE.ERROR))},
+                              strange=int(STATUS_CODE.BUSY))
+
+_STATUS_MESSAGES = {form_error_bytes(bit): message for bit, message in enumerate(
+    ("Heater error", "Measurement system error", "Software init", "Unknown command",
+     "Missed packet", "UART parser error", "Incorrect command format"))}
+_STATUS_MESSAGES[bytes(4)] = "Status OK"
+
+
+def _parse_status(answer, print=logger.info):
+    print(_STATUS_MESSAGES.get(bytes(answer), "Strange answer"))
+    return answer
+
+
+_FLOAT = struct.Struct("<f")
+_CYCLE_SETTINGS = struct.Struct("<" + "f" * DOTS_NUMBER)
+_HEATER_PARAMS = struct.Struct("<fffffffqi")
+_HEATER_CAL_TRANSFORM = struct.Struct("<ff")
+_MODEL_UPDATE_INIT = struct.Struct("<BLL")
+
+
+def _parse_ambient_temp(answer, print=logger.info):
+    try:
+        ambient_temperature, = _FLOAT.unpack(answer)
+        return ambient_temperature
+    except struct.error:
+        print(f"No ambient temperature in command {COMMAND_NUM.CMD_GET_AMBIENT_TEMP.name} answer")
+        return answer
 
-class MSDesktopDevice():
-    def __init__(self, port, crc):
-        if isinstance(port, str):
-            self.ser = serial.Serial(port=port, timeout=1)
-        else:
-            self.ser = port
+
+@functools.lru_cache(maxsize=None)
+def _index_vector(length, start=0):
+    vector = np.arange(length) + start
+    vector.flags.writeable = False
+    return vector
+
+
+def _check_answer_length(answer, length, command):
+    if len(answer) != length:
+        raise DeviceAnswerError(f"Answer to {command.name} has {len(answer)} bytes, {length} expected")
+
+
+def _parse_cycle(answer, print=logger.info):
+    """Returns float32 views on the answer buffer, times vector is shared between calls"""
+    _check_answer_length(answer, DOTS_NUMBER * 2 * 4, COMMAND_NUM.GET)
+    data = np.frombuffer(answer, dtype="<f4").reshape(-1, 2)
+    resistances, temperatures = data[:, 0], data[:, 1]
+    return _index_vector(DOTS_NUMBER), temperatures, resistances
+
+
+def _parse_result(answer, print=logger.info):
+    try:
+        return _FLOAT.unpack(answer)
+    except struct.error:
+        return answer
+
+
+def _parse_heater_calibration(answer, print=logger.info):
+    _check_answer_length(answer, DOTS_IN_PASHA_CALIBRATION * 4, COMMAND_NUM.GET_HEATER_CAL)
+    voltages = np.frombuffer(answer, dtype="<f4")
+    return voltages, _index_vector(DOTS_IN_PASHA_CALIBRATION, 40)
+
+
+def _parse_heater_params(answer, print=logger.info) -> typing.Optional[HeaterParamsTuple]:
+    try:
+        heater_params = HeaterParamsTuple._make(_HEATER_PARAMS.unpack(answer))
+        print(repr(heater_params))
+        return heater_params
+    except Exception as e:
+        print(f"No heater params in command {COMMAND_NUM.CMD_GET_HEATER_PARAMS.name} answer, {str(e)}")
+        return None
+
+
+def _parse_heater_cal_transform(answer, print=logger.info) -> HeaterCalTransformTuple:
+    try:
+        heater_cal_params = HeaterCalTransformTuple._make(_HEATER_CAL_TRANSFORM.unpack(answer))
+        print(repr(heater_cal_params))
+        return heater_cal_params
+    except Exception as e:
+        print(f"No heater cal transform in command {COMMAND_NUM.CMD_GET_HEATER_CAL_TRANSFORM.name} answer, {str(e)}")
+        return HeaterCalTransformTuple(0, 0)
+
+
+def _pack_floats(*parameters):
+    return struct.pack("<" + "f" * len(parameters), *parameters)
+
+
+OTA_CHUNK_SIZE = 2000
+READ_TIMEOUT = 1.0
+# more than two read timeouts: after a lost request the answer to the first resend is
+# taken for a late one and dropped, the second resend is answered in time
+RETRY_BUDGET = 2.5 * READ_TIMEOUT
+AMBIENT_TEMP_TTL = 5.0
+MODEL_CHUNK_SIZE = 0x1000
+
+
+def _pad_ota_chunk(chunk):
+    return bytes(chunk).ljust(OTA_CHUNK_SIZE, b"\xFF")
+
+
+PreparedCommand = namedtuple("PreparedCommand", "command, escaped_head, crc")
+
+CommandSpec = namedtuple("CommandSpec", "name, command, kind, request, parse, doc, ttl")
+CommandSpec.__new__.__defaults__ = ("", None)
+
+# One entry per device method. request: None for empty payload, precompiled struct.Struct
+# packing method arguments, or a function building payload from them. ttl: seconds the answer
+# of a GET command is served from AnswerCache, inf till the next SET, firmware or model command
+COMMANDS = (
+    CommandSpec("trigger_measurement", COMMAND_NUM.TRIGGER_MEASUREMENT, COMMAND_KIND.ACTION, _FLOAT, _parse_trigger,
+                "time_to_suck: exhale time, s"),
+    CommandSpec("get_cycle", COMMAND_NUM.GET, COMMAND_KIND.GET, None, _parse_cycle,
+                "Returns times, temperatures, resistances"),
+    CommandSpec("get_status", COMMAND_NUM.STATUS, COMMAND_KIND.GET, None, _parse_status),
+    CommandSpec("set_heater", COMMAND_NUM.SET_HEATER, COMMAND_KIND.SET, _pack_floats, _parse_set,
+                "parameters: [0] – alpha, [1] – R0, [2] - Rn"),
+    CommandSpec("set_meas", COMMAND_NUM.SET_MEAS, COMMAND_KIND.SET, _pack_floats, _parse_set,
+                "parameters: [0] – Rs1, [1] – Rs2"),
+    CommandSpec("set_cycle", COMMAND_NUM.SET_CYCLE, COMMAND_KIND.SET, lambda floats: _CYCLE_SETTINGS.pack(*floats),
+                _parse_set, f"floats: {DOTS_NUMBER} heater temperatures of the cycle"),
+    CommandSpec("get_have_data", COMMAND_NUM.HAVE_DATA, COMMAND_KIND.GET, None, _parse_have_data),
+    CommandSpec("get_have_result", COMMAND_NUM.GET_HAVE_RESULT, COMMAND_KIND.GET, None, _parse_have_result),
+    CommandSpec("get_result", COMMAND_NUM.GET_RESULT, COMMAND_KIND.GET, None, _parse_result),
+    CommandSpec("get_heater_calibration", COMMAND_NUM.GET_HEATER_CAL, COMMAND_KIND.GET, None,
+                _parse_heater_calibration, "Returns voltages, temperatures", ttl=float("inf")),
+    CommandSpec("get_state", COMMAND_NUM.GET_STATE, COMMAND_KIND.GET, None, _parse_state),
+    CommandSpec("start_ota", COMMAND_NUM.START_OTA, COMMAND_KIND.ACTION, None, _parse_ota),
+    CommandSpec("chunk_ota", COMMAND_NUM.CHUNK_OTA, COMMAND_KIND.ACTION, _pad_ota_chunk, _parse_ota,
+                "chunk: up to 2000 bytes of firmware, padded with 0xFF"),
+    CommandSpec("check_ota", COMMAND_NUM.OTA_GET_READY, COMMAND_KIND.GET, None, _parse_ota_ready),
+    CommandSpec("finalize_ota", COMMAND_NUM.CMD_OTA_FINALIZE, COMMAND_KIND.ACTION, None, _parse_ota),
+    CommandSpec("abort_ota", COMMAND_NUM.CMD_OTA_ABORT, COMMAND_KIND.ACTION, None, _parse_ota),
+    CommandSpec("get_ambient_temp", COMMAND_NUM.CMD_GET_AMBIENT_TEMP, COMMAND_KIND.GET, None, _parse_ambient_temp,
+                ttl=AMBIENT_TEMP_TTL),
+    CommandSpec("get_heater_params", COMMAND_NUM.CMD_GET_HEATER_PARAMS, COMMAND_KIND.GET, None,
+                _parse_heater_params, ttl=float("inf")),
+    CommandSpec("get_heater_cal_transform", COMMAND_NUM.CMD_GET_HEATER_CAL_TRANSFORM, COMMAND_KIND.GET, None,
+                _parse_heater_cal_transform, ttl=float("inf")),
+    CommandSpec("post_model_update_init", COMMAND_NUM.CMD_MODEL_UPDATE_INIT, COMMAND_KIND.ACTION,
+                _MODEL_UPDATE_INIT, _parse_model, "version, length, crc: model header"),
+    CommandSpec("post_model_chunk_send", COMMAND_NUM.CMD_MODEL_CHUNK, COMMAND_KIND.ACTION, bytes, _parse_model),
+    CommandSpec("post_model_finalize", COMMAND_NUM.CMD_MODEL_FINALIZE, COMMAND_KIND.ACTION, None, _parse_model),
+)
+
+COMMANDS_BY_NAME = {spec.name: spec for spec in COMMANDS}
+COMMANDS_BY_NUM = {spec.command.value: spec for spec in COMMANDS}
+
+
+def _command_name(command_num):
+    spec = COMMANDS_BY_NUM.get(command_num)
+    return spec.name if spec is not None else f"0x{command_num:02X}"
+
+
+def _command_kind(command_num):
+    spec = COMMANDS_BY_NUM.get(command_num)
+    return spec.kind if spec is not None else None
+
+
+# actions replacing firmware or model, they may change everything cached
+_FIRMWARE_COMMANDS = frozenset(command.value for command in (
+    COMMAND_NUM.START_OTA, COMMAND_NUM.CHUNK_OTA, COMMAND_NUM.CMD_OTA_FINALIZE, COMMAND_NUM.CMD_OTA_ABORT,
+    COMMAND_NUM.CMD_MODEL_UPDATE_INIT, COMMAND_NUM.CMD_MODEL_CHUNK, COMMAND_NUM.CMD_MODEL_FINALIZE))
+
+
+def _invalidates_cache(command_num):
+    """SET commands, firmware and model writes and commands unknown here,
+    other actions as trigger_measurement keep the cache"""
+    kind = _command_kind(command_num)
+    return kind is None or kind == COMMAND_KIND.SET or command_num in _FIRMWARE_COMMANDS
+
+
+class AnswerCache():
+    """Raw answers of GET commands with ttl in COMMANDS. Cleared by commands changing heater
+    settings, calibration or the firmware itself, a reconnect makes a new device with a new cache"""
+    def __init__(self, clock=time.monotonic):
+        self.ttls = {spec.command.value: spec.ttl for spec in COMMANDS if spec.ttl is not None}
+        self.clock = clock
+        self._answers = {}
+
+    def get(self, command_num) -> typing.Optional[bytearray]:
+        answer, expires = self._answers.get(command_num, (None, 0))
+        if answer is None or self.clock() >= expires:
+            return None
+        return bytearray(answer)
+
+    def put(self, command_num, answer):
+        ttl = self.ttls.get(command_num)
+        if ttl is not None:
+            self._answers[command_num] = (bytes(answer), self.clock() + ttl)
+
+    def clear(self):
+        self._answers.clear()
+
+    def invalidate_on(self, command_nums):
+        if any(map(_invalidates_cache, command_nums)):
+            self.clear()
+
+
+def encode_request(spec, *args):
+    """Payload of the request, commands without one take no arguments, so a print
+    passed by position is not swallowed"""
+    if spec.request is None:
+        if args:
+            raise TypeError(f"{spec.name}() takes no arguments besides print=, {len(args)} given")
+        return b""
+    elif isinstance(spec.request, struct.Struct):
+        return spec.request.pack(*args)
+    else:
+        return spec.request(*args)
+
+
+def _command_method(spec):
+    def method(self, *args, print=logger.info):
+        return spec.parse(self._transact(spec.command.value, encode_request(spec, *args)), print)
+
+    method.__name__ = method.__qualname__ = spec.name
+    method.__doc__ = spec.doc or None
+    return locked(method)
+
+
+def with_commands(method_factory):
+    """Class decorator, adds a method made by method_factory for every entry of COMMANDS"""
+    def decorator(cls):
+        for spec in COMMANDS:
+            if spec.name not in cls.__dict__:
+                setattr(cls, spec.name, method_factory(spec))
+        return cls
+
+    return decorator
+
+
+class DeviceProtocol():
+    """Framing, CRC and counters of the device protocol, port I/O is done by subclasses"""
+    def __init__(self, crc):
         self.crc = crc
         self.counter = 0
         self.get_counter = 0
-
-    def _send_command(self, command_num, useful):
-        buffer = bytearray()
-        buffer.append(command_num)
-        buffer.extend(useful)
-        buffer.append(self.counter)
+        # while resending: answers with counters behind it are late answers to earlier attempts
+        self.stale_before = None
+        # counter of the last intact answer, whatever it was to
+        self.last_counter = None
+        self.reader = framing.FrameReader()
+        self.lock = threading.Lock()
+        self.metrics = LinkMetrics()
+
+    def _prepare_command(self, command_num, useful) -> PreparedCommand:
+        """Escapes and checksums everything except the counter, so heavy part can be done in advance"""
+        head = bytearray((command_num,))
+        head.extend(useful)
+        return PreparedCommand(command_num, framing.escape(head), self.crc.update(head))
+
+    def _finish_command(self, prepared: PreparedCommand):
+        tail = bytearray((self.counter,))
         self.counter += 1
         if self.counter > 255:
             self.counter = 0
-        buffer.extend(self.crc(buffer))
-        buffer = escape_data(buffer)
-        buffer.append(TECH_BYTES.END_BYTE.value)
-        buffer.insert(0, TECH_BYTES.START_BYTE.value)
+        tail.extend(struct.pack("<I", self.crc.update(tail, prepared.crc)))
+        buffer = bytearray((framing.START_BYTE,))
+        buffer.extend(prepared.escaped_head)
+        buffer.extend(framing.escape(tail))
+        buffer.append(framing.END_BYTE)
         logger.debug(f"{buffer}")
         return buffer
 
-    def _get_answer(self, need_command):
-        buffer = bytearray()
-        reading = False
-        escaped = False
-        while True:
-            try:
-                red = self.ser.read(1)[0]
-            except TimeoutError:
-                raise
-            else:
-                if not escaped:
-                    if red == TECH_BYTES.START_BYTE.value:
-                        reading = True
-                        continue
-                    elif red == TECH_BYTES.END_BYTE.value:
-                        logger.debug("END BYTE encountered")
-                        reading = False
-                        break
-                    elif red == TECH_BYTES.ESCAPE_BYTE.value:
-                        escaped = True
-                        continue
-                    else:
-                        pass
-                else:
-                    escaped = False
-                if reading:
-                    buffer.append(red)
+    def _send_command(self, command_num, useful):
+        return self._finish_command(self._prepare_command(command_num, useful))
+
+    def prepare(self, name, *args) -> PreparedCommand:
+        """Request of COMMANDS entry name ready to be sent with send_prepared, does not touch the port or counter"""
+        spec = COMMANDS_BY_NAME[name]
+        return self._prepare_command(spec.command.value, encode_request(spec, *args))
+
+    def _unpack_answer(self, buffer):
+        """Raises AnswerCRCError for a damaged frame, nothing in it can be trusted"""
         logger.debug(f"{buffer}")
         body_and_counter, crc_got = buffer[:-4], buffer[-4:]
         logger.debug(f"{crc_got}")
-        if self.crc(body_and_counter) == crc_got:
+        if len(body_and_counter) >= 2 and self.crc(body_and_counter) == crc_got:
             logger.debug("CRC OK")
         else:
             logger.debug(f"My CRC {self.crc(body_and_counter)}")
             logger.debug("CRC ERROR")
-        command, *useful, counter = body_and_counter
+            self.metrics.count("crc_errors")
+            raise AnswerCRCError(f"CRC error in answer of {len(buffer)} bytes")
+        self.last_counter = body_and_counter[-1]
+        return body_and_counter[0], body_and_counter[1:-1], body_and_counter[-1]
+
+    def _stale(self, counter):
+        """Counter up to 127 behind stale_before, the rolling counter wraps at 256"""
+        if self.stale_before is None or not 0 < (self.stale_before - counter) & 0xFF < 128:
+            return False
+        logger.debug(f"Answer with counter {counter} is older than the resent request, dropped")
+        self.metrics.count("stale_answers")
+        return True
+
+    def _accept_answer(self, frame, need_command) -> typing.Optional[bytearray]:
+        """Returns None for an answer to another command, e.g. a late one to a timed out request,
+        and for a late answer to the same command sent before a resend"""
+        command, useful, counter = self._unpack_answer(frame)
+        if self._stale(counter):
+            return None
         if command != need_command:
-            logger.debug(f"Command error {command} {need_command}")
-        if counter != self.get_counter:
-            logger.debug(f"Counters are not equal: got counter = {counter}, inter counter = {self.get_counter}")
-            self.get_counter = counter + 1
-        else:
-            self.get_counter += 1
-        return bytearray(useful)
-
-    @locked
-    def trigger_measurement(self, time_to_suck, print=logger.info):
-        useful = struct.pack("<f", time_to_suck)
-        to_send = self._send_command(COMMAND_NUM.TRIGGER_MEASUREMENT.value, useful=useful)
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.TRIGGER_MEASUREMENT.value)
-        if answer == bytearray(b"\x00"):
-            print("Started trigger measurement")
-        elif answer == bytearray(b"\x01"):
-            print("Something bad")
-        else:
-            print("Strange answer")
-        return answer
+            logger.debug(f"Answer to command {command} while waiting for {need_command}, dropped")
+            self.metrics.count("dropped_frames")
+            return None
+        expected = self.get_counter if self.stale_before is None else self.stale_before
+        if counter != expected:
+            logger.debug(f"Counters are not equal: got counter = {counter}, inter counter = {expected}")
+            self.metrics.count("counter_gaps")
+        self.get_counter = (counter + 1) & 0xFF
+        self.metrics.count("payload_in", len(useful))
+        return useful
+
+    def _accept_batch_answer(self, frame, need_commands, answers, first_counter):
+        """Answer goes to the request with the same counter offset, or, if counters went out of sync,
+        to the first waiting request with the same command. Returns False if answer was dropped"""
+        command, useful, counter = self._unpack_answer(frame)
+        if self._stale(counter):
+            return False
+        self.get_counter = (counter + 1) & 0xFF
+        idx = (counter - first_counter) & 0xFF
+        if idx >= len(need_commands) or need_commands[idx] != command or answers[idx] is not None:
+            idx = next((idx for idx, need_command in enumerate(need_commands)
+                        if need_command == command and answers[idx] is None), None)
+            if idx is None:
+                logger.debug(f"Answer to command {command} with counter {counter} is not expected, dropped")
+                self.metrics.count("dropped_frames")
+                return False
+            logger.debug(f"Counters are not equal: got counter = {counter}, answer matched by command {command}")
+            self.metrics.count("counter_gaps")
+        answers[idx] = useful
+        self.metrics.count("payload_in", len(useful))
+        return True
+
+    def _batch_request(self, names):
+        specs = [COMMANDS_BY_NAME[name] for name in names]
+        to_send = bytearray()
+        for spec in specs:
+            to_send.extend(self._send_command(spec.command.value, encode_request(spec)))
+        return specs, to_send
+
+
+@with_commands(_command_method)
+class MSDesktopDevice(DeviceProtocol):
+    """retry_budget: time in s to resend GET class commands after a damaged or missing answer,
+    other commands are never resent, their errors are raised at once"""
+    def __init__(self, port, crc, retry_budget=RETRY_BUDGET):
+        super().__init__(crc)
+        if isinstance(port, str):
+            port = serial.Serial(port=port, timeout=READ_TIMEOUT)
+        self.ser = MeteredPort(port, self.metrics)
+        self.retry_budget = retry_budget
+        self.cache = AnswerCache()
 
-    @locked
-    def get_cycle(self):
-        to_send = self._send_command(COMMAND_NUM.GET.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.GET.value)
+    def _read_frame(self):
         try:
-            data = struct.unpack("<" + "f" * DOTS_NUMBER * 2 , answer)
-            data = np.array(data).reshape(-1, 2)
-            resistances, temperatures = data[:, 0], data[:, 1]
-            times = np.arange(temperatures.shape[0])
-            return times, temperatures, resistances
-        except:
-            return answer
-
-    @locked
-    def get_status(self, print=logger.info):
-        to_send = self._send_command(COMMAND_NUM.STATUS.value, b"")
+            return self.reader.read_frame(self.ser)
+        except framing.FrameTimeoutError:
+            self.metrics.count("timeouts")
+            raise
+
+    def _write(self, to_send):
+        """Returns time after the write, answer latencies are measured from it"""
+        started = time.perf_counter()
         self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.STATUS.value)
-        if answer == bytes(4):
-            print("Status OK")
-        elif answer == form_error_bytes(0):
-            print("Heater error")
-        elif answer == form_error_bytes(1):
-            print("Measurement system error")
-        elif answer == form_error_bytes(2):
-            print("Software init")
-        elif answer == form_error_bytes(3):
-            print("Unknown command")
-        elif answer == form_error_bytes(4):
-            print("Missed packet")
-        elif answer == form_error_bytes(5):
-            print("UART parser error")
-        elif answer == form_error_bytes(6):
-            print("Incorrect command format")
-        else:
-            print("Strange answer")
-        return answer
+        written = time.perf_counter()
+        return written, written - started
 
-    @locked
-    def set_heater(self, *parameters, print=logger.info):
-        """parameters: [0] – alpha, [1] – R0, [2] - Rn"""
-        useful = struct.pack("<" + "f" * len(parameters), *parameters)
-        to_send = self._send_command(COMMAND_NUM.SET_HEATER.value, useful)
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.SET_HEATER.value)
-        if answer == bytearray(b"\x00"):
-            print("Status OK")
-        elif answer == bytearray(b"\x01"):
-            print("Status ERROR")
-        else:
-            print("Strange answer")
-        return answer
+    def _observe(self, command, written, write_time):
+        first_byte = None if self.ser.first_byte is None else self.ser.first_byte - written
+        self.metrics.observe(command, write_time, first_byte, time.perf_counter() - written)
 
-    @locked
-    def set_meas(self, *parameters, print=logger.info):
-        """parameters: [0] – Rs1, [1] – Rs2"""
-        useful = struct.pack("<" + "f" * len(parameters), *parameters)
-        to_send = self._send_command(COMMAND_NUM.SET_MEAS.value, useful)
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.SET_MEAS.value)
-        if answer == bytearray(b"\x00"):
-            print("Status OK")
-        elif answer == bytearray(b"\x01"):
-            print("Status ERROR")
-        else:
-            print("Strange answer")
-        return answer
-
-    @locked
-    def set_cycle(self, floats, print=logger.info):
-        useful = struct.pack("<" + "f" * DOTS_NUMBER, *floats)
-        to_send = self._send_command(COMMAND_NUM.SET_CYCLE.value, useful)
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.SET_CYCLE.value)
-        if answer == bytearray(b"\x00"):
-            print("Status OK")
-        elif answer == bytearray(b"\x01"):
-            print("Status ERROR")
-        else:
-            print("Strange answer")
+    def _get_answer(self, need_command):
+        answer = None
+        while answer is None:
+            answer = self._accept_answer(self._read_frame(), need_command)
         return answer
 
-    @locked
-    def get_have_data(self, print=logger.info):
-        to_send = self._send_command(COMMAND_NUM.HAVE_DATA.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.HAVE_DATA.value)
-        if answer == bytearray(b"\x01"):
-            print("There is no data")
-        elif answer == bytearray(b"\x00"):
-            print("Data Have I")
-        else:
-            print("Strange answer")
+    def _get_answers(self, need_commands):
+        answers = [None] * len(need_commands)
+        first_counter = self.get_counter
+        waiting = len(need_commands)
+        while waiting:
+            if self._accept_batch_answer(self._read_frame(), need_commands, answers, first_counter):
+                waiting -= 1
+        return answers
+
+    def _drain(self):
+        """Drops received bytes and partial frame, so the next answer is looked for from a fresh START"""
+        self.reader.clear()
+        reset_input_buffer = getattr(self.ser, "reset_input_buffer", None)
+        if reset_input_buffer is not None:
+            reset_input_buffer()
+
+    def _retrying(self, command_nums, attempt):
+        """Calls attempt until it returns, resending while all commands are GET class and retry_budget lasts.
+
+        Before a resend the device may have answered the failed attempt, its answers can still
+        arrive. So answers of the resend are expected with counters after the failed attempt:
+        after the last intact answer seen, or, with none seen, after the answers it would have got.
+        Older ones are dropped as stale. A request lost on the way can't be told from a late
+        answer, so it costs one more resend and two read timeouts, RETRY_BUDGET covers them."""
+        idempotent = all(_command_kind(command_num) == COMMAND_KIND.GET for command_num in command_nums)
+        deadline = time.perf_counter() + self.retry_budget
+        try:
+            while True:
+                expected = self.get_counter if self.stale_before is None else self.stale_before
+                self.last_counter = None
+                try:
+                    return attempt()
+                except (AnswerCRCError, framing.FrameTimeoutError) as e:
+                    if not idempotent or time.perf_counter() >= deadline:
+                        raise
+                    logger.debug(f"Resending {[_command_name(command_num) for command_num in command_nums]} "
+                                 f"after {e!r}")
+                    self.metrics.count("retries")
+                    self._drain()
+                    if self.last_counter is None:
+                        self.stale_before = (expected + len(command_nums)) & 0xFF
+                    else:
+                        self.stale_before = (self.last_counter + 1) & 0xFF
+        finally:
+            self.stale_before = None
+
+    def _exchange(self, prepared: PreparedCommand):
+        written, write_time = self._write(self._finish_command(prepared))
+        answer = self._get_answer(prepared.command)
+        self._observe(_command_name(prepared.command), written, write_time)
         return answer
 
-    @locked
-    def get_have_result(self, print=logger.info):
-        to_send = self._send_command(COMMAND_NUM.GET_HAVE_RESULT.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.GET_HAVE_RESULT.value)
-        if answer == bytearray(b"\x01"):
-            print("The is no new result")
-        elif answer == bytearray(b"\x00"):
-            print("Result Have I")
-        else:
-            print("Strange answer")
+    def _cached(self, command_num):
+        answer = self.cache.get(command_num)
+        if answer is not None:
+            self.metrics.count("cache_hits")
         return answer
 
-    @locked
-    def get_result(self):
-        to_send = self._send_command(COMMAND_NUM.GET_RESULT.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.GET_RESULT.value)
-        try:
-            h2conc = struct.unpack("<f" , answer)
-            return h2conc
-        except:
-            return answer
-
-    @locked
-    def get_heater_calibration(self):
-        to_send = self._send_command(COMMAND_NUM.GET_HEATER_CAL.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.GET_HEATER_CAL.value)
-        try:
-            data = struct.unpack("<" + "f" * DOTS_IN_PASHA_CALIBRATION , answer)
-            voltages = np.array(data)
-            temperatures = np.arange(DOTS_IN_PASHA_CALIBRATION) + 40
-            return voltages, temperatures
-        except:
-            return answer
-    @locked
-    def get_state(self, print=logger.info):
-        to_send = self._send_command(COMMAND_NUM.GET_STATE.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.GET_STATE.value)
-        if answer == bytearray(b"\x00"):
-            print("IDLE")
-            return 0
-        elif answer == bytearray(b"\x01"):
-            print("EXHALE")
-            return 1
-        elif answer == bytearray(b"\x02"):
-            print("MEASURING")
-            return 2
-        elif answer == bytearray(b"\x03"):
-            print("PURGING")
-            return 3
-        elif answer == bytearray(b"\x04"):
-            print("ERROR")
-            return 4
-        else:
-            print("Strange answer")
-            return answer
-    @locked
-    def start_ota(self, print=logger.info):
-        to_send = self._send_command(COMMAND_NUM.START_OTA.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.START_OTA.value)
-        if answer == bytearray(b"\x00"):
-            print("OK")
-            return 0
-        elif answer == bytearray(b"\x01"):
-            print("ERROR")
-            return 1
-        else:
-            print("Strange answer")
-            return answer
-
-    @locked
-    def chunk_ota(self, chunk, print=logger.info):
-        if len(chunk) < 2000:
-            chunk = chunk + b"\xFF" * (2000 - len(chunk))
-        to_send = self._send_command(COMMAND_NUM.CHUNK_OTA.value, chunk)
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.CHUNK_OTA.value)
-        if answer == bytearray(b"\x00"):
-            print("OK")
-            return 0
-        elif answer == bytearray(b"\x01"):
-            print("ERROR")
-            return 1
-        else:
-            print("Strange answer")
-            return answer
-
-    @locked
-    def check_ota(self, print=logger.info):
-        to_send = self._send_command(COMMAND_NUM.OTA_GET_READY.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.OTA_GET_READY.value)
-        if answer == bytearray(b"\x00"):
-            print("OK")
-            return 0
-        elif answer == bytearray(b"\x02"):
-            print("BUSY")
-            return 2
-        else:
-            print("Strange answer")
-            return answer
-
-    @locked
-    def finalize_ota(self, print=logger.info):
-        to_send = self._send_command(COMMAND_NUM.CMD_OTA_FINALIZE.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.CMD_OTA_FINALIZE.value)
-        if answer == bytearray(b"\x00"):
-            print("OK")
-            return 0
-        elif answer == bytearray(b"\x01"):
-            print("ERROR")
-            return 1
-        else:
-            print("Strange answer")
-            return answer
-
-    @locked
-    def get_ambient_temp(self, print=logger.info):
-        # CMD_GET_AMBIENT_TEMP = 0x34
-        to_send = self._send_command(COMMAND_NUM.CMD_GET_AMBIENT_TEMP.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.CMD_GET_AMBIENT_TEMP.value)
-        try:
-            ambient_temperature, = struct.unpack("<" + "f", answer)
-            return ambient_temperature
-        except:
-            print(f"No ambient temperature in command {COMMAND_NUM.CMD_GET_AMBIENT_TEMP.name} answer")
+    def _transact(self, command_num, useful=b""):
+        answer = self._cached(command_num)
+        if answer is not None:
             return answer
+        self.cache.invalidate_on((command_num,))
+        prepared = self._prepare_command(command_num, useful)
+        answer = self._retrying((command_num,), lambda: self._exchange(prepared))
+        self.cache.put(command_num, answer)
+        return answer
 
     @locked
-    def get_heater_params(self, print=logger.info) -> typing.Optional[HeaterParamsTuple]:
-        # CMD_GET_HEATER_PARAMS = 0x35
-        to_send = self._send_command(COMMAND_NUM.CMD_GET_HEATER_PARAMS .value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.CMD_GET_HEATER_PARAMS.value)
-        try:
-            heater_params = HeaterParamsTuple._make(struct.unpack("<fffffffqi", answer))
-            print(repr(heater_params))
-            return heater_params
-        except Exception as e:
-            print(f"No heater params in command {COMMAND_NUM.CMD_GET_HEATER_PARAMS.name} answer, {str(e)}")
-            return None
-
-    @locked
-    def get_heater_cal_transform(self, print=logger.info) -> HeaterCalTransformTuple:
-        # CMD_GET_HEATER_CAL_TRANSFORM = 0x36
-        to_send = self._send_command(COMMAND_NUM.CMD_GET_HEATER_CAL_TRANSFORM.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.CMD_GET_HEATER_CAL_TRANSFORM.value)
-        try:
-            heater_cal_params = HeaterCalTransformTuple._make(struct.unpack("<" + "ff", answer))
-            print(repr(heater_cal_params))
-            return heater_cal_params
-        except Exception as e:
-            print(f"No heater cal transform in command {COMMAND_NUM.CMD_GET_HEATER_CAL_TRANSFORM.name} answer, {str(e)}")
-            return HeaterCalTransformTuple(0, 0)
-
-    @locked
-    def post_model_update_init(self, version, length, crc, print=logger.info) -> int:
-        # CMD_MODEL_UPDATE_INIT = 0xA4
-        payload = struct.pack("<BLL", version, length, crc)
-        to_send = self._send_command(COMMAND_NUM.CMD_MODEL_UPDATE_INIT.value, payload)
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.CMD_MODEL_UPDATE_INIT.value)
-        if answer == bytearray(b"\x00"):
-            print("OK")
-            return 0
-        elif answer == bytearray(b"\x01"):
-            print("ERROR")
-            return 1
-        else:
-            print("Strange answer")
-            return 2
+    def send_prepared(self, prepared: PreparedCommand, print=logger.info):
+        self.cache.invalidate_on((prepared.command,))
+        answer = self._retrying((prepared.command,), lambda: self._exchange(prepared))
+        return COMMANDS_BY_NUM[prepared.command].parse(answer, print)
 
     @locked
-    def post_model_chunk_send(self, chunk, print=logger.info) -> int:
-        # CMD_MODEL_CHUNK = 0xA5
-        to_send = self._send_command(COMMAND_NUM.CMD_MODEL_CHUNK.value, chunk)
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.CMD_MODEL_CHUNK.value)
-        if answer == bytearray(b"\x00"):
-            print("OK")
-            return 0
-        elif answer == bytearray(b"\x01"):
-            print("ERROR")
-            return 1
-        else:
-            print("Strange answer")
-            return 2
-
-    @locked
-    def post_model_finalize(self, print=logger.info) -> int:
-        # CMD_MODEL_FINALIZE = 0xA6
-        to_send = self._send_command(COMMAND_NUM.CMD_MODEL_FINALIZE.value, b"")
-        self.ser.write(to_send)
-        answer = self._get_answer(COMMAND_NUM.CMD_MODEL_FINALIZE.value)
-        if answer == bytearray(b"\x00"):
-            print("OK")
-            return 0
-        elif answer == bytearray(b"\x01"):
-            print("ERROR")
-            return 1
-        else:
-            print("Strange answer")
-            return 2
-
-
+    def batch(self, *names, print=logger.info):
+        """names: COMMANDS entries without arguments. All commands go in one write,
+        parsed answers are returned in the same order. Cached answers are not requested"""
+        specs = [COMMANDS_BY_NAME[name] for name in names]
+        answers = [self._cached(spec.command.value) for spec in specs]
+        to_fetch = [name for name, answer in zip(names, answers) if answer is None]
+
+        def attempt():
+            _, to_send = self._batch_request(to_fetch)
+            written, write_time = self._write(to_send)
+            fetched = self._get_answers([COMMANDS_BY_NAME[name].command.value for name in to_fetch])
+            self._observe("+".join(to_fetch), written, write_time)
+            return fetched
+
+        if to_fetch:
+            command_nums = [COMMANDS_BY_NAME[name].command.value for name in to_fetch]
+            self.cache.invalidate_on(command_nums)
+            fetched = self._retrying(command_nums, attempt)
+            for command_num, answer in zip(command_nums, fetched):
+                self.cache.put(command_num, answer)
+            fetched = iter(fetched)
+            answers = [next(fetched) if answer is None else answer for answer in answers]
+        return tuple(spec.parse(answer, print) for spec, answer in zip(specs, answers))
+
+
+@with_commands(_command_method)
 class PlaceHolderDevice():
+    """Device for "test" port, answers every command of COMMANDS with canned payloads"""
     def __init__(self):
         class SerPlaceHolder():
             def close(self):
                 pass
 
         self.ser = SerPlaceHolder()
+        self.crc = CRCCalculator()
+        self.metrics = LinkMetrics()
         self.counter = 0
-    @locked
-    def trigger_measurement(self, time_to_suck, print=logger.info):
-        print("Started trigger measurement")
-        return b"\x00"
-
-    @locked
-    def get_result(self):
-        h2conc = 0.9
-        return h2conc
-    @locked
-    def get_cycle(self):
-        resistances, temperatures = np.ones(DOTS_NUMBER), np.ones(DOTS_NUMBER)
-        times = np.arange(temperatures.shape[0])
-        return times, temperatures, resistances
-
-    @locked
-    def get_status(self, print=logger.info):
-        answer = bytes(4)
-        print("Status OK")
-        return answer
-
-    @locked
-    def get_have_data(self, print=logger.info):
-        print("There is no data")
-        return b"\x01"
-    @locked
-    def get_have_result(self):
-        print("The is no new result")
-        return b"\x01"
-    @locked
-    def get_state(self, print=logger.info):
+        self.lock = threading.Lock()
+        self.answers = {
+            COMMAND_NUM.GET: np.ones(DOTS_NUMBER * 2, dtype="<f4").tobytes(),
+            COMMAND_NUM.STATUS: bytes(4),
+            COMMAND_NUM.HAVE_DATA: b"\x01",
+            COMMAND_NUM.GET_HAVE_RESULT: b"\x01",
+            COMMAND_NUM.GET_RESULT: _FLOAT.pack(0.9),
+            COMMAND_NUM.GET_HEATER_CAL: np.linspace(0.3, 5, num=DOTS_IN_PASHA_CALIBRATION, dtype="<f4").tobytes(),
+            COMMAND_NUM.CMD_GET_AMBIENT_TEMP: _FLOAT.pack(300.0),
+            COMMAND_NUM.CMD_GET_HEATER_PARAMS: _HEATER_PARAMS.pack(120, 10, 31, 14, 12, 1242, 12, 12, True),
+            COMMAND_NUM.CMD_GET_HEATER_CAL_TRANSFORM: _HEATER_CAL_TRANSFORM.pack(100, 0.1),
+        }
+
+    def _state(self):
         if self.counter == 0:
-            print("IDLE")
-            self.counter += 1
-            return 0
+            state = DEVICE_STATE.IDLE
         elif self.counter < 10:
-            print("EXHALE")
-            self.counter += 1
-            return 1
+            state = DEVICE_STATE.EXHALE
         elif self.counter < 15:
-            print("MEASURING")
-            self.counter += 1
-            return 2
-        elif self.counter < 20:
-            print("PURGING")
-            self.counter += 1
-            return 3
-        elif self.counter == 20:
-            self.counter = 0
-            return 3
+            state = DEVICE_STATE.MEASURING
         else:
-            print("Strange answer")
-            self.counter += 1
-            return 5
+            state = DEVICE_STATE.PURGING
+        self.counter = 0 if self.counter == 20 else self.counter + 1
+        return bytes((state,))
 
-    @locked
-    def get_heater_calibration(self, print=logger.info):
-        return np.linspace(0.3, 5, num=401), np.linspace(30, 500, num=401)
+    def _transact(self, command_num, useful=b""):
+        command = COMMAND_NUM(command_num)
+        if command == COMMAND_NUM.GET_STATE:
+            return bytearray(self._state())
+        return bytearray(self.answers.get(command, bytes((STATUS_CODE.OK,))))
+
+    def batch(self, *names, print=logger.info):
+        return tuple(getattr(self, name)(print=print) for name in names)
 
-    def get_heater_cal_transform(self, print=logger.info):
-        return HeaterCalTransformTuple(100, 0.1)
+    def prepare(self, name, *args):
+        return name, args
 
-    def get_heater_params(self, print=logger.info):
-        return HeaterParamsTuple(120, 10, 31, 14, 12, 1242, 12, 12, True)
+    def send_prepared(self, prepared, print=logger.info):
+        name, args = prepared
+        return getattr(self, name)(*args, print=print)
 
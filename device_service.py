@@ -0,0 +1,119 @@
+import enum
+import queue
+import logging
+import itertools
+import threading
+import typing
+from collections import namedtuple
+from concurrent.futures import Future
+
+from PySide2 import QtCore
+
+logger = logging.getLogger(__name__)
+
+PollResult = namedtuple("PollResult", "state, t_ambient, cycle")
+CycleResult = namedtuple("CycleResult", "times, temperatures, resistances, h2conc, heater_cal_transform")
+
+
+class Priority(enum.IntEnum):
+    USER = 0
+    POLL = 10
+
+
+def poll_device(device, only_in_purging=False) -> PollResult:
+    """One tick of the measurement loop, cycle is fetched when device has both data and result"""
+    state, t_ambient, have_data, have_result = device.batch("get_state", "get_ambient_temp",
+                                                            "get_have_data", "get_have_result")
+    cycle = None
+    if (state == 3 or not only_in_purging) and have_data[0] == 0 and have_result[0] == 0:
+        (times, temperatures, resistances), (h2conc, *_), heater_cal_transform = device.batch(
+            "get_cycle", "get_result", "get_heater_cal_transform")
+        cycle = CycleResult(times, temperatures, resistances, h2conc, heater_cal_transform)
+    return PollResult(state, t_ambient, cycle)
+
+
+def read_heater_calibration(device):
+    return device.get_heater_calibration(), device.get_heater_cal_transform(), device.get_heater_params()
+
+
+class DeviceService(QtCore.QObject):
+    """Owns the worker thread which does all the talking to one device.
+
+    Jobs are device method names or callables taking device as the first argument.
+    They are executed one by one, lower priority value first, so polling waits for user commands.
+    Callbacks get the finished future and are called in the Qt thread of the service.
+    Long jobs as uploads take closing to stop early when the service is closed, jobs submitted
+    after close are cancelled."""
+    message = QtCore.Signal(str)
+    _finished = QtCore.Signal(object, object)
+
+    def __init__(self, device, parent=None):
+        super().__init__(parent)
+        self.device = device
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._finished.connect(self._call_back)
+        self.closing = threading.Event()
+        # done when the worker has stopped and closed the port
+        self._stopped = Future()
+        self._thread = threading.Thread(target=self._run, name=f"DeviceService-{id(device):x}", daemon=True)
+        self._thread.start()
+
+    def submit(self, job: typing.Union[str, typing.Callable], *args, priority=Priority.USER,
+               callback: typing.Optional[typing.Callable[[Future], None]] = None, **kwargs) -> Future:
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(lambda future: self._finished.emit(callback, future))
+        if self.closing.is_set():
+            future.cancel()
+        else:
+            self._queue.put((priority, next(self._order), job, args, kwargs, future))
+        return future
+
+    def _run(self):
+        while True:
+            _, _, job, args, kwargs, future = self._queue.get()
+            if job is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if isinstance(job, str):
+                    result = getattr(self.device, job)(*args, **kwargs)
+                else:
+                    result = job(self.device, *args, **kwargs)
+            except BaseException as e:
+                logger.debug(f"Device job {job} failed: {e!r}")
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        try:
+            self.device.ser.close()
+        except BaseException as e:
+            self._stopped.set_exception(e)
+        else:
+            self._stopped.set_result(None)
+
+    def _call_back(self, callback, future):
+        callback(future)
+
+    def close(self, wait=False, callback: typing.Optional[typing.Callable[[Future], None]] = None):
+        """Cancels queued jobs and asks the running one to stop. The worker closes the port
+        when the running job returns, the caller waits for it only with wait, callback is
+        called in the Qt thread once the port is closed"""
+        if callback is not None:
+            self._stopped.add_done_callback(lambda future: self._finished.emit(callback, future))
+        if self.closing.is_set():
+            if wait:
+                self._thread.join()
+            return
+        self.closing.set()
+        while True:
+            try:
+                *_, future = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+        self._queue.put((-1, next(self._order), None, (), {}, Future()))
+        if wait:
+            self._thread.join()
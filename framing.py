@@ -0,0 +1,118 @@
+import typing
+
+START_BYTE, END_BYTE, ESCAPE_BYTE = b"\x7E\x81\x55"
+
+_START = bytes((START_BYTE,))
+_END = bytes((END_BYTE,))
+_ESCAPE = bytes((ESCAPE_BYTE,))
+
+
+def escape(data) -> bytearray:
+    # Escape byte goes first, otherwise the prefixes inserted for START/END would be escaped again
+    escaped = bytes(data).replace(_ESCAPE, _ESCAPE * 2)
+    escaped = escaped.replace(_START, _ESCAPE + _START).replace(_END, _ESCAPE + _END)
+    return bytearray(escaped)
+
+
+def unescape(data) -> bytearray:
+    data = bytes(data)
+    unescaped = bytearray()
+    position = 0
+    found = data.find(_ESCAPE)
+    while found != -1:
+        unescaped += data[position:found]
+        position = found + 1
+        if position < len(data):
+            unescaped.append(data[position])
+            position += 1
+        found = data.find(_ESCAPE, position)
+    unescaped += data[position:]
+    return unescaped
+
+
+def is_escaped(buffer, position) -> bool:
+    """True if byte at position is preceded by an odd run of escape bytes"""
+    run = 0
+    position -= 1
+    while position >= 0 and buffer[position] == ESCAPE_BYTE:
+        run += 1
+        position -= 1
+    return bool(run & 1)
+
+
+def encode_frame(body) -> bytearray:
+    frame = escape(body)
+    frame.insert(0, START_BYTE)
+    frame.append(END_BYTE)
+    return frame
+
+
+def decode_frame(frame) -> bytearray:
+    """frame: escaped bytes of one frame, START and END bytes are optional"""
+    start = 1 if frame[:1] == _START else 0
+    stop = len(frame)
+    if stop > start and frame[-1] == END_BYTE and not is_escaped(frame, stop - 1):
+        stop -= 1
+    return unescape(bytes(frame[start:stop]))
+
+
+class FrameTimeoutError(TimeoutError):
+    pass
+
+
+class FrameReader():
+    """Incremental parser: bytes are fed in any portions, complete frames are taken out,
+    partial frame and extra bytes stay in the receive buffer till next call"""
+    def __init__(self):
+        self.buffer = bytearray()
+        self._scanned = 0
+
+    def feed(self, data):
+        self.buffer += data
+
+    def clear(self):
+        del self.buffer[:]
+        self._scanned = 0
+
+    def _find(self, byte, start, end=None):
+        end = len(self.buffer) if end is None else end
+        found = self.buffer.find(byte, start, end)
+        while found != -1 and is_escaped(self.buffer, found):
+            found = self.buffer.find(byte, found + 1, end)
+        return found
+
+    def next_frame(self) -> typing.Optional[bytearray]:
+        start = self._find(START_BYTE, 0)
+        if start == -1:
+            self.clear()
+            return None
+        end = self._find(END_BYTE, max(start + 1, self._scanned))
+        if end == -1:
+            del self.buffer[:start]
+            self._scanned = len(self.buffer)
+            return None
+        # START inside frame means END of the previous one was lost, so frame begins at the last START
+        restart = self._find(START_BYTE, start + 1, end)
+        while restart != -1:
+            start = restart
+            restart = self._find(START_BYTE, start + 1, end)
+        frame = decode_frame(self.buffer[start:end + 1])
+        del self.buffer[:end + 1]
+        self._scanned = 0
+        return frame
+
+    def frames(self):
+        frame = self.next_frame()
+        while frame is not None:
+            yield frame
+            frame = self.next_frame()
+
+    def read_frame(self, ser) -> bytearray:
+        frame = self.next_frame()
+        while frame is None:
+            red = ser.read(max(getattr(ser, "in_waiting", 0), 1))
+            if not red:
+                raise FrameTimeoutError(f"No complete frame in answer, {len(self.buffer)} bytes pending")
+            self.feed(red)
+            frame = self.next_frame()
+        return frame
@@ -1,4 +1,5 @@
 import socket
+import asyncio
 from PySide2 import QtWidgets, QtCore
 import pathlib
 
@@ -17,6 +18,21 @@ def set_gas_state(gas_state: str, host: str, port: int):
             sock.close()
             return 0
 
+async def set_gas_state_async(gas_state: str, host: str, port: int):
+    """set_gas_state for event loop which drives AsyncMSDesktopDevice benches"""
+    try:
+        _, writer = await asyncio.open_connection(host, port)
+    except ConnectionRefusedError:
+        return 1
+    try:
+        writer.write(gas_state.encode("utf-8"))
+        await writer.drain()
+    except Exception as e:
+        return 1
+    else:
+        writer.close()
+        return 0
+
 class GasStandTimer(QtCore.QTimer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -0,0 +1,136 @@
+"""Heater calibration files of all sensors against the heater calibration of the device.
+
+Cal files have three columns for every sensor, voltage first and temperature last, par files
+R0, Rc, a0 of every sensor and T0. Both are parsed once per modification and the curves of all sensors
+are recalculated at once."""
+import os
+import re
+import pathlib
+import logging
+import threading
+import configparser
+import typing
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CAL_COLUMNS_PER_SENSOR = 3
+# series resistance of the heater voltage measurement, Ohm
+SERIES_RESISTANCE = 20
+
+HeaterParFile = namedtuple("HeaterParFile", "r0, rc, alpha, t0")
+SensorCurves = namedtuple("SensorCurves", "voltages, temperatures, voltages_recalc")
+SensorFit = namedtuple("SensorFit", "k, b, rms, max_error")
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cached(filename, parse):
+    """parse(filename) result, parsed again only when size or modification time change"""
+    filename = pathlib.Path(filename).resolve()
+    stat = os.stat(filename)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get((filename, parse))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    value = parse(filename)
+    with _cache_lock:
+        _cache[(filename, parse)] = (key, value)
+    return value
+
+
+def _parse_cal(filename) -> np.ndarray:
+    return np.loadtxt(filename, skiprows=1, ndmin=2)
+
+
+def _parse_par(filename) -> HeaterParFile:
+    """Parameters of every sensor found in the file, NaN for missing ones"""
+    config = configparser.ConfigParser()
+    config.read(filename)
+
+    def section(name, prefix):
+        values = {int(match.group(1)): float(value.replace(",", "."))
+                  for key, value in config[name].items()
+                  for match in (re.fullmatch(prefix + r"_(\d+)", key, re.IGNORECASE),) if match}
+        array = np.full(max(values, default=-1) + 1, np.nan)
+        array[list(values)] = list(values.values())
+        return array
+
+    return HeaterParFile(section("R0", "R0") / 100, section("Rc", "Rc") / 100, section("a", "a0"),
+                         float(config["T0"]["T0"].replace(",", ".")))
+
+
+def load_cal(filename) -> np.ndarray:
+    return _cached(filename, _parse_cal)
+
+
+def load_par(filename) -> HeaterParFile:
+    return _cached(filename, _parse_par)
+
+
+def _per_sensor(values, sensors):
+    result = np.full(sensors, np.nan)
+    result[:min(len(values), sensors)] = values[:sensors]
+    return result
+
+
+def sensor_curves(cal: np.ndarray, par: HeaterParFile) -> SensorCurves:
+    """Curves of all sensors at once, arrays are (points, sensors)"""
+    voltages = cal[:, 0::CAL_COLUMNS_PER_SENSOR]
+    temperatures = cal[:, 2::CAL_COLUMNS_PER_SENSOR]
+    sensors = temperatures.shape[1]
+    voltages = voltages[:, :sensors]
+    r0, rc, alpha = (_per_sensor(values, sensors) for values in (par.r0, par.rc, par.alpha))
+    resistances = (1 + alpha * (temperatures - par.t0)) * (r0 - rc) + rc
+    return SensorCurves(voltages, temperatures, voltages * resistances / (resistances + SERIES_RESISTANCE))
+
+
+def load_curves(filename, filename_par) -> SensorCurves:
+    return sensor_curves(load_cal(filename), load_par(filename_par))
+
+
+def fit_sensors(curves: SensorCurves, voltages, temperatures) -> SensorFit:
+    """Linear map of the device heater voltages to the recalculated voltages of every sensor.
+
+    The device curve gives the voltage at the temperature of every sensor point, k and b
+    minimize the squared difference to voltages_recalc, rms and max_error are the residuals, V."""
+    order = np.argsort(temperatures)
+    device_voltages = np.interp(curves.temperatures, np.asarray(temperatures)[order], np.asarray(voltages)[order])
+    valid = np.isfinite(device_voltages) & np.isfinite(curves.voltages_recalc)
+    x = np.where(valid, device_voltages, np.nan)
+    y = np.where(valid, curves.voltages_recalc, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean, y_mean = np.nanmean(x, axis=0), np.nanmean(y, axis=0)
+        k = np.nansum((x - x_mean) * (y - y_mean), axis=0) / np.nansum((x - x_mean) ** 2, axis=0)
+        b = y_mean - k * x_mean
+        residuals = y - (k * x + b)
+        return SensorFit(k, b, np.sqrt(np.nanmean(residuals ** 2, axis=0)), np.nanmax(np.abs(residuals), axis=0))
+
+
+def export_report(directory, voltages, temperatures, voltages_cal, curves: typing.Optional[SensorCurves] = None,
+                  fit: typing.Optional[SensorFit] = None, sensor_number=None):
+    """Writes CSVs of the device curve and, with curves, of the sensor and a fit report of all sensors.
+    Slow on network folders, run it off the GUI thread."""
+    directory = pathlib.Path(directory)
+    if curves is not None and sensor_number is not None:
+        ms_voltages = curves.voltages[:, sensor_number]
+        ms_temperatures = curves.temperatures[:, sensor_number]
+        ms_voltages_recalc = curves.voltages_recalc[:, sensor_number]
+    else:
+        ms_voltages = ms_temperatures = ms_voltages_recalc = np.empty(0)
+    data = np.hstack([voltages, temperatures, ms_voltages, ms_temperatures]).reshape((2, -1)).T
+    data2 = np.hstack([ms_voltages, ms_temperatures]).reshape((2, -1)).T
+    data3 = np.hstack([ms_voltages_recalc, ms_temperatures]).reshape((2, -1)).T
+    data4 = np.hstack([voltages_cal, temperatures]).reshape((2, -1)).T
+    np.savetxt(directory / "pasha_version.csv", data)
+    np.savetxt(directory / "ms_version.csv", data2)
+    np.savetxt(directory / "ms_version_recalc.csv", data3)
+    np.savetxt(directory / "pasha_cal_version.csv", data4)
+    if fit is not None:
+        report = np.column_stack((np.arange(len(fit.k)), fit.k, fit.b, fit.rms, fit.max_error))
+        np.savetxt(directory / "heater_calibration_fit.csv", report, delimiter=",", fmt=("%d", "%g", "%g", "%g", "%g"),
+                   header="sensor,k,b,rms,max_error", comments="")
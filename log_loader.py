@@ -0,0 +1,160 @@
+import os
+import logging
+import pathlib
+import warnings
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from logger import record_dtype, read_binary_log, read_binary_log_header, write_binary_log
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 16 * 1024 * 1024
+CACHE_SUFFIX = ".mslog"
+
+
+def _records(rows: np.ndarray, dots_number) -> np.ndarray:
+    # timestamp, resistances, conc, state, temperatures, t_ambient, k, b, conc_set
+    records = np.zeros(len(rows), dtype=record_dtype(dots_number))
+    records["timestamp"] = rows[:, 0]
+    records["resistances"] = rows[:, 1:dots_number + 1]
+    records["conc"] = rows[:, dots_number + 1]
+    records["state"] = rows[:, dots_number + 2]
+    records["temperatures"] = rows[:, dots_number + 3:2 * dots_number + 3]
+    records["t_ambient"], records["k"], records["b"], records["conc_set"] = rows[:, 2 * dots_number + 3:].T
+    return records
+
+
+def _parse_values(text: bytes) -> typing.Optional[np.ndarray]:
+    """None for unparsable text, older NumPy warns and stops there, newer raises"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(text, sep=" ")
+        except (ValueError, DeprecationWarning):
+            return None
+
+
+def _parse_block(block: bytes, width, filename) -> np.ndarray:
+    """Rows of complete lines of block, lines with a wrong number of values are skipped"""
+    lines = block.count(b"\n")
+    values = _parse_values(block)
+    if values is not None and len(values) == lines * width:
+        return values.reshape(lines, width)
+    rows = [row for row in map(_parse_values, block.splitlines()) if row is not None and len(row) == width]
+    skipped = lines - len(rows)
+    if skipped:
+        logger.info(f"{filename}: skipped {skipped} damaged lines")
+    return np.array(rows).reshape(-1, width)
+
+
+def parse_text_stream(fd, name="stream", block_size=BLOCK_SIZE) -> np.ndarray:
+    """Parses DataLogger text from a readable binary file object into the record array of BinaryDataLogger.
+    The number of points is taken from the first line."""
+    blocks, width, rest = [], None, b""
+    while True:
+        data = fd.read(block_size)
+        block = rest + data
+        end = block.rfind(b"\n") + 1 if data else len(block)
+        block, rest = block[:end], block[end:]
+        if width is None and block.strip():
+            width = len(block.split(b"\n", 1)[0].split())
+        if block.strip():
+            if not block.endswith(b"\n"):
+                block += b"\n"
+            blocks.append(_parse_block(block, width, name))
+        if not data:
+            break
+    dots_number = 0 if width is None else (width - 7) // 2
+    if not blocks:
+        return np.zeros(0, dtype=record_dtype(dots_number))
+    return _records(np.concatenate(blocks), dots_number)
+
+
+def parse_text_log(filename, block_size=BLOCK_SIZE) -> np.ndarray:
+    """parse_text_stream of a DataLogger .log file"""
+    with open(filename, "rb") as fd:
+        return parse_text_stream(fd, filename, block_size)
+
+
+def cache_file(filename) -> pathlib.Path:
+    filename = pathlib.Path(filename)
+    return filename.with_name(filename.name + CACHE_SUFFIX)
+
+
+def _source_key(filename):
+    stat = os.stat(filename)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _cached(filename) -> typing.Optional[np.ndarray]:
+    cache = cache_file(filename)
+    try:
+        header, _ = read_binary_log_header(cache)
+        if header.get("source") == _source_key(filename):
+            return read_binary_log(cache)
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def load_log(filename, use_cache=True) -> np.ndarray:
+    """Records of a text log, parsed once and then read from the binary cache file next to it.
+    The cache is valid while size and modification time of the log are the same."""
+    if use_cache:
+        records = _cached(filename)
+        if records is not None:
+            return records
+    key = _source_key(filename)
+    records = parse_text_log(filename)
+    if use_cache:
+        try:
+            write_binary_log(cache_file(filename), records, source=key)
+        except OSError as e:
+            logger.info(f"Can't cache {filename}: {e!r}")
+    return records
+
+
+def load_logs(filenames, use_cache=True, processes=None) -> typing.List[np.ndarray]:
+    """load_log of every file, files without a valid cache are parsed in parallel processes"""
+    filenames = list(filenames)
+    results = [_cached(filename) if use_cache else None for filename in filenames]
+    missing = [i for i, records in enumerate(results) if records is None]
+    if len(missing) > 1 and processes != 1:
+        with ProcessPoolExecutor(processes) as executor:
+            parsed = executor.map(load_log, (filenames[i] for i in missing), (use_cache,) * len(missing))
+            for i, records in zip(missing, parsed):
+                results[i] = records
+    else:
+        for i in missing:
+            results[i] = load_log(filenames[i], use_cache)
+    return results
+
+
+class LogIndex():
+    """Records grouped by gas state, ordered by time within a state.
+
+    cycles_at(state) is a view of a contiguous slice, between() a binary search on time."""
+    def __init__(self, records: np.ndarray):
+        order = np.lexsort((records["timestamp"], records["state"]))
+        self.records = records[order]
+        states, starts = np.unique(self.records["state"], return_index=True)
+        stops = np.append(starts[1:], len(self.records))
+        self.slices = {int(state): slice(start, stop) for state, start, stop in zip(states, starts, stops)}
+        timestamps = records["timestamp"]
+        self.by_time = records if np.all(timestamps[1:] >= timestamps[:-1]) else \
+            records[np.argsort(timestamps, kind="stable")]
+
+    def states(self):
+        return list(self.slices)
+
+    def cycles_at(self, state) -> np.ndarray:
+        return self.records[self.slices.get(int(state), slice(0, 0))]
+
+    def between(self, start, end, state=None) -> np.ndarray:
+        """Cycles with start <= timestamp < end, of one state or of all states in time order"""
+        records = self.by_time if state is None else self.cycles_at(state)
+        first, last = np.searchsorted(records["timestamp"], (start, end))
+        return records[first:last]
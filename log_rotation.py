@@ -0,0 +1,169 @@
+import os
+import gzip
+import lzma
+import json
+import time
+import datetime
+import shutil
+import logging
+import pathlib
+import threading
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from logger import DataLogger, read_binary_stream
+from log_loader import parse_text_stream
+
+logger = logging.getLogger(__name__)
+
+COMPRESSED_SUFFIXES = {"zlib": ".gz", "lzma": ".xz"}
+_OPENERS = {".gz": gzip.open, ".xz": lzma.open}
+
+
+def compress_segment(filename, compression="zlib") -> str:
+    """Compresses a closed segment next to it, returns the compressed file name.
+    Runs in a worker process, the source is removed by the caller."""
+    filename = pathlib.Path(filename)
+    compressed = filename.with_name(filename.name + COMPRESSED_SUFFIXES[compression])
+    temporary = compressed.with_name(compressed.name + ".tmp")
+    with filename.open("rb") as source, _OPENERS[compressed.suffix](temporary, "wb") as destination:
+        shutil.copyfileobj(source, destination, 1024 * 1024)
+    os.replace(temporary, compressed)
+    return compressed.name
+
+
+class RotatingDataLogger():
+    """Splits a session into segments of DataLogger or BinaryDataLogger files.
+
+    A new segment starts when the current one is max_bytes long or max_age s old. Closed
+    segments are compressed by a worker process, the manifest <session>.manifest.json lists
+    segments in order with their current file names, so readers go through all of them with
+    iter_session. Writing never waits for compression. Meant to be wrapped by QueuedDataLogger,
+    rotation happens in write_records."""
+    def __init__(self, path_to_save_logs, data_logger_class=DataLogger, max_bytes=64 * 1024 * 1024,
+                 max_age=6 * 3600.0, compression: typing.Optional[str] = "zlib"):
+        self.path_to_save_logs = pathlib.Path(path_to_save_logs)
+        self.data_logger_class = data_logger_class
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = compression
+        self.session = datetime.datetime.now().isoformat(timespec="seconds").replace(":", ".")
+        self.manifest = self.path_to_save_logs / f"{self.session}.manifest.json"
+        self.lock = threading.Lock()
+        self.segments = []
+        self.data_logger = None
+        self.opened = None
+        # only formats records, loggers touch the disk on the first write
+        self._formatter = data_logger_class(self.path_to_save_logs)
+        self._executor: typing.Optional[ProcessPoolExecutor] = None
+
+    @property
+    def file(self):
+        """Current segment, None before the first record"""
+        return None if self.data_logger is None else self.data_logger.file
+
+    def _open_segment(self):
+        self.data_logger = self.data_logger_class(self.path_to_save_logs, f"{self.session}.{len(self.segments):03}")
+        self.opened = time.monotonic()
+        with self.lock:
+            self.segments.append({"file": self.data_logger.file.name, "stored": self.data_logger.file.name,
+                                  "size": 0, "stored_size": None, "started": time.time(), "finished": None})
+            self._write_manifest()
+
+    def _write_manifest(self):
+        temporary = self.manifest.with_name(self.manifest.name + ".tmp")
+        temporary.write_text(json.dumps({"session": self.session, "format": self.data_logger_class.__name__,
+                                         "compression": self.compression, "segments": self.segments}, indent=1))
+        os.replace(temporary, self.manifest)
+
+    def _close_segment(self):
+        self.data_logger.close()
+        with self.lock:
+            segment = self.segments[-1]
+            segment["finished"] = time.time()
+            segment["size"] = self._size()
+            self._write_manifest()
+        if self.compression is not None and segment["size"]:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(1)
+            future = self._executor.submit(compress_segment, self.data_logger.file, self.compression)
+            future.add_done_callback(lambda future, segment=segment: self._compressed(segment, future))
+
+    def _compressed(self, segment, future):
+        try:
+            stored = future.result()
+        except Exception as e:
+            logger.info(f"Compression of {segment['file']} failed: {e!r}")
+            return
+        with self.lock:
+            segment["stored"] = stored
+            segment["stored_size"] = os.path.getsize(self.path_to_save_logs / stored)
+            self._write_manifest()
+        os.remove(self.path_to_save_logs / segment["file"])
+
+    def _size(self):
+        try:
+            return os.path.getsize(self.data_logger.file)
+        except OSError:
+            return 0
+
+    def rotate(self):
+        if self.data_logger is not None:
+            self._close_segment()
+        self._open_segment()
+
+    def save_data(self, resistances, conc, state, temperatures, t_ambient, k_i, b_i, conc_set):
+        self.write_records([self.format_record(datetime.datetime.now().timestamp(), resistances, conc, state,
+                                               temperatures, t_ambient, k_i, b_i, conc_set)])
+
+    def format_record(self, *args):
+        return self._formatter.format_record(*args)
+
+    def write_records(self, records, fsync=False):
+        if self.data_logger is None or self._size() >= self.max_bytes or \
+                time.monotonic() - self.opened >= self.max_age:
+            self.rotate()
+        self.data_logger.write_records(records, fsync)
+
+    def close(self, wait=False):
+        """Closes the last segment, its compression goes on in background unless wait is set"""
+        if self.data_logger is not None:
+            self._close_segment()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+def _open_stored(directory, segment):
+    """Segment compressed after the manifest was read is found by its suffix,
+    None for a segment without records yet"""
+    for name in (segment["stored"], *(segment["file"] + suffix for suffix in COMPRESSED_SUFFIXES.values())):
+        path = directory / name
+        opener = _OPENERS.get(path.suffix, open)
+        try:
+            return opener(path, "rb")
+        except FileNotFoundError:
+            pass
+    if not segment["size"]:
+        return None
+    raise FileNotFoundError(directory / segment["stored"])
+
+
+def iter_session(manifest) -> typing.Iterator[np.ndarray]:
+    """Records of every segment of a rotated session in order, segments are read one at a time"""
+    manifest = pathlib.Path(manifest)
+    description = json.loads(manifest.read_text())
+    for segment in description["segments"]:
+        fd = _open_stored(manifest.parent, segment)
+        if fd is None:
+            continue
+        with fd:
+            if description["format"] == DataLogger.__name__:
+                yield parse_text_stream(fd, segment["file"])
+            else:
+                yield read_binary_stream(fd, segment["file"])
+
+
+def read_session(manifest) -> np.ndarray:
+    return np.concatenate(list(iter_session(manifest)))
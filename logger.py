@@ -1,17 +1,293 @@
+import os
+import json
+import time
+import queue
+import struct
+import logging
+import threading
+import collections
 import pathlib
 import datetime
+import functools
+import subprocess
 import numpy as np
 
+from device import DOTS_NUMBER
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+BINARY_LOG_MAGIC = b"MSLOG\x00\x00\x01"
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+def record_dtype(dots_number=DOTS_NUMBER):
+    return np.dtype([("timestamp", "<f8"),
+                     ("resistances", "<f4", (dots_number,)),
+                     ("conc", "<f4"),
+                     ("state", "<i4"),
+                     ("temperatures", "<f4", (dots_number,)),
+                     ("t_ambient", "<f4"),
+                     ("k", "<f4"),
+                     ("b", "<f4"),
+                     ("conc_set", "<f4")])
+
+
+@functools.lru_cache(maxsize=None)
+def software_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=pathlib.Path(__file__).parent,
+                              capture_output=True, text=True, timeout=5, check=True).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def binary_log_header(dtype, dots_number, **extra) -> bytes:
+    header = json.dumps({"dots_number": dots_number,
+                         "software_version": software_version(),
+                         "created": datetime.datetime.now().isoformat(),
+                         "fields": dtype.descr,
+                         **extra}).encode()
+    # records start 8 bytes aligned
+    header += b" " * (-(len(BINARY_LOG_MAGIC) + _HEADER_LENGTH.size + len(header)) % 8)
+    return BINARY_LOG_MAGIC + _HEADER_LENGTH.pack(len(header)) + header
+
+
 class DataLogger():
-    def __init__(self, path_to_save_logs):
+    def __init__(self, path_to_save_logs, name=None):
 
         self.path_to_save_logs = pathlib.Path(path_to_save_logs)
-        self.file = (self.path_to_save_logs / datetime.datetime.now().isoformat().replace(":", ".")).with_suffix(".log")
+        if name:
+            self.file = self.path_to_save_logs / f"{name}.log"
+        else:
+            self.file = (self.path_to_save_logs / datetime.datetime.now().isoformat().replace(":", ".")).with_suffix(".log")
 
     def save_data(self, resistances, conc, state, temperatures, t_ambient, k_i, b_i, conc_set):
+        self.write_records([self.format_record(datetime.datetime.now().timestamp(), resistances, conc, state,
+                                               temperatures, t_ambient, k_i, b_i, conc_set)])
+
+    def format_record(self, timestamp, resistances, conc, state, temperatures, t_ambient, k_i, b_i, conc_set) -> str:
         if not state:
             state = -1
         state = int(state)
+        values = np.hstack([timestamp, resistances, conc, state, temperatures, t_ambient, k_i, b_i, float(conc_set)])
+        # same text as ndarray.tofile(fd, sep="\t")
+        return "\t".join(map(str, values.tolist())) + "\n"
+
+    def write_records(self, records, fsync=False):
         with self.file.open("a") as fd:
-            np.hstack([datetime.datetime.now().timestamp(), resistances, conc, state, temperatures, t_ambient, k_i, b_i, float(conc_set)]).tofile(fd, sep="\t")
-            fd.write("\n")
+            fd.write("".join(records))
+            if fsync:
+                fd.flush()
+                os.fsync(fd.fileno())
+
+    def close(self):
+        pass
+
+
+class BinaryDataLogger():
+    """Same records as DataLogger in a fixed width binary format, one record per cycle.
+
+    File starts with BINARY_LOG_MAGIC, header length and JSON header with the record layout,
+    records follow right after it. The file stays open between records."""
+    def __init__(self, path_to_save_logs, name=None, dots_number=DOTS_NUMBER):
+        self.path_to_save_logs = pathlib.Path(path_to_save_logs)
+        if name:
+            self.file = self.path_to_save_logs / f"{name}.mslog"
+        else:
+            self.file = (self.path_to_save_logs / datetime.datetime.now().isoformat().replace(":", ".")).with_suffix(".mslog")
+        self.dtype = record_dtype(dots_number)
+        self.dots_number = dots_number
+        self._fd = None
+
+    def _open(self):
+        self._fd = self.file.open("ab")
+        if self._fd.tell() == 0:
+            self._fd.write(binary_log_header(self.dtype, self.dots_number))
+
+    def save_data(self, resistances, conc, state, temperatures, t_ambient, k_i, b_i, conc_set):
+        self.write_records([self.format_record(datetime.datetime.now().timestamp(), resistances, conc, state,
+                                               temperatures, t_ambient, k_i, b_i, conc_set)])
+
+    def format_record(self, timestamp, resistances, conc, state, temperatures, t_ambient, k_i, b_i, conc_set) -> bytes:
+        record = np.zeros(1, dtype=self.dtype)
+        record["timestamp"] = timestamp
+        record["resistances"] = resistances
+        record["conc"] = conc
+        record["state"] = int(state) if state else -1
+        record["temperatures"] = temperatures
+        record["t_ambient"] = t_ambient
+        record["k"] = k_i
+        record["b"] = b_i
+        record["conc_set"] = float(conc_set)
+        return record.tobytes()
+
+    def write_records(self, records, fsync=False):
+        if self._fd is None:
+            self._open()
+        self._fd.write(b"".join(records))
+        self._fd.flush()
+        if fsync:
+            os.fsync(self._fd.fileno())
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+
+class QueuedDataLogger():
+    """Wraps DataLogger or BinaryDataLogger: save_data only queues the record, a writer thread
+    formats and writes queued records in batches.
+
+    A batch is written when batch_size records are queued or flush_interval s after its first
+    record. fsync_interval None never fsyncs, 0 fsyncs every batch, otherwise at most every
+    fsync_interval s. When max_queue records wait, save_data blocks if block is set, otherwise
+    the record is dropped and counted."""
+    def __init__(self, data_logger, max_queue=10000, batch_size=256, flush_interval=0.5, fsync_interval=None,
+                 block=False):
+        self.data_logger = data_logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.block = block
+        self.queue = queue.Queue(max_queue)
+        self.lock = threading.Lock()
+        self.counters = collections.Counter(dict.fromkeys(("records", "written", "dropped", "batches", "fsyncs",
+                                                           "errors"), 0))
+        # from save_data to the record written, and of a batch write
+        self.latency = Histogram()
+        self.write_time = Histogram()
+        self._last_fsync = time.monotonic()
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="DataLogger", daemon=True)
+        self._thread.start()
+
+    @property
+    def file(self):
+        return self.data_logger.file
+
+    def save_data(self, resistances, conc, state, temperatures, t_ambient, k_i, b_i, conc_set):
+        item = (time.perf_counter(), datetime.datetime.now().timestamp(),
+                (resistances, conc, state, temperatures, t_ambient, k_i, b_i, conc_set))
+        with self.lock:
+            self.counters["records"] += 1
+        try:
+            self.queue.put(item, block=self.block)
+        except queue.Full:
+            with self.lock:
+                self.counters["dropped"] += 1
+
+    def _next_batch(self):
+        """Records and markers (flush events, None to stop) ending the batch early"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while isinstance(batch[-1], tuple) and len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self._write([item for item in batch if isinstance(item, tuple)])
+            if isinstance(batch[-1], threading.Event):
+                batch[-1].set()
+            elif batch[-1] is None:
+                self.data_logger.close()
+                return
+
+    def _write(self, items):
+        if not items:
+            return
+        started = time.perf_counter()
+        fsync = self.fsync_interval is not None and time.monotonic() - self._last_fsync >= self.fsync_interval
+        try:
+            self.data_logger.write_records([self.data_logger.format_record(timestamp, *args)
+                                            for _, timestamp, args in items], fsync)
+        except Exception as e:
+            logger.info(f"Writing {len(items)} records to {self.file} failed: {e!r}")
+            with self.lock:
+                self.counters["errors"] += len(items)
+            return
+        if fsync:
+            self._last_fsync = time.monotonic()
+        finished = time.perf_counter()
+        with self.lock:
+            self.write_time.observe(finished - started)
+            for enqueued, *_ in items:
+                self.latency.observe(finished - enqueued)
+            self.counters["written"] += len(items)
+            self.counters["batches"] += 1
+            self.counters["fsyncs"] += fsync
+
+    def flush(self, timeout=None) -> bool:
+        """Waits until everything queued before the call is written"""
+        written = threading.Event()
+        self.queue.put(written)
+        return written.wait(timeout)
+
+    def snapshot(self):
+        with self.lock:
+            return {"counters": dict(self.counters), "queued": self.queue.qsize(),
+                    "latency": self.latency.as_dict(), "write_time": self.write_time.as_dict()}
+
+    def close(self, wait=True):
+        """Writes everything queued and closes the wrapped logger. The writer thread does it,
+        the caller waits for it only with wait"""
+        if not self._closing:
+            self._closing = True
+            self.queue.put(None)
+        if wait:
+            self._thread.join()
+
+
+def _read_header(fd, name):
+    magic = fd.read(len(BINARY_LOG_MAGIC))
+    if magic != BINARY_LOG_MAGIC:
+        raise ValueError(f"{name} is not a binary session log")
+    length, = _HEADER_LENGTH.unpack(fd.read(_HEADER_LENGTH.size))
+    return json.loads(fd.read(length)), len(BINARY_LOG_MAGIC) + _HEADER_LENGTH.size + length
+
+
+def _header_dtype(header):
+    return np.dtype([tuple(field) for field in header["fields"]])
+
+
+def read_binary_log_header(filename):
+    """Returns header dict and offset of the first record"""
+    with open(filename, "rb") as fd:
+        return _read_header(fd, filename)
+
+
+def read_binary_stream(fd, name="stream") -> np.ndarray:
+    """Complete records of a binary session log from a readable binary file object,
+    e.g. a decompressing one"""
+    header, _ = _read_header(fd, name)
+    dtype = _header_dtype(header)
+    data = fd.read()
+    return np.frombuffer(data, dtype=dtype, count=len(data) // dtype.itemsize)
+
+
+def read_binary_log(filename) -> np.memmap:
+    """Structured read only memmap of all complete records, log[i] is cycle i"""
+    header, offset = read_binary_log_header(filename)
+    dtype = _header_dtype(header)
+    records = (pathlib.Path(filename).stat().st_size - offset) // dtype.itemsize
+    if records == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=(records,))
+
+
+def write_binary_log(filename, records: np.ndarray, **extra):
+    """Writes records as a whole binary session log, extra goes to the header.
+    The file is replaced atomically."""
+    filename = pathlib.Path(filename)
+    dots_number = records.dtype["resistances"].shape[0]
+    temporary = filename.with_name(filename.name + ".tmp")
+    with temporary.open("wb") as fd:
+        fd.write(binary_log_header(records.dtype, dots_number, **extra))
+        fd.write(np.ascontiguousarray(records).tobytes())
+    os.replace(temporary, filename)
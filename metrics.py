@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import bisect
+import logging
+import pathlib
+import threading
+import collections
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of latency buckets, s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   float("inf"))
+PHASES = ("write", "first_byte", "frame")
+COUNTERS = ("bytes_out", "bytes_in", "payload_in", "commands", "crc_errors", "counter_gaps", "dropped_frames",
+            "timeouts", "retries", "stale_answers", "cache_hits")
+
+
+class Histogram():
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q, max for the last bucket"""
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if count and cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {"count": self.count, "sum": self.sum, "max": self.max,
+                "buckets": dict(zip(map(str, self.buckets), self.counts))}
+
+
+class LinkMetrics():
+    """Link health of one device: latency histograms per command and phase, and counters.
+
+    write is time of ser.write, first_byte is from the end of write to the first answer
+    bytes, frame is from the end of write to the complete answer frame."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = collections.Counter(dict.fromkeys(COUNTERS, 0))
+        self.histograms = collections.defaultdict(lambda: {phase: Histogram() for phase in PHASES})
+        self.started = time.time()
+
+    def count(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] += value
+
+    def observe(self, command, write, first_byte, frame):
+        with self.lock:
+            histograms = self.histograms[command]
+            histograms["write"].observe(write)
+            if first_byte is not None:
+                histograms["first_byte"].observe(first_byte)
+            histograms["frame"].observe(frame)
+            self.counters["commands"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {"started": self.started,
+                    "time": time.time(),
+                    "counters": dict(self.counters),
+                    "commands": {command: {phase: histogram.as_dict() for phase, histogram in histograms.items()}
+                                 for command, histograms in self.histograms.items()}}
+
+    def summary(self):
+        """(command, calls, frame p50, frame p99, frame max) sorted by total frame time"""
+        with self.lock:
+            rows = [(command, histograms["frame"].count, histograms["frame"].quantile(0.5),
+                     histograms["frame"].quantile(0.99), histograms["frame"].max, histograms["frame"].sum)
+                    for command, histograms in self.histograms.items()]
+        return [row[:-1] for row in sorted(rows, key=lambda row: -row[-1])]
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=1)
+
+    def to_prometheus(self, device=""):
+        snapshot = self.snapshot()
+        lines = []
+        for counter, value in snapshot["counters"].items():
+            lines.append(f"# TYPE msdesktop_{counter}_total counter")
+            lines.append(f'msdesktop_{counter}_total{{device="{device}"}} {value}')
+        lines.append("# TYPE msdesktop_command_seconds histogram")
+        for command, phases in snapshot["commands"].items():
+            for phase, histogram in phases.items():
+                labels = f'device="{device}",command="{command}",phase="{phase}"'
+                cumulative = 0
+                for bound, count in histogram["buckets"].items():
+                    cumulative += count
+                    le = "+Inf" if bound == "inf" else bound
+                    lines.append(f'msdesktop_command_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"msdesktop_command_seconds_sum{{{labels}}} {histogram['sum']}")
+                lines.append(f"msdesktop_command_seconds_count{{{labels}}} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class MeteredPort():
+    """Serial port proxy counting bytes of the link and remembering when the first answer bytes
+    came after the last write. Everything else goes to the wrapped port."""
+    def __init__(self, ser, metrics: LinkMetrics):
+        self.ser = ser
+        self.metrics = metrics
+        self.first_byte = None
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def __setattr__(self, name, value):
+        if name in ("ser", "metrics", "first_byte"):
+            super().__setattr__(name, value)
+        else:
+            setattr(self.ser, name, value)
+
+    def write(self, data):
+        self.first_byte = None
+        written = self.ser.write(data)
+        self.metrics.count("bytes_out", len(data))
+        return written
+
+    def read(self, size=1):
+        red = self.ser.read(size)
+        if red:
+            if self.first_byte is None:
+                self.first_byte = time.perf_counter()
+            self.metrics.count("bytes_in", len(red))
+        return red
+
+
+class MetricsDumper():
+    """Writes metrics every interval seconds to path with .json and .prom suffixes,
+    files are replaced atomically so readers never see a partial dump"""
+    def __init__(self, metrics: LinkMetrics, path, interval=10.0, device=""):
+        self.metrics = metrics
+        self.path = pathlib.Path(path)
+        self.interval = interval
+        self.device = device
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="MetricsDumper", daemon=True)
+        self._thread.start()
+
+    def _write(self, suffix, text):
+        path = self.path.with_suffix(suffix)
+        temporary = path.with_suffix(suffix + ".tmp")
+        temporary.write_text(text)
+        os.replace(temporary, path)
+
+    def dump(self):
+        try:
+            self._write(".json", self.metrics.to_json())
+            self._write(".prom", self.metrics.to_prometheus(self.device))
+        except OSError as e:
+            logger.info(f"Metrics dump to {self.path} failed: {e!r}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        self.dump()
@@ -0,0 +1,87 @@
+from PySide2 import QtWidgets, QtCore
+import typing
+
+if typing.TYPE_CHECKING:
+    from metrics import LinkMetrics
+    from logger import QueuedDataLogger
+
+
+class MetricsWidget(QtWidgets.QGroupBox):
+    """Live link health: counters and per command frame latencies, and the session log writer,
+    refreshed every second. data_lost is emitted when records are dropped or fail to be written"""
+    data_lost = QtCore.Signal(str)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__("Link", *args, **kwargs)
+        self.metrics: typing.Optional["LinkMetrics"] = None
+        self._last_counters = None
+        self.data_logger: typing.Optional["QueuedDataLogger"] = None
+        self._lost = (0, 0)
+
+        main_layout = QtWidgets.QVBoxLayout(self)
+        self.counters_label = QtWidgets.QLabel("No device")
+        main_layout.addWidget(self.counters_label)
+        self.data_logger_label = QtWidgets.QLabel("No session log")
+        main_layout.addWidget(self.data_logger_label)
+
+        self.table_widget = QtWidgets.QTableWidget(self)
+        self.table_widget.setColumnCount(5)
+        self.table_widget.setHorizontalHeaderLabels(("Command", "Calls", "p50, ms", "p99, ms", "max, ms"))
+        self.table_widget.verticalHeader().setVisible(False)
+        self.table_widget.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table_widget.setMaximumHeight(150)
+        main_layout.addWidget(self.table_widget)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+
+    def set_metrics(self, metrics: "LinkMetrics"):
+        self.metrics = metrics
+        self._last_counters = None
+        self.refresh()
+
+    def set_data_logger(self, data_logger: "QueuedDataLogger"):
+        self.data_logger = data_logger
+        self._lost = (0, 0)
+        self.refresh_data_logger()
+
+    def refresh_data_logger(self):
+        if self.data_logger is None:
+            return
+        snapshot = self.data_logger.snapshot()
+        counters = snapshot["counters"]
+        lost = (counters["dropped"], counters["errors"])
+        self.data_logger_label.setText(f"Session log: {counters['written']} written, {snapshot['queued']} queued, "
+                                       f"{counters['dropped']} dropped, {counters['errors']} failed to write")
+        self.data_logger_label.setStyleSheet("color: red" if any(lost) else "")
+        if lost != self._lost:
+            self._lost = lost
+            self.data_lost.emit(f"Session log lost records: {lost[0]} dropped on full queue, "
+                                f"{lost[1]} failed to write")
+
+    def refresh(self):
+        self.refresh_data_logger()
+        if self.metrics is None:
+            return
+        counters = self.metrics.snapshot()["counters"]
+        last = self._last_counters or counters
+        self._last_counters = counters
+
+        def rate(counter):
+            return (counters[counter] - last[counter]) * 1000 / self.timer.interval() / 1024
+
+        self.counters_label.setText(f"in: {counters['bytes_in']} B, out: {counters['bytes_out']} B, "
+                                    f"link {rate('bytes_in') + rate('bytes_out'):.1f} KiB/s, "
+                                    f"goodput {rate('payload_in'):.1f} KiB/s, commands: {counters['commands']}, "
+                                    f"CRC errors: {counters['crc_errors']}, counter gaps: {counters['counter_gaps']}, "
+                                    f"timeouts: {counters['timeouts']}, retries: {counters['retries']}, "
+                                    f"stale answers: {counters['stale_answers']}, "
+                                    f"cache hits: {counters['cache_hits']}")
+        rows = self.metrics.summary()
+        self.table_widget.setRowCount(len(rows))
+        for row, (command, calls, p50, p99, maximum) in enumerate(rows):
+            for column, text in enumerate((command, str(calls), f"{p50 * 1e3:.2f}", f"{p99 * 1e3:.2f}",
+                                           f"{maximum * 1e3:.2f}")):
+                self.table_widget.setItem(row, column, QtWidgets.QTableWidgetItem(text))
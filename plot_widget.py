@@ -1,13 +1,23 @@
 import pyqtgraph as pg
 import logging
 import numpy as np
-import pathlib
 import json2html
 import typing
 if typing.TYPE_CHECKING:
     from device import HeaterParamsTuple, HeaterCalTransformTuple
 
+OVERLAY_COLOR = (80, 160, 255)
+OVERLAY_OPACITY = 0.8
+OVERLAY_BANDS = 8
+
+
 class PlotWidget(pg.PlotWidget):
+    """Cycle answers are drawn by persistent curves updated with setData.
+
+    With set_overlay(n) about n last cycles are drawn under the current one from a ring buffer.
+    Cycles are grouped by age into at most OVERLAY_BANDS curves, older bands fade out, so the
+    number of painted items does not depend on n. A new cycle sets data of the newest band only,
+    a view of the ring buffer."""
     def __init__(self):
         super().__init__()
         self.getPlotItem().showGrid(x=True, y=True)
@@ -17,30 +27,78 @@ class PlotWidget(pg.PlotWidget):
 
         self.legenditem.setVisible(False)
 
-    def plot_answer(self, times, resistances):
+        self.answer_curve = pg.PlotDataItem()
+        self.answer_curve.setZValue(1)
+        self.overlay_curves = []
+        self._band_size = 1
+        self._overlay_times = None
+        self._overlay_resistances = None
+        self._overlay_cycles = 0
+        self._mode = None
+
+    def _show_answer_items(self):
         self.getPlotItem().clear()
         self.legenditem.setVisible(False)
         self.getPlotItem().setLogMode(y=True)
         self.getPlotItem().setLabel("left", "Resistance", units="Ω")
         self.getPlotItem().setLabel("bottom", "Time", units="ds")
-        self.plot(x=times, y=resistances)
+        for curve in self.overlay_curves:
+            self.addItem(curve)
+        self.addItem(self.answer_curve)
+        self._mode = "answer"
+
+    def set_overlay(self, cycles):
+        """Show last cycles answers, 0 turns the overlay off"""
+        if self._mode == "answer":
+            for curve in self.overlay_curves:
+                self.removeItem(curve)
+        self._band_size = -(-cycles // OVERLAY_BANDS)
+        self.overlay_curves = []
+        for _ in range(-(-cycles // self._band_size) if cycles else 0):
+            # NaN ends every cycle in the ring buffer, so a band is one path of separate cycles
+            curve = pg.PlotDataItem(pen=pg.mkPen(OVERLAY_COLOR), connect="finite")
+            self.overlay_curves.append(curve)
+            if self._mode == "answer":
+                self.addItem(curve)
+        self._overlay_times = self._overlay_resistances = None
+        self._overlay_cycles = 0
+
+    def _add_to_overlay(self, times, resistances):
+        bands = len(self.overlay_curves)
+        if self._overlay_times is None or self._overlay_times.shape[1] != len(times) + 1:
+            self._overlay_times = np.full((bands * self._band_size, len(times) + 1), np.nan)
+            self._overlay_resistances = np.full((bands * self._band_size, len(resistances) + 1), np.nan)
+            self._overlay_cycles = 0
+            for curve in self.overlay_curves:
+                curve.clear()
+        band, position = divmod(self._overlay_cycles, self._band_size)
+        start = band % bands * self._band_size
+        self._overlay_times[start + position, :-1] = times
+        self._overlay_resistances[start + position, :-1] = resistances
+        self._overlay_cycles += 1
+        self.overlay_curves[band % bands].setData(x=self._overlay_times[start:start + position + 1].ravel(),
+                                                  y=self._overlay_resistances[start:start + position + 1].ravel())
+        if position == 0:
+            # the oldest band was replaced by the new one
+            for age in range(min(band + 1, bands)):
+                self.overlay_curves[(band - age) % bands].setOpacity(OVERLAY_OPACITY * (1 - age / bands))
+
+    def plot_answer(self, times, resistances):
+        if self._mode != "answer":
+            self._show_answer_items()
+        if self.overlay_curves:
+            self._add_to_overlay(times, resistances)
+        self.answer_curve.setData(x=times, y=resistances)
 
     def plot_heater_calibration(self, voltages, temperatures,
                                 ms_voltages, ms_temperatures,
                                 ms_voltages_recalc, ms_temperatures_recalc,
                                 voltages_cal, temperatures_cal, heater_params = None):
+        self._mode = "calibration"
         self.getPlotItem().clear()
         self.getPlotItem().setLogMode(y=False)
         self.getPlotItem().setLabel("left", "Temperature", units="°C")
         self.getPlotItem().setLabel("bottom", "Voltage", units="V")
-        data = np.hstack([voltages, temperatures, ms_voltages, ms_temperatures]).reshape((2, -1)).T
-        data2 = np.hstack([ms_voltages, ms_temperatures]).reshape((2, -1)).T
-        data3 = np.hstack([ms_voltages_recalc, ms_temperatures_recalc]).reshape((2, -1)).T
-        data4 = np.hstack([voltages_cal, temperatures_cal]).reshape((2, -1)).T
-        np.savetxt(pathlib.Path.cwd() / "pasha_version.csv", data)
-        np.savetxt(pathlib.Path.cwd() / "ms_version.csv", data2)
-        np.savetxt(pathlib.Path.cwd() / "ms_version_recalc.csv", data3)
-        np.savetxt(pathlib.Path.cwd() / "pasha_cal_version.csv", data4)
         line1 = self.plot(x=voltages, y=temperatures, pen=pg.mkPen("green"))
         line2 = self.plot(x=ms_voltages, y=ms_temperatures, pen=pg.mkPen("blue"))
         line3 = self.plot(x=ms_voltages_recalc, y=ms_temperatures_recalc, pen=pg.mkPen("red"))
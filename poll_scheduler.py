@@ -0,0 +1,70 @@
+import time
+import typing
+
+
+class PollScheduler():
+    """Picks the delay to the next device poll from the device state.
+
+    Durations of states are either given with expect() or learnt from observed transitions.
+    Far from the expected end of a state polls are rare, up to longest apart. Within margin
+    plus spread part of the duration around the end polls get closer as the end approaches,
+    approach part of the time left but not more often than every fast seconds, and become
+    rarer again if the state lasts longer than expected.
+    States with unknown duration are polled every default seconds, so are states which are not int,
+    e.g. raw answers of the device to a state missing in DEVICE_STATE. Time is monotonic."""
+    def __init__(self, fast=0.1, default=1.0, longest=5.0, margin=0.5, spread=0.1, approach=0.25,
+                 smoothing=0.5, clock: typing.Callable[[], float] = time.monotonic):
+        self.fast = fast
+        self.default = default
+        self.longest = longest
+        self.margin = margin
+        self.spread = spread
+        self.approach = approach
+        self.smoothing = smoothing
+        self.clock = clock
+        self.expected = {}
+        self.learnt = {}
+        self.state = None
+        self.entered = None
+        self.entered_exactly = False
+        self.polls = 0
+
+    def expect(self, state, duration):
+        """Known duration of state, e.g. of IDLE and EXHALE when the measurement is triggered by us"""
+        self.expected[state] = duration
+
+    def duration(self, state) -> typing.Optional[float]:
+        if not isinstance(state, int):
+            return None
+        return self.expected.get(state, self.learnt.get(state))
+
+    def time_in_state(self, now=None) -> float:
+        """For the first seen state counted from its first poll"""
+        if self.entered is None:
+            return 0.0
+        return (self.clock() if now is None else now) - self.entered
+
+    def update(self, state, now=None) -> float:
+        """Registers a poll result, returns the delay to the next poll, s"""
+        now = self.clock() if now is None else now
+        self.polls += 1
+        if not isinstance(state, int):
+            return self.default
+        if state != self.state:
+            if self.entered_exactly:
+                observed = now - self.entered
+                previous = self.learnt.get(self.state)
+                self.learnt[self.state] = observed if previous is None else \
+                    previous + self.smoothing * (observed - previous)
+            # start of the first seen state is unknown, it is neither learnt nor predicted
+            self.entered_exactly = self.state is not None
+            self.entered = now
+            self.state = state
+        duration = self.duration(state)
+        if duration is None or not self.entered_exactly:
+            return self.default
+        left = duration - (now - self.entered)
+        window = self.margin + self.spread * duration
+        if left > window:
+            return min(left - window, self.longest)
+        return min(max(abs(left) * self.approach, self.fast), self.default)
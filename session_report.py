@@ -0,0 +1,253 @@
+"""PNG and HTML reports of logged sessions without UI.
+
+A report is the last cycle over the previous ones, the waterfall of the session and the measured
+concentration against the set one by gas state, drawn by the widgets of the UI on an offscreen Qt
+platform and exported with pyqtgraph exporters. Sessions are DataLogger .log files and rotated
+sessions (.manifest.json), rendered in parallel processes, sessions with reports newer than the
+log are skipped.
+
+python session_report.py <logs directory> [--output DIR] [--processes N] [--force]
+"""
+import os
+import html
+import logging
+import pathlib
+import argparse
+import datetime
+import json
+import typing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from logger import record_dtype
+from log_loader import load_log
+from log_rotation import iter_session
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest.json"
+REPORT_SUFFIXES = (".last_cycle.png", ".waterfall.png", ".concentration.png", ".html")
+OVERLAY_CYCLES = 20
+IMAGE_WIDTH = 1000
+IMAGE_HEIGHT = 600
+# application log main.py writes next to the session logs
+NOT_SESSIONS = {"log.log"}
+EMPTY = "empty, skipped"
+
+
+def _is_data_log(path) -> bool:
+    """Empty or starting with a line of DataLogger values, 2 * points + 7 numbers"""
+    with open(path, "rb") as fd:
+        line = fd.readline(1 << 20)
+    if not line.strip():
+        return True
+    try:
+        width = len([float(value) for value in line.split()])
+    except ValueError:
+        return False
+    return width >= 9 and (width - 7) % 2 == 0
+
+
+def find_sessions(directory) -> typing.List[pathlib.Path]:
+    """Rotated session manifests and DataLogger .log files which are not their segments.
+    Other .log files, as the application log of main.py, and unreadable manifests are skipped"""
+    directory = pathlib.Path(directory)
+    manifests, segments = [], set()
+    for manifest in sorted(directory.glob("*" + MANIFEST_SUFFIX)):
+        try:
+            for segment in json.loads(manifest.read_text())["segments"]:
+                segments.update((segment["file"], segment["stored"]))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.info(f"{manifest.name}: skipped, can't read the manifest: {e!r}")
+            continue
+        manifests.append(manifest)
+    logs = []
+    for path in sorted(directory.glob("*.log")):
+        if path.name in segments or path.name in NOT_SESSIONS:
+            continue
+        if _is_data_log(path):
+            logs.append(path)
+        else:
+            logger.debug(f"{path.name}: skipped, not a DataLogger file")
+    return manifests + logs
+
+
+def session_name(source) -> str:
+    name = pathlib.Path(source).name
+    return name[:-len(MANIFEST_SUFFIX)] if name.endswith(MANIFEST_SUFFIX) else pathlib.Path(name).stem
+
+
+def report_files(source, output_directory) -> typing.List[pathlib.Path]:
+    return [pathlib.Path(output_directory) / (session_name(source) + suffix) for suffix in REPORT_SUFFIXES]
+
+
+def _source_mtime(source) -> int:
+    """Of a manifest, the latest of it and its segments, the current segment grows without it"""
+    source = pathlib.Path(source)
+    mtimes = [source.stat().st_mtime_ns]
+    if source.name.endswith(MANIFEST_SUFFIX):
+        for segment in json.loads(source.read_text())["segments"]:
+            for name in {segment["file"], segment["stored"]}:
+                try:
+                    mtimes.append((source.parent / name).stat().st_mtime_ns)
+                except FileNotFoundError:
+                    pass
+    return max(mtimes)
+
+
+def up_to_date(source, output_directory) -> bool:
+    try:
+        oldest = min(path.stat().st_mtime_ns for path in report_files(source, output_directory))
+    except FileNotFoundError:
+        return False
+    return oldest >= _source_mtime(source)
+
+
+def _load(source) -> np.ndarray:
+    """Records of the session, empty when it has none yet"""
+    source = pathlib.Path(source)
+    if source.name.endswith(MANIFEST_SUFFIX):
+        segments = list(iter_session(source))
+        return np.concatenate(segments) if segments else np.zeros(0, dtype=record_dtype(0))
+    return load_log(source)
+
+
+def _state_rows(records) -> typing.List[typing.Tuple[int, int, float, float, float]]:
+    """State, cycles, mean set and measured concentration, rms deviation; of cycles with known set"""
+    rows = []
+    for state in np.unique(records["state"]):
+        selected = records[records["state"] == state]
+        known = selected[selected["conc_set"] >= 0]
+        if len(known):
+            deviation = known["conc"] - known["conc_set"]
+            rows.append((int(state), len(selected), float(known["conc_set"].mean()), float(known["conc"].mean()),
+                         float(np.sqrt(np.mean(deviation ** 2)))))
+        else:
+            rows.append((int(state), len(selected), np.nan, float(selected["conc"].mean()), np.nan))
+    return rows
+
+
+def _html(source, records, images, state_rows) -> str:
+    if len(records):
+        span = " – ".join(datetime.datetime.fromtimestamp(records["timestamp"][i]).isoformat(sep=" ", timespec="seconds")
+                          for i in (0, -1))
+    else:
+        span = "no cycles"
+    table = "\n".join(f"<tr><td>{state}</td><td>{cycles}</td><td>{conc_set:.4g}</td><td>{conc:.4g}</td>"
+                      f"<td>{deviation:.4g}</td></tr>" for state, cycles, conc_set, conc, deviation in state_rows)
+    figures = "\n".join(f"<p><img src=\"{html.escape(image.name)}\"></p>" for image in images)
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(session_name(source))}</title></head>
+<body>
+<h1>{html.escape(session_name(source))}</h1>
+<p>{html.escape(str(source))}: {len(records)} cycles, {span}</p>
+{figures}
+<table border="1">
+<tr><th>State</th><th>Cycles</th><th>Set conc</th><th>Measured conc</th><th>RMS deviation</th></tr>
+{table}
+</table>
+</body></html>
+"""
+
+
+def render_session(source, output_directory) -> typing.List[pathlib.Path]:
+    """Writes the report of one session, the HTML page last, nothing for a session without
+    records. Runs in a worker process, Qt is imported here so the parent process never starts it."""
+    records = _load(source)
+    if not len(records):
+        return []
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import pyqtgraph as pg
+    import pyqtgraph.exporters
+    from plot_widget import PlotWidget
+    from waterfall_widget import WaterfallWidget
+
+    pg.mkQApp()
+    *images, page = report_files(source, output_directory)
+    last_cycle_image, waterfall_image, concentration_image = images
+    times = np.arange(records["resistances"].shape[1], dtype=float)[1:]
+
+    def export(widget, filename):
+        widget.resize(IMAGE_WIDTH, IMAGE_HEIGHT)
+        exporter = pg.exporters.ImageExporter(widget.getPlotItem())
+        exporter.parameters()["width"] = IMAGE_WIDTH
+        exporter.export(str(filename))
+
+    plot_widget = PlotWidget()
+    plot_widget.set_overlay(OVERLAY_CYCLES)
+    plot_widget.getPlotItem().setTitle("Last cycle")
+    for record in records[-OVERLAY_CYCLES - 1:]:
+        plot_widget.plot_answer(times, record["resistances"][1:])
+    export(plot_widget, last_cycle_image)
+
+    waterfall_widget = WaterfallWidget()
+    if len(records):
+        resistances = records["resistances"][:, 1:]
+        waterfall_widget.add_cycles(times, resistances)
+        # the whole session is known, so levels are not from the first cycle only
+        low, high = np.percentile(np.log10(np.maximum(resistances, 1e-3)), (1, 99))
+        waterfall_widget.set_levels(low, max(high, low + 0.1))
+    export(waterfall_widget, waterfall_image)
+
+    concentration_widget = pg.PlotWidget()
+    plot_item = concentration_widget.getPlotItem()
+    plot_item.showGrid(x=True, y=True)
+    plot_item.setLabel("bottom", "Set H2 conc", units="ppm")
+    plot_item.setLabel("left", "Measured H2 conc", units="ppm")
+    plot_item.addLegend()
+    known = records[records["conc_set"] >= 0]
+    if len(known):
+        limits = [min(known["conc_set"].min(), 0), known["conc_set"].max()]
+        plot_item.plot(limits, limits, pen=pg.mkPen("w", style=pg.QtCore.Qt.DashLine))
+    states = np.unique(known["state"])
+    for i, state in enumerate(states):
+        selected = known[known["state"] == state]
+        plot_item.plot(selected["conc_set"], selected["conc"], pen=None, symbol="o", symbolSize=5,
+                       symbolBrush=pg.intColor(i, len(states)), name=f"state {state}")
+    export(concentration_widget, concentration_image)
+
+    temporary = page.with_name(page.name + ".tmp")
+    temporary.write_text(_html(source, records, images, _state_rows(records)), encoding="utf-8")
+    os.replace(temporary, page)
+    return images + [page]
+
+
+def render_reports(directory, output_directory=None, processes=None, force=False) -> typing.Dict[pathlib.Path, str]:
+    """Renders every session of directory without an up to date report, returns the sessions
+    rendered with "ok", EMPTY for sessions without records or the error"""
+    output_directory = pathlib.Path(directory if output_directory is None else output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+    sources = [source for source in find_sessions(directory) if force or not up_to_date(source, output_directory)]
+    results = {}
+    if not sources:
+        return results
+    with ProcessPoolExecutor(processes) as executor:
+        futures = {executor.submit(render_session, source, output_directory): source for source in sources}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                results[source] = "ok" if future.result() else EMPTY
+            except Exception as e:
+                results[source] = repr(e)
+            logger.info(f"{source.name}: {results[source]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render PNG and HTML reports of logged sessions")
+    parser.add_argument("directory", help=f"Directory of .log files and {MANIFEST_SUFFIX} rotated sessions")
+    parser.add_argument("--output", default=None, help="Directory for reports, the logs directory by default")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes, CPU count by default")
+    parser.add_argument("--force", action="store_true", help="Render reports which are up to date too")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    results = render_reports(args.directory, args.output, args.processes, args.force)
+    empty = sum(result == EMPTY for result in results.values())
+    failed = sum(result not in ("ok", EMPTY) for result in results.values())
+    logger.info(f"{len(results) - failed - empty} reports rendered, {empty} empty sessions skipped, {failed} failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+"""Device firmware simulator behind Linux pseudo-terminals.
+
+Speaks the framed protocol of device.py for every COMMAND_NUM, runs the
+IDLE/EXHALE/MEASURING/PURGING cycle, OTA and model update sessions, and can emulate
+baud rate, per-command latency, lost answers and corrupted bytes. Open the printed
+/dev/pts/N with MSDesktopDevice like a real port.
+
+python simulator.py --devices 2 --baudrate 115200 --corrupt 1e-5
+"""
+import os
+import tty
+import enum
+import time
+import heapq
+import random
+import select
+import struct
+import logging
+import argparse
+import multiprocessing
+
+import numpy as np
+
+import framing
+from device import (COMMAND_NUM, DEVICE_STATE, STATUS_CODE, DOTS_NUMBER, DOTS_IN_PASHA_CALIBRATION,
+                    OTA_CHUNK_SIZE, MODEL_CHUNK_SIZE, CRCCalculator,
+                    _FLOAT, _CYCLE_SETTINGS, _HEATER_PARAMS, _HEATER_CAL_TRANSFORM, _MODEL_UPDATE_INIT)
+
+logger = logging.getLogger(__name__)
+
+
+class STATUS_BIT(enum.IntEnum):
+    HEATER = 0
+    MEASUREMENT = 1
+    SOFTWARE_INIT = 2
+    UNKNOWN_COMMAND = 3
+    MISSED_PACKET = 4
+    UART_PARSER = 5
+    INCORRECT_FORMAT = 6
+
+
+OK, ERROR, BUSY = (bytes((code,)) for code in STATUS_CODE)
+
+
+class SimulatedFirmware():
+    """Device side of the protocol: takes command frames, returns answer bodies and keeps device state.
+
+    trigger_measurement starts EXHALE for the requested time, then MEASURING and PURGING
+    for measuring and purging seconds. Cycle and result appear when PURGING starts and
+    are cleared by get_cycle and get_result. autorun triggers a new cycle idle seconds
+    after the previous one, like a device left measuring on its own."""
+    def __init__(self, measuring=2.0, purging=3.0, autorun=False, idle=1.0, exhale=2.0,
+                 concentration=10.0, ota_flash_time=0.03, seed=None):
+        self.crc = CRCCalculator()
+        self.random = random.Random(seed)
+        self.counter = 0
+        self.status = 0
+        self.measuring = measuring
+        self.purging = purging
+        self.autorun = autorun
+        self.idle = idle
+        self.exhale = exhale
+        self.concentration = concentration
+        self.ota_flash_time = ota_flash_time
+
+        self.state = DEVICE_STATE.IDLE
+        self.state_until = time.monotonic() + idle if autorun else float("inf")
+        self.have_data = False
+        self.have_result = False
+        self.cycle = b""
+        self.result = b""
+
+        self.heater = (0.0039, 10.0, 10.0)
+        self.meas = (1e4, 1e5)
+        self.cycle_temperatures = np.concatenate((np.linspace(100, 450, DOTS_NUMBER // 2),
+                                                  np.linspace(450, 100, DOTS_NUMBER - DOTS_NUMBER // 2)))
+        self.heater_calibration = np.linspace(0.3, 5, num=DOTS_IN_PASHA_CALIBRATION, dtype="<f4").tobytes()
+        self.heater_params = _HEATER_PARAMS.pack(120, 10, 31, 14, 12, 1242, 12, 12, True)
+        self.heater_cal_transform = _HEATER_CAL_TRANSFORM.pack(1.01, -0.02)
+        self.t_ambient = 296.5
+        self._measure()
+        self.have_data = self.have_result = False
+
+        self.ota = None
+        self.ota_busy_until = 0
+        self.firmware_image = b""
+        self.model = None
+        self.model_header = None
+        self.model_image = b""
+
+        self.handlers = {
+            COMMAND_NUM.TRIGGER_MEASUREMENT: self._trigger_measurement,
+            COMMAND_NUM.GET: self._get_cycle,
+            COMMAND_NUM.STATUS: self._get_status,
+            COMMAND_NUM.SET_HEATER: self._set_heater,
+            COMMAND_NUM.SET_MEAS: self._set_meas,
+            COMMAND_NUM.SET_CYCLE: self._set_cycle,
+            COMMAND_NUM.HAVE_DATA: lambda payload: OK if self.have_data else ERROR,
+            COMMAND_NUM.DUMP_NVS: lambda payload: OK,
+            COMMAND_NUM.SAVE: lambda payload: OK,
+            COMMAND_NUM.GET_RESULT: self._get_result,
+            COMMAND_NUM.GET_HAVE_RESULT: lambda payload: OK if self.have_result else ERROR,
+            COMMAND_NUM.GET_HEATER_CAL: lambda payload: self.heater_calibration,
+            COMMAND_NUM.GET_STATE: lambda payload: bytes((self.state,)),
+            COMMAND_NUM.START_OTA: self._start_ota,
+            COMMAND_NUM.CHUNK_OTA: self._chunk_ota,
+            COMMAND_NUM.OTA_GET_READY: self._ota_ready,
+            COMMAND_NUM.CMD_OTA_FINALIZE: self._finalize_ota,
+            COMMAND_NUM.CMD_OTA_ABORT: self._abort_ota,
+            COMMAND_NUM.CMD_GET_AMBIENT_TEMP: self._get_ambient_temp,
+            COMMAND_NUM.CMD_GET_HEATER_PARAMS: lambda payload: self.heater_params,
+            COMMAND_NUM.CMD_GET_HEATER_CAL_TRANSFORM: lambda payload: self.heater_cal_transform,
+            COMMAND_NUM.CMD_MODEL_UPDATE_INIT: self._model_update_init,
+            COMMAND_NUM.CMD_MODEL_CHUNK: self._model_chunk,
+            COMMAND_NUM.CMD_MODEL_FINALIZE: self._model_finalize,
+        }
+
+    def _set_status(self, bit):
+        self.status |= 1 << bit
+
+    def _format_error(self):
+        self._set_status(STATUS_BIT.INCORRECT_FORMAT)
+        return ERROR
+
+    def advance(self, now=None):
+        """Moves the measurement cycle to now"""
+        now = time.monotonic() if now is None else now
+        while now >= self.state_until:
+            if self.state == DEVICE_STATE.IDLE:
+                self._start_cycle(self.exhale, self.state_until)
+            elif self.state == DEVICE_STATE.EXHALE:
+                self.state, self.state_until = DEVICE_STATE.MEASURING, self.state_until + self.measuring
+            elif self.state == DEVICE_STATE.MEASURING:
+                self._measure()
+                self.state, self.state_until = DEVICE_STATE.PURGING, self.state_until + self.purging
+            else:
+                self.state = DEVICE_STATE.IDLE
+                self.state_until = self.state_until + self.idle if self.autorun else float("inf")
+
+    def _start_cycle(self, exhale, started):
+        self.state, self.state_until = DEVICE_STATE.EXHALE, started + exhale
+
+    def _measure(self):
+        temperatures = self.cycle_temperatures.astype("<f4")
+        resistances = 1e6 * np.exp(-(temperatures - 100) / 120) / (1 + 0.05 * self.concentration)
+        resistances *= 1 + 0.01 * np.array([self.random.gauss(0, 1) for _ in range(DOTS_NUMBER)])
+        cycle = np.empty((DOTS_NUMBER, 2), dtype="<f4")
+        cycle[:, 0], cycle[:, 1] = resistances, temperatures
+        self.cycle = cycle.tobytes()
+        self.result = _FLOAT.pack(self.concentration * (1 + self.random.gauss(0, 0.02)))
+        self.have_data = self.have_result = True
+
+    def _trigger_measurement(self, payload):
+        if len(payload) != _FLOAT.size:
+            return self._format_error()
+        if self.state != DEVICE_STATE.IDLE:
+            return ERROR
+        exhale, = _FLOAT.unpack(payload)
+        self._start_cycle(max(exhale, 0), time.monotonic())
+        return OK
+
+    def _get_cycle(self, payload):
+        self.have_data = False
+        return self.cycle
+
+    def _get_result(self, payload):
+        self.have_result = False
+        return self.result
+
+    def _get_status(self, payload):
+        status, self.status = self.status, 0
+        return status.to_bytes(4, "little")
+
+    def _set_heater(self, payload):
+        if len(payload) != 3 * _FLOAT.size:
+            return self._format_error()
+        self.heater = struct.unpack("<fff", payload)
+        return OK
+
+    def _set_meas(self, payload):
+        if len(payload) != 2 * _FLOAT.size:
+            return self._format_error()
+        self.meas = struct.unpack("<ff", payload)
+        return OK
+
+    def _set_cycle(self, payload):
+        if len(payload) != _CYCLE_SETTINGS.size:
+            return self._format_error()
+        self.cycle_temperatures = np.array(_CYCLE_SETTINGS.unpack(payload))
+        return OK
+
+    def _get_ambient_temp(self, payload):
+        self.t_ambient += self.random.gauss(0, 0.01)
+        return _FLOAT.pack(self.t_ambient)
+
+    def _start_ota(self, payload):
+        if self.state != DEVICE_STATE.IDLE or self.model is not None:
+            return ERROR
+        self.ota = bytearray()
+        return OK
+
+    def _chunk_ota(self, payload):
+        if self.ota is None or time.monotonic() < self.ota_busy_until:
+            return ERROR
+        if len(payload) != OTA_CHUNK_SIZE:
+            return self._format_error()
+        self.ota.extend(payload)
+        self.ota_busy_until = time.monotonic() + self.ota_flash_time
+        return OK
+
+    def _ota_ready(self, payload):
+        if self.ota is None:
+            return ERROR
+        return BUSY if time.monotonic() < self.ota_busy_until else OK
+
+    def _finalize_ota(self, payload):
+        if self.ota is None or time.monotonic() < self.ota_busy_until:
+            return ERROR
+        self.firmware_image, self.ota = bytes(self.ota), None
+        return OK
+
+    def _abort_ota(self, payload):
+        self.ota = None
+        return OK
+
+    def _model_update_init(self, payload):
+        if len(payload) != _MODEL_UPDATE_INIT.size:
+            return self._format_error()
+        if self.ota is not None:
+            return ERROR
+        self.model_header = _MODEL_UPDATE_INIT.unpack(payload)
+        self.model = bytearray()
+        return OK
+
+    def _model_chunk(self, payload):
+        if self.model is None:
+            return ERROR
+        _, length, _ = self.model_header
+        if not 0 < len(payload) <= MODEL_CHUNK_SIZE or len(self.model) + len(payload) > length:
+            return self._format_error()
+        self.model.extend(payload)
+        return OK
+
+    def _model_finalize(self, payload):
+        if self.model is None:
+            return ERROR
+        _, length, crc = self.model_header
+        model, self.model = bytes(self.model), None
+        if len(model) != length or self.crc.calc(model) != crc:
+            return ERROR
+        self.model_image = model
+        return OK
+
+    def answer(self, frame):
+        """Answer body for one unescaped command frame, None when the frame is dropped like by firmware"""
+        if len(frame) < 6:
+            self._set_status(STATUS_BIT.UART_PARSER)
+            return None
+        if self.crc(frame[:-4]) != frame[-4:]:
+            self._set_status(STATUS_BIT.MISSED_PACKET)
+            return None
+        command, payload = frame[0], bytes(frame[1:-5])
+        self.advance()
+        try:
+            handler = self.handlers[COMMAND_NUM(command)]
+        except (ValueError, KeyError):
+            self._set_status(STATUS_BIT.UNKNOWN_COMMAND)
+            answer = ERROR
+        else:
+            answer = handler(payload)
+        body = bytearray((command,))
+        body.extend(answer)
+        body.append(self.counter)
+        self.counter = (self.counter + 1) & 0xFF
+        body.extend(self.crc(body))
+        return body
+
+
+class SimulatedLink():
+    """One pty with its firmware. Answers leave after the command has arrived at baudrate,
+    latency of the command has passed and the previous answer is sent, and are written
+    piece by piece as the bytes would come out of a UART."""
+    def __init__(self, firmware: SimulatedFirmware, baudrate=None, latency=0.0005, latencies=None,
+                 corrupt=0.0, drop=0.0, seed=None):
+        self.firmware = firmware
+        self.baudrate = baudrate
+        self.latency = latency
+        self.latencies = {} if latencies is None else latencies
+        self.corrupt = corrupt
+        self.drop = drop
+        self.random = random.Random(seed)
+        self.reader = framing.FrameReader()
+        self.busy_until = 0
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+
+    def transfer_time(self, size):
+        return size * 10 / self.baudrate if self.baudrate else 0
+
+    def _damage(self, data):
+        if self.corrupt:
+            for position in range(len(data)):
+                if self.random.random() < self.corrupt:
+                    data[position] ^= 1 << self.random.randrange(8)
+        return data
+
+    def receive(self, data, now):
+        """Schedules (time, bytes) pieces to write for every complete command in data"""
+        self.reader.feed(data)
+        pieces = []
+        arrived = now + self.transfer_time(len(data))
+        for frame in self.reader.frames():
+            body = self.firmware.answer(frame)
+            if body is None or self.random.random() < self.drop:
+                continue
+            latency = self.latencies.get(frame[0], self.latency)
+            answer = self._damage(framing.encode_frame(body))
+            sent = max(arrived + latency, self.busy_until)
+            piece = max(self.baudrate // 10 // 1000, 1) if self.baudrate else len(answer)
+            for start in range(0, len(answer), piece):
+                sent += self.transfer_time(len(answer[start:start + piece]))
+                pieces.append((sent, bytes(answer[start:start + piece])))
+            self.busy_until = sent
+        return pieces
+
+
+def serve(links, stop_event=None):
+    """Event loop of the simulator, returns when stop_event is set"""
+    by_fd = {link.master: link for link in links}
+    scheduled = []
+    order = 0
+    while stop_event is None or not stop_event.is_set():
+        timeout = max(scheduled[0][0] - time.perf_counter(), 0) if scheduled else 0.1
+        readable, _, _ = select.select(list(by_fd), [], [], timeout)
+        now = time.perf_counter()
+        for fd in readable:
+            for sent, piece in by_fd[fd].receive(os.read(fd, 65536), now):
+                heapq.heappush(scheduled, (sent, order, fd, piece))
+                order += 1
+        while scheduled and scheduled[0][0] <= time.perf_counter():
+            _, _, fd, piece = heapq.heappop(scheduled)
+            os.write(fd, piece)
+
+
+def spawn(number=1, firmware_options=None, **link_options):
+    """Starts a child process serving number simulated devices.
+    Returns the process and pty names, terminate the process when done"""
+    links = [SimulatedLink(SimulatedFirmware(**(firmware_options or {})), **link_options) for _ in range(number)]
+    process = multiprocessing.get_context("fork").Process(target=serve, args=(links,), daemon=True)
+    process.start()
+    return process, [link.name for link in links]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated devices on pseudo-terminals")
+    parser.add_argument("--devices", type=int, default=1, help="Number of simulated devices")
+    parser.add_argument("--baudrate", type=int, default=None, help="Emulated baud rate, unlimited by default")
+    parser.add_argument("--latency", type=float, default=0.0005, help="Processing time of a command, s")
+    parser.add_argument("--command-latency", action="append", default=[], metavar="COMMAND=SECONDS",
+                        help="Processing time of one command, e.g. GET=0.02, repeatable")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="Probability to flip a bit in an answer byte")
+    parser.add_argument("--drop", type=float, default=0.0, help="Probability to lose an answer")
+    parser.add_argument("--autorun", action="store_true", help="Run measurement cycles without trigger")
+    parser.add_argument("--measuring", type=float, default=2.0, help="MEASURING state time, s")
+    parser.add_argument("--purging", type=float, default=3.0, help="PURGING state time, s")
+    parser.add_argument("--concentration", type=float, default=10.0, help="H2 concentration of results, ppm")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    latencies = {}
+    for item in args.command_latency:
+        name, _, seconds = item.partition("=")
+        latencies[COMMAND_NUM[name].value] = float(seconds)
+    links = [SimulatedLink(SimulatedFirmware(measuring=args.measuring, purging=args.purging, autorun=args.autorun,
+                                             concentration=args.concentration, seed=args.seed),
+                           baudrate=args.baudrate, latency=args.latency, latencies=latencies,
+                           corrupt=args.corrupt, drop=args.drop, seed=args.seed)
+             for _ in range(args.devices)]
+    for link in links:
+        logger.info(f"Simulated device on {link.name}")
+    try:
+        serve(links)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import time
+import typing
+
+import numpy as np
+import pyqtgraph as pg
+
+PYRAMID_FACTOR = 4
+
+
+class MinMaxPyramid():
+    """Time series with min/max of every factor ** level points for levels 1, 2, ...
+
+    extend() updates only the last bins of every level. view() returns at most about max_points
+    points of the time range from the coarsest level keeping the detail, a bin is drawn as its
+    min and max, so peaks never disappear. Times must not decrease, NaN values are skipped."""
+    def __init__(self, factor=PYRAMID_FACTOR):
+        self.factor = factor
+        self.size = 0
+        # level 0 is raw points: times, values; higher levels: bin start times, minimums, maximums
+        self.levels = [[np.empty(0), np.empty(0)]]
+        self._bins = [0]
+
+    @staticmethod
+    def _reserve(arrays, size):
+        if size > len(arrays[0]):
+            capacity = max(size, 2 * len(arrays[0]), 1024)
+            for i, array in enumerate(arrays):
+                grown = np.empty(capacity)
+                grown[:len(array)] = array
+                arrays[i] = grown
+
+    def extend(self, times, values):
+        times, values = np.atleast_1d(times).astype(float), np.atleast_1d(values).astype(float)
+        start, self.size = self.size, self.size + len(times)
+        raw = self.levels[0]
+        self._reserve(raw, self.size)
+        raw[0][start:self.size], raw[1][start:self.size] = times, values
+        # every level is reduced from the one below, only bins over changed children are redone
+        children, changed, count = (raw[0], raw[1], raw[1]), start, self.size
+        level = 1
+        while count > 1:
+            if level == len(self.levels):
+                self.levels.append([np.empty(0), np.empty(0), np.empty(0)])
+                self._bins.append(0)
+            arrays = self.levels[level]
+            # a new level is filled from the beginning
+            first = min(changed // self.factor, self._bins[level])
+            edges = np.arange(first * self.factor, count, self.factor)
+            self._bins[level] = first + len(edges)
+            self._reserve(arrays, self._bins[level])
+            arrays[0][first:self._bins[level]] = children[0][edges]
+            arrays[1][first:self._bins[level]] = np.fmin.reduceat(children[1][edges[0]:count], edges - edges[0])
+            arrays[2][first:self._bins[level]] = np.fmax.reduceat(children[2][edges[0]:count], edges - edges[0])
+            children, changed, count = arrays, first, self._bins[level]
+            level += 1
+
+    def view(self, start=-np.inf, end=np.inf, max_points=2000) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Times and values to draw start..end, with a point beyond each end to keep the line going"""
+        raw_times = self.levels[0][0][:self.size]
+        first, last = np.searchsorted(raw_times, (start, end))
+        first, last = max(first - 1, 0), min(last + 1, self.size)
+        level, points = 0, last - first
+        while points > max_points and level + 1 < len(self.levels):
+            level += 1
+            points = 2 * ((last - first) // self.factor ** level)
+        if level == 0:
+            return raw_times[first:last], self.levels[0][1][first:last]
+        bin_size = self.factor ** level
+        first, last = first // bin_size, min(-(-last // bin_size), self._bins[level])
+        times, minimums, maximums = (array[first:last] for array in self.levels[level])
+        return np.repeat(times, 2), np.column_stack((minimums, maximums)).ravel()
+
+
+class TrendWidget(pg.GraphicsLayoutWidget):
+    """Measured and set H2 concentration and ambient temperature over the session, x linked.
+
+    Curves are refilled from MinMaxPyramid for the visible range when it changes and when
+    points are added."""
+    def __init__(self):
+        super().__init__()
+        self.concentration_plot = self.addPlot(row=0, col=0, axisItems={"bottom": pg.DateAxisItem()})
+        self.concentration_plot.setLabel("left", "H2 conc", units="ppm")
+        self.concentration_plot.showGrid(x=True, y=True)
+        self.concentration_plot.addLegend()
+        self.temperature_plot = self.addPlot(row=1, col=0, axisItems={"bottom": pg.DateAxisItem()})
+        self.temperature_plot.setLabel("left", "T_amb", units="K")
+        self.temperature_plot.showGrid(x=True, y=True)
+        self.temperature_plot.setXLink(self.concentration_plot)
+
+        self.series = {"h2conc": MinMaxPyramid(), "conc_set": MinMaxPyramid(), "t_ambient": MinMaxPyramid()}
+        self.curves = {"h2conc": self.concentration_plot.plot(pen=pg.mkPen("c"), name="measured"),
+                       "conc_set": self.concentration_plot.plot(pen=pg.mkPen("y"), name="set"),
+                       "t_ambient": self.temperature_plot.plot(pen=pg.mkPen("r"))}
+        self._updating = False
+        self.concentration_plot.sigXRangeChanged.connect(self.update_curves)
+
+    def clear_series(self):
+        self.series = {name: MinMaxPyramid() for name in self.series}
+        self.update_curves()
+
+    def add_concentration(self, measured, conc_set, timestamp=None):
+        """conc_set below zero means no known concentration"""
+        timestamp = time.time() if timestamp is None else timestamp
+        conc_set = float(conc_set)
+        self.series["h2conc"].extend(timestamp, measured)
+        self.series["conc_set"].extend(timestamp, conc_set if conc_set >= 0 else np.nan)
+        self.update_curves()
+
+    def add_t_ambient(self, t_ambient, timestamp=None):
+        self.series["t_ambient"].extend(time.time() if timestamp is None else timestamp, t_ambient)
+        self.update_curves()
+
+    def update_curves(self):
+        if self._updating:
+            return
+        self._updating = True
+        try:
+            view_box = self.concentration_plot.getViewBox()
+            if view_box.autoRangeEnabled()[0]:
+                start, end = -np.inf, np.inf
+            else:
+                start, end = view_box.viewRange()[0]
+            max_points = 2 * max(int(view_box.width()), 100)
+            for name, pyramid in self.series.items():
+                times, values = pyramid.view(start, end, max_points)
+                self.curves[name].setData(times, values, connect="finite")
+        finally:
+            self._updating = False
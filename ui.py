@@ -2,23 +2,28 @@ import sys
 from PySide2 import QtWidgets, QtCore
 from PySide2.QtGui import QIntValidator
 
-from device import MSDesktopDevice, CRCCalculator, PlaceHolderDevice
+from device import MSDesktopDevice, CRCCalculator, PlaceHolderDevice, DEVICE_STATE
+from device_service import DeviceService, Priority, poll_device, read_heater_calibration
+from upload import upload_firmware_file, upload_model_file
 from settings_widget import SettingsWidget
 from plot_widget import PlotWidget
-from logger import DataLogger
+from waterfall_widget import WaterfallWidget
+from trend_widget import TrendWidget
+from logger import QueuedDataLogger
+from log_rotation import RotatingDataLogger
 from gas_stand import set_gas_state, GasStandTimer
 from concentration_widget import ConcentrationWidget
+from metrics_widget import MetricsWidget
+from metrics import MetricsDumper
+from poll_scheduler import PollScheduler
+import heater_calibration
 import typing
 import logging
 import pathlib
-import configparser
-import numpy as np
-from time import sleep
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from itertools import repeat, chain
 
-if typing.TYPE_CHECKING:
-    from device import HeaterCalTransformTuple, HeaterParamsTuple
-
 logger = logging.getLogger(__name__)
 
 def app():
@@ -43,6 +48,7 @@ def app():
         old_show_message(message)
 
     main_window.statusBar().showMessage = show_message_wrapper
+    main_widget.metrics_widget.data_lost.connect(main_window.statusBar().showMessage)
 
 
     settings_action = QtWidgets.QAction("Settings", main_window)
@@ -50,6 +56,7 @@ def app():
     settings_action.triggered.connect(settings_widget.toggle_visible)
 
     main_window.show()
+    app.aboutToQuit.connect(main_widget.close_data_loggers)
 
     sys.exit(app.exec_())
 
@@ -61,8 +68,10 @@ class MainWidget(QtWidgets.QWidget):
         self.gas_already_sent = False
 
         self.timer = QtCore.QTimer()
-        self.timer.setInterval(1000)
+        self.timer.setSingleShot(True)
         self.timer.timeout.connect(self.get_all_results)
+        self.measuring = False
+        self.poll_scheduler = PollScheduler()
 
         self.conc_widget = ConcentrationWidget(settings=settings)
 
@@ -75,8 +84,15 @@ class MainWidget(QtWidgets.QWidget):
 
 
         self.device_bench: typing.Optional[MSDesktopDevice] = None
+        self.device_service: typing.Optional[DeviceService] = None
+        self.metrics_dumper: typing.Optional[MetricsDumper] = None
+        self.poll_future = None
         self.data_logger_path = pathlib.Path.cwd()
-        self.data_logger = DataLogger(self.data_logger_path)
+        self.data_logger = QueuedDataLogger(RotatingDataLogger(self.data_logger_path))
+        # loggers of previous sessions still writing their last records
+        self.closing_data_loggers: typing.List[QueuedDataLogger] = []
+        # CSV and report export, keeps the GUI responsive on slow disks
+        self.export_executor = ThreadPoolExecutor(max_workers=1)
 
         main_layout = QtWidgets.QVBoxLayout(self)
 
@@ -178,8 +194,19 @@ class MainWidget(QtWidgets.QWidget):
 
         device_groupbox_layout.addLayout(need_to_wait_scientist_layout)
 
+        overlay_layout = QtWidgets.QFormLayout()
+        device_groupbox_layout.addLayout(overlay_layout)
+        self.overlay_spinbox = QtWidgets.QSpinBox()
+        self.overlay_spinbox.setRange(0, 100)
+        overlay_layout.addRow("Overlay of last cycles", self.overlay_spinbox)
+
+        plots_layout = QtWidgets.QHBoxLayout()
+        device_groupbox_layout.addLayout(plots_layout)
         self.plot_widget = PlotWidget()
-        device_groupbox_layout.addWidget(self.plot_widget)
+        plots_layout.addWidget(self.plot_widget)
+        self.waterfall_widget = WaterfallWidget()
+        plots_layout.addWidget(self.waterfall_widget)
+        self.overlay_spinbox.valueChanged.connect(self.plot_widget.set_overlay)
 
 
         labels_layout_device_group = QtWidgets.QHBoxLayout()
@@ -191,6 +218,12 @@ class MainWidget(QtWidgets.QWidget):
         labels_layout_device_group.addWidget(self.t_ambient_label)
         labels_layout_device_group.addWidget(self.concentration_set_label)
 
+        self.trend_widget = TrendWidget()
+        device_groupbox_layout.addWidget(self.trend_widget)
+
+        self.metrics_widget = MetricsWidget()
+        self.metrics_widget.set_data_logger(self.data_logger)
+        device_groupbox_layout.addWidget(self.metrics_widget)
 
 
         main_layout.addWidget(device_groupbox)
@@ -206,19 +239,43 @@ class MainWidget(QtWidgets.QWidget):
 
 
     def init_device_bench(self):
-        crc = CRCCalculator()
         device_port = self.parent().settings_widget.get_device_port()
         if not device_port:
             msg_box = QtWidgets.QMessageBox()
             msg_box.setText("Не выбран порт устройства")
             msg_box.exec_()
             return
-        if self.device_bench is not None:
-            self.device_bench.ser.close()
-        if device_port != "test":
-            self.device_bench = MSDesktopDevice(device_port, crc)
+        if self.device_service is None:
+            self._open_device(device_port)
+        elif self.device_service.closing.is_set():
+            self.parent().statusBar().showMessage("Previous device is still closing")
         else:
-            self.device_bench = PlaceHolderDevice()
+            # a running upload stops after the current chunk, the port is opened again once the
+            # worker has closed it, a COM port can't be opened twice
+            self.device_service.close(callback=lambda future: self._open_device(device_port))
+
+    def _open_device(self, device_port):
+        crc = CRCCalculator()
+        if self.metrics_dumper is not None:
+            self.metrics_dumper.stop()
+            self.metrics_dumper = None
+        try:
+            if device_port != "test":
+                self.device_bench = MSDesktopDevice(device_port, crc)
+            else:
+                self.device_bench = PlaceHolderDevice()
+        except Exception as e:
+            self.device_bench = None
+            self.device_service = None
+            self.poll_future = None
+            self.parent().statusBar().showMessage(f"Can't open device port {device_port}: {e!r}")
+            return
+        self.metrics_widget.set_metrics(self.device_bench.metrics)
+        self.metrics_dumper = MetricsDumper(self.device_bench.metrics, self.data_logger_path / "link_metrics",
+                                            device=device_port)
+        self.device_service = DeviceService(self.device_bench, parent=self)
+        self.device_service.message.connect(self.parent().statusBar().showMessage)
+        self.poll_future = None
         self.parent().statusBar().showMessage("Device initiated")
 
     def _pre_device_command(self):
@@ -230,17 +287,24 @@ class MainWidget(QtWidgets.QWidget):
         else:
             return 1
 
+    def _show_device_error(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            self.parent().statusBar().showMessage(f"Device command failed: {future.exception()!r}")
+
     def read_device_status(self):
         if self._pre_device_command():
-            self.device_bench.get_status(self.parent().statusBar().showMessage)
+            self.device_service.submit("get_status", print=self.device_service.message.emit,
+                                       callback=self._show_device_error)
 
     def device_trigger_measurement(self):
         if self._pre_device_command():
-            self.device_bench.trigger_measurement(self.trigger_time_lineedit.text(), print=self.parent().statusBar().showMessage)
+            self.device_service.submit("trigger_measurement", self.trigger_time_lineedit.text(),
+                                       print=self.device_service.message.emit, callback=self._show_device_error)
 
     def device_get_have_data(self):
         if self._pre_device_command():
-            self.device_bench.get_have_data(self.parent().statusBar().showMessage)
+            self.device_service.submit("get_have_data", print=self.device_service.message.emit,
+                                       callback=self._show_device_error)
 
     def start_timer(self):
 
@@ -253,14 +317,25 @@ class MainWidget(QtWidgets.QWidget):
             msg_box.setText("Не, не начали. Укажите числовые целые значения в полях для времен ниже")
             msg_box.exec_()
         else:
-            self.already_waited = 0
+            self.triggered = False
             self.gas_already_sent = False
             self.gas_sensor_state = 0
             self.gas_iterator_state = 0
             self.gas_iterator_counter = 0
             self.prev_gas_iterator_state = None
-            self.data_logger = DataLogger(self.data_logger_path)
-            self.timer.start()
+            # the writer thread closes the old logger, a slow disk doesn't freeze the UI
+            self.data_logger.close(wait=False)
+            self.closing_data_loggers.append(self.data_logger)
+            self.data_logger = QueuedDataLogger(RotatingDataLogger(self.data_logger_path))
+            self.metrics_widget.set_data_logger(self.data_logger)
+            self.waterfall_widget.clear_rows()
+            self.trend_widget.clear_series()
+            self.poll_scheduler = PollScheduler()
+            if self.need_to_trigger_measurement.isChecked():
+                self.poll_scheduler.expect(DEVICE_STATE.IDLE, int(self.before_trigger_time_lineedit.text()))
+                self.poll_scheduler.expect(DEVICE_STATE.EXHALE, int(self.trigger_time_lineedit.text()))
+            self.measuring = True
+            self.timer.start(0)
             self.repeat_times = int(self.times_repeat_lineedit.text())
             if pathlib.Path(self.conc_lineedit.text()).exists():
                 with open(self.conc_lineedit.text(), "r") as fd:
@@ -275,7 +350,16 @@ class MainWidget(QtWidgets.QWidget):
 
     def stop_timer(self):
         self.conc_widget.drop_loaded()
+        self.measuring = False
         self.timer.stop()
+        # start writing the last cycles now, without waiting
+        self.data_logger.flush(timeout=0)
+
+    def close_data_loggers(self):
+        """Waits for every session log to be written and closed, on quit"""
+        for data_logger in self.closing_data_loggers + [self.data_logger]:
+            data_logger.close()
+        self.closing_data_loggers.clear()
 
     def next_gas_iterator_state(self):
         if not self.need_to_wait_for_scientist.isChecked():
@@ -293,76 +377,10 @@ class MainWidget(QtWidgets.QWidget):
 
     def get_all_results(self):
         if self._pre_device_command():
-            state = self.device_bench.get_state()
-            t_ambient = self.device_bench.get_ambient_temp()
-            self.t_ambient_label.setText(f"T_amb: {t_ambient:2.2f} °K")
-            self.parent().statusBar().showMessage(f"Status: {state}, gas_already_sent: {self.gas_already_sent}, already_waited: {self.already_waited}, state: {self.gas_iterator_state}, counter: {self.gas_iterator_counter}")
-            if self.need_to_trigger_measurement.isChecked():
-                if state == 0: # idle
-                    if self.already_waited == int(self.before_trigger_time_lineedit.text()):
-                        self.device_bench.trigger_measurement(float(self.trigger_time_lineedit.text()), print=self.parent().statusBar().showMessage)
-                        self.already_waited = int(self.before_trigger_time_lineedit.text()) + 1
-                    elif self.already_waited < int(self.before_trigger_time_lineedit.text()):
-                        if not self.gas_already_sent:
-                            host, port = self.parent().settings_widget.get_gas_stand_settings()
-                            if not self.need_to_wait_for_scientist.isChecked():
-                                self.gas_iterator_state = next(self.gas_iterator)
-                            set_gas_state(str(2*self.gas_iterator_state + 1), host, port)
-                            self.gas_already_sent = True
-                        self.already_waited += 1
-                elif state == 1: # exhale
-                    self.gas_already_sent = False
-                    self.already_waited = 0
-                elif state == 2: # measuring
-                    if not self.gas_already_sent:
-                        host, port = self.parent().settings_widget.get_gas_stand_settings()
-                        if not self.need_to_wait_for_scientist.isChecked():
-                            self.gas_iterator_state = next(self.gas_iterator)
-                        if self.gas_iterator_state == self.prev_gas_iterator_state:
-                            self.gas_iterator_counter += 1
-                        else:
-                            self.gas_iterator_counter = 1
-                            self.prev_gas_iterator_state = self.gas_iterator_state
-                        self.gas_sensor_state = 2*self.gas_iterator_state + 2
-                        set_gas_state(str(self.gas_sensor_state), host, port)
-                        self.gas_already_sent = True
-                elif state == 3: # purging
-                    self.gas_already_sent = False
-                    if self.device_bench.get_have_data()[0] == 0 and self.device_bench.get_have_result()[0] == 0:
-                        times, temperatures, resistances = self.device_bench.get_cycle()
-                        self.plot_widget.plot_answer(times[1:], resistances[1:])
-                        h2conc, *_ = self.device_bench.get_result()
-                        conc_set = self.conc_widget.get_conc_for_state(str(self.gas_sensor_state))
-                        self.concentration_label.setText("H2 conc: {:2.4f} ppm".format(h2conc))
-                        self.concentration_set_label.setText("H2 conc set: {} ppm".format(conc_set))
-                        heater_cal_transform: HeaterCalTransformTuple = self.device_bench.get_heater_cal_transform()
-                        self.data_logger.save_data(resistances,
-                                                   h2conc,
-                                                   self.gas_sensor_state,
-                                                   temperatures,
-                                                   t_ambient,
-                                                   heater_cal_transform.k,
-                                                   heater_cal_transform.b,
-                                                   conc_set
-                                                   )
-                else:
-                    pass
-            else:
-                if self.device_bench.get_have_data()[0] == 0 and self.device_bench.get_have_result()[0] == 0:
-                    times, temperatures, resistances = self.device_bench.get_cycle()
-                    self.plot_widget.plot_answer(times[1:], resistances[1:])
-                    h2conc, *_ = self.device_bench.get_result()
-                    self.concentration_label.setText(f"H2 conc: {h2conc:2.4f} ppm")
-                    heater_cal_transform: HeaterCalTransformTuple = self.device_bench.get_heater_cal_transform()
-                    self.data_logger.save_data(resistances,
-                                               h2conc,
-                                               self.gasstand_timer.current_state,
-                                               temperatures,
-                                               t_ambient,
-                                               heater_cal_transform.k,
-                                               heater_cal_transform.b,
-                                               self.conc_widget.get_conc_for_state(self.gasstand_timer.current_state),
-                                               )
+            if self.poll_future is not None and not self.poll_future.done():
+                return
+            self.poll_future = self.device_service.submit(poll_device, self.need_to_trigger_measurement.isChecked(),
+                                                          priority=Priority.POLL, callback=self.process_poll_result)
         else:
             msg_box = QtWidgets.QMessageBox()
             msg_box.setWindowTitle("Внимание!!!")
@@ -371,39 +389,153 @@ class MainWidget(QtWidgets.QWidget):
             msg_box.exec_()
             self.stop_timer()
 
+    def process_poll_result(self, future):
+        if not self.measuring:
+            return
+        try:
+            state, t_ambient, cycle = future.result()
+        except Exception as e:
+            if not future.cancelled():
+                self.parent().statusBar().showMessage(f"Device poll failed: {e!r}")
+            self.timer.start(round(self.poll_scheduler.default * 1000))
+            return
+        delay = self.poll_scheduler.default
+        try:
+            delay = self.poll_scheduler.update(state)
+            self._process_poll_result(state, t_ambient, cycle)
+        finally:
+            # the timer is single shot, no error here may stop polling
+            if self.measuring:
+                self.timer.start(round(delay * 1000))
+
+    def _process_poll_result(self, state, t_ambient, cycle):
+        time_in_state = self.poll_scheduler.time_in_state()
+        self.t_ambient_label.setText(f"T_amb: {t_ambient:2.2f} °K")
+        self.trend_widget.add_t_ambient(t_ambient)
+        self.parent().statusBar().showMessage(f"Status: {state}, gas_already_sent: {self.gas_already_sent}, in state: {time_in_state:.1f} s, state: {self.gas_iterator_state}, counter: {self.gas_iterator_counter}")
+        if self.need_to_trigger_measurement.isChecked():
+            if state == 0: # idle
+                if self.triggered:
+                    pass
+                elif time_in_state >= int(self.before_trigger_time_lineedit.text()):
+                    self.device_service.submit("trigger_measurement", float(self.trigger_time_lineedit.text()),
+                                               print=self.device_service.message.emit, callback=self._show_device_error)
+                    self.triggered = True
+                elif not self.gas_already_sent:
+                    host, port = self.parent().settings_widget.get_gas_stand_settings()
+                    if not self.need_to_wait_for_scientist.isChecked():
+                        self.gas_iterator_state = next(self.gas_iterator)
+                    set_gas_state(str(2*self.gas_iterator_state + 1), host, port)
+                    self.gas_already_sent = True
+            elif state == 1: # exhale
+                self.gas_already_sent = False
+                self.triggered = False
+            elif state == 2: # measuring
+                if not self.gas_already_sent:
+                    host, port = self.parent().settings_widget.get_gas_stand_settings()
+                    if not self.need_to_wait_for_scientist.isChecked():
+                        self.gas_iterator_state = next(self.gas_iterator)
+                    if self.gas_iterator_state == self.prev_gas_iterator_state:
+                        self.gas_iterator_counter += 1
+                    else:
+                        self.gas_iterator_counter = 1
+                        self.prev_gas_iterator_state = self.gas_iterator_state
+                    self.gas_sensor_state = 2*self.gas_iterator_state + 2
+                    set_gas_state(str(self.gas_sensor_state), host, port)
+                    self.gas_already_sent = True
+            elif state == 3: # purging
+                self.gas_already_sent = False
+                if cycle is not None:
+                    self.plot_widget.plot_answer(cycle.times[1:], cycle.resistances[1:])
+                    self.waterfall_widget.add_cycle(cycle.times[1:], cycle.resistances[1:])
+                    conc_set = self.conc_widget.get_conc_for_state(str(self.gas_sensor_state))
+                    self.concentration_label.setText("H2 conc: {:2.4f} ppm".format(cycle.h2conc))
+                    self.concentration_set_label.setText("H2 conc set: {} ppm".format(conc_set))
+                    self.trend_widget.add_concentration(cycle.h2conc, conc_set)
+                    self.data_logger.save_data(cycle.resistances,
+                                               cycle.h2conc,
+                                               self.gas_sensor_state,
+                                               cycle.temperatures,
+                                               t_ambient,
+                                               cycle.heater_cal_transform.k,
+                                               cycle.heater_cal_transform.b,
+                                               conc_set
+                                               )
+            else:
+                pass
+        else:
+            if cycle is not None:
+                self.plot_widget.plot_answer(cycle.times[1:], cycle.resistances[1:])
+                self.waterfall_widget.add_cycle(cycle.times[1:], cycle.resistances[1:])
+                self.concentration_label.setText(f"H2 conc: {cycle.h2conc:2.4f} ppm")
+                conc_set = self.conc_widget.get_conc_for_state(self.gasstand_timer.current_state)
+                self.trend_widget.add_concentration(cycle.h2conc, conc_set)
+                self.data_logger.save_data(cycle.resistances,
+                                           cycle.h2conc,
+                                           self.gasstand_timer.current_state,
+                                           cycle.temperatures,
+                                           t_ambient,
+                                           cycle.heater_cal_transform.k,
+                                           cycle.heater_cal_transform.b,
+                                           conc_set,
+                                           )
+
     def get_heater_calibration(self):
-        if self.timer.isActive():
+        if self.measuring:
             return
         if self._pre_device_command():
-            voltages, temperatures = self.device_bench.get_heater_calibration()
-            heater_cal_transform: HeaterCalTransformTuple = self.device_bench.get_heater_cal_transform()
-            heater_params = self.device_bench.get_heater_params()
-            voltages_cal = voltages * heater_cal_transform.k + heater_cal_transform.b
             filename, *_ = QtWidgets.QFileDialog.getOpenFileName(self, "Get cal file", dir="./")
             filename_par, *_ = QtWidgets.QFileDialog.getOpenFileName(self, "Get par file", dir="./")
+            sensor_number = None
             if filename:
                 sensor_number, *_ = QtWidgets.QInputDialog.getInt(self, "What is the number of sensor you wanna see",
                                                                   "Sensor number:", 0)
-                config = configparser.ConfigParser()
-                config.read(filename_par)
-                R0 = float(config["R0"][f"R0_{sensor_number}"].replace(",", "."))/100
-                Rc = float(config["Rc"][f"Rc_{sensor_number}"].replace(",", "."))/100
-                alpha = float(config["a"][f"a0_{sensor_number}"].replace(",", "."))
-                T0 = float(config["T0"]["T0"].replace(",", "."))
-
-                data = np.loadtxt(filename, skiprows=1)
-                ms_temperatures = data[:, sensor_number * 3 + 2]
-                R = (1  + alpha * (ms_temperatures - T0)) * (R0 - Rc) + Rc
-                ms_voltages = data[:, sensor_number * 3] # * R / (R + 20)
-                ms_voltages_recalc = data[:, sensor_number * 3] * R / (R + 20)
-            else:
-                ms_temperatures = []
-                ms_voltages = []
-                ms_voltages_recalc = []
-            self.plot_widget.plot_heater_calibration(voltages, temperatures,
-                                                     ms_voltages, ms_temperatures,
-                                                     ms_voltages_recalc, ms_temperatures,
-                                                     voltages_cal, temperatures, heater_params=heater_params)
+            self.device_service.submit(read_heater_calibration,
+                                       callback=functools.partial(self.plot_heater_calibration,
+                                                                  filename, filename_par, sensor_number))
+
+    def plot_heater_calibration(self, filename, filename_par, sensor_number, future):
+        if future.cancelled():
+            return
+        try:
+            (voltages, temperatures), heater_cal_transform, heater_params = future.result()
+        except Exception as e:
+            self.parent().statusBar().showMessage(f"Can't get heater calibration: {e!r}")
+            return
+        voltages_cal = voltages * heater_cal_transform.k + heater_cal_transform.b
+        curves = fit = None
+        ms_voltages = ms_temperatures = ms_voltages_recalc = []
+        if filename:
+            try:
+                curves = heater_calibration.load_curves(filename, filename_par)
+                fit = heater_calibration.fit_sensors(curves, voltages, temperatures)
+            except Exception as e:
+                self.parent().statusBar().showMessage(f"Can't read heater calibration files: {e!r}")
+                return
+            sensors = curves.voltages.shape[1]
+            if not 0 <= sensor_number < sensors:
+                self.parent().statusBar().showMessage(f"No sensor {sensor_number} in {filename}, "
+                                                      f"sensors are 0..{sensors - 1}")
+                return
+            ms_voltages = curves.voltages[:, sensor_number]
+            ms_temperatures = curves.temperatures[:, sensor_number]
+            ms_voltages_recalc = curves.voltages_recalc[:, sensor_number]
+            self.parent().statusBar().showMessage(
+                f"Sensor {sensor_number}: k={fit.k[sensor_number]:.4g}, b={fit.b[sensor_number]:.4g}, "
+                f"rms={fit.rms[sensor_number]:.3g} V, device k={heater_cal_transform.k:.4g}, b={heater_cal_transform.b:.4g}")
+        self.plot_widget.plot_heater_calibration(voltages, temperatures,
+                                                 ms_voltages, ms_temperatures,
+                                                 ms_voltages_recalc, ms_temperatures,
+                                                 voltages_cal, temperatures, heater_params=heater_params)
+        export = self.export_executor.submit(heater_calibration.export_report, pathlib.Path.cwd(),
+                                             voltages, temperatures, voltages_cal, curves, fit, sensor_number)
+        export.add_done_callback(self._heater_calibration_exported)
+
+    @staticmethod
+    def _heater_calibration_exported(future):
+        # runs in the export thread, so only logs
+        if future.exception() is not None:
+            logger.info(f"Heater calibration export failed: {future.exception()!r}")
 
     def open_conces_gas_stand_file(self):
         filename, *_ = QtWidgets.QFileDialog.getOpenFileName(self, "Открыть файл для газового стенда", "./", "*")
@@ -426,33 +558,9 @@ class MainWidget(QtWidgets.QWidget):
 
     def upload_firmware(self):
         filename, *_ = QtWidgets.QFileDialog.getOpenFileName(self, "Choose firmware file", "./", "*")
-        if filename:
-            counter = 0
-            good = True
-            ota_answer = self.device_bench.start_ota()
-            if ota_answer == 0:
-                with open(filename, "rb") as fd:
-                    red = fd.read(2000)
-                    while good and len(red) != 0:
-                        ota_answer = self.device_bench.chunk_ota(red)
-                        if ota_answer == 0:
-                            while True:
-                                sleep(0.5)
-                                if self.device_bench.check_ota() == 0:
-                                    break
-                            counter += 1
-                            self.parent().statusBar().showMessage(f"OTA progress: {counter}")
-                            red = fd.read(2000)
-                        else:
-                            self.parent().statusBar().showMessage(f"OTA update failed on {counter} step with code {ota_answer}")
-                            good = False
-                if good:
-                    if self.device_bench.finalize_ota() == 0:
-                        self.parent().statusBar().showMessage("Successful OTA update")
-                    else:
-                        self.parent().statusBar().showMessage("Failed finalize OTA update")
-            else:
-                self.parent().statusBar().showMessage(f"Cant start OTA with code {ota_answer}")
+        if filename and self._pre_device_command():
+            self.device_service.submit(upload_firmware_file, filename, self.device_service.message.emit,
+                                       cancel=self.device_service.closing, callback=self._show_device_error)
 
     def upload_temperature_cycle(self):
         filename, *_ = QtWidgets.QFileDialog.getOpenFileName(self, "Choose calibration file", "./", "*")
@@ -465,39 +573,17 @@ class MainWidget(QtWidgets.QWidget):
                     msg_box.setText("Len of array is not equal to 301")
                     msg_box.exec_()
                     return
-                answer = self.device_bench.set_cycle(values)
-                if answer[0] == 0:
-                    self.parent().statusBar().showMessage("Calibration loaded")
-                else:
-                    self.parent().statusBar().showMessage("Calibration not loaded")
+                if self._pre_device_command():
+                    self.device_service.submit("set_cycle", values, callback=self._temperature_cycle_uploaded)
+
+    def _temperature_cycle_uploaded(self, future):
+        if not future.cancelled() and future.exception() is None and future.result()[0] == 0:
+            self.parent().statusBar().showMessage("Calibration loaded")
+        else:
+            self.parent().statusBar().showMessage("Calibration not loaded")
 
     def upload_model(self):
         filename, *_ = QtWidgets.QFileDialog.getOpenFileName(self, "Choose model file", "./", "*")
-        if filename:
-            counter = 0
-            good = True
-            with open(filename, "rb") as fd:
-                values = fd.read()
-            filebinarysize = len(values)
-            crc = self.device_bench.crc(values)
-            model_post_send_answer = self.device_bench.post_model_update_init(1, filebinarysize, crc)
-            size_to_read = 0x1000
-            if model_post_send_answer == 0:
-                with open(filename, "rb") as fd:
-                    red = fd.read(size_to_read)
-                    while good and len(red) != 0:
-                        model_update_answer = self.device_bench.post_model_chunk_send(red)
-                        if model_update_answer == 0:
-                            counter += 1
-                            self.parent().statusBar().showMessage(f"Model update progress: {counter}")
-                            red = fd.read(size_to_read)
-                        else:
-                            self.parent().statusBar().showMessage(f"Model update failed on {counter} step with code {model_update_answer}")
-                            good = False
-                if good:
-                    if self.device_bench.post_model_finalize() == 0:
-                        self.parent().statusBar().showMessage("Successful model update")
-                    else:
-                        self.parent().statusBar().showMessage("Failed finalize model update")
-            else:
-                self.parent().statusBar().showMessage(f"Cant start model update with code {model_post_send_answer}")
+        if filename and self._pre_device_command():
+            self.device_service.submit(upload_model_file, filename, self.device_service.message.emit,
+                                       cancel=self.device_service.closing, callback=self._show_device_error)
@@ -0,0 +1,224 @@
+import mmap
+import time
+import typing
+import logging
+import threading
+from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+
+from device import OTA_CHUNK_SIZE, MODEL_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+CRC_BLOCK_SIZE = 1 << 16
+
+OTA_POLL_MIN = 0.002
+OTA_POLL_MAX = 0.2
+OTA_READY_TIMEOUT = 10.0
+
+
+class ImageFile():
+    """Firmware or model image mapped into memory. Chunks are memoryview slices of the
+    mapping, so memory use does not depend on the image size."""
+    def __init__(self, filename, chunk_size):
+        self.chunk_size = chunk_size
+        self._file = open(filename, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = memoryview(self._mmap)
+        except ValueError:
+            # empty file can not be mapped
+            self._mmap = None
+            self.data = memoryview(b"")
+
+    def __len__(self):
+        return len(self.data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def chunks_number(self):
+        return -(-len(self.data) // self.chunk_size)
+
+    def chunk(self, index):
+        return self.data[index * self.chunk_size:(index + 1) * self.chunk_size]
+
+    def crc(self, crc_calculator) -> int:
+        crc = 0
+        for start in range(0, len(self.data), CRC_BLOCK_SIZE):
+            crc = crc_calculator.update(self.data[start:start + CRC_BLOCK_SIZE], crc)
+        return crc
+
+    def close(self):
+        self.data.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class UploadStats():
+    """Timings of streamed chunks. host is time the sender waited for a prepared
+    chunk, link is time of send_prepared, i.e. write and answer of the device."""
+    def __init__(self):
+        self.chunks = 0
+        self.bytes = 0
+        self.host = []
+        self.link = []
+        self.started = time.perf_counter()
+
+    def add(self, size, host, link):
+        self.chunks += 1
+        self.bytes += size
+        self.host.append(host)
+        self.link.append(link)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        """Bytes per second since the start of the upload"""
+        return self.bytes / max(self.elapsed, 1e-9)
+
+    def eta(self, total_bytes):
+        return (total_bytes - self.bytes) / self.rate if self.bytes else float("inf")
+
+    def progress(self, total_bytes):
+        return f"{self.bytes}/{total_bytes} bytes, {self.rate / 1024:.1f} KiB/s, ETA {self.eta(total_bytes):.0f} s"
+
+    def __str__(self):
+        if not self.chunks:
+            return "no chunks sent"
+        return (f"{self.chunks} chunks, {self.bytes} bytes in {self.elapsed:.2f} s, "
+                f"host overhead {sum(self.host) / self.chunks * 1e3:.3f} ms/chunk, "
+                f"link {sum(self.link) / self.chunks * 1e3:.3f} ms/chunk")
+
+
+class UploadCancelled(Exception):
+    pass
+
+
+def stream_chunks(device, name, image: ImageFile, stats: UploadStats,
+                  cancel: typing.Optional[threading.Event] = None):
+    """Sends every chunk of image with COMMANDS entry name, yields (index, answer).
+    Raises UploadCancelled before the next chunk once cancel is set.
+
+    Next chunk is escaped and checksummed in a background thread while the current one
+    is in flight, only the counter and its CRC are added on the sending side."""
+    if not image.chunks_number:
+        return
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="UploadPrepare") as executor:
+        prepared_future = executor.submit(device.prepare, name, image.chunk(0))
+        for index in range(image.chunks_number):
+            if cancel is not None and cancel.is_set():
+                raise UploadCancelled(f"{name} cancelled after {index}/{image.chunks_number} chunks")
+            started = time.perf_counter()
+            prepared = prepared_future.result()
+            if index + 1 < image.chunks_number:
+                prepared_future = executor.submit(device.prepare, name, image.chunk(index + 1))
+            ready = time.perf_counter()
+            answer = device.send_prepared(prepared)
+            stats.add(len(image.chunk(index)), ready - started, time.perf_counter() - ready)
+            yield index, answer
+
+
+class ReadinessPoller():
+    """Waits until the device has flashed a chunk, polling OTA_GET_READY.
+
+    The first poll comes after most of the flash time observed on previous chunks,
+    then the interval grows from minimum by half on every BUSY up to maximum.
+    interval fixes the poll period instead, like the old 0.5 s sleep."""
+    def __init__(self, device, interval=None, minimum=OTA_POLL_MIN, maximum=OTA_POLL_MAX,
+                 timeout=OTA_READY_TIMEOUT):
+        self.device = device
+        self.interval = interval
+        self.minimum = minimum
+        self.maximum = maximum
+        self.timeout = timeout
+        self.latency = None
+        self.polls = 0
+
+    def _first_interval(self):
+        if self.interval is not None:
+            return self.interval
+        if self.latency is None:
+            return self.minimum
+        return min(max(self.latency * 0.8, self.minimum), self.maximum)
+
+    def wait(self) -> bool:
+        """False if the device is still busy after timeout"""
+        started = time.perf_counter()
+        sleep(self._first_interval())
+        interval = self.minimum if self.interval is None else self.interval
+        while True:
+            self.polls += 1
+            if self.device.check_ota(print=logger.debug) == 0:
+                break
+            if time.perf_counter() - started > self.timeout:
+                return False
+            sleep(interval)
+            if self.interval is None:
+                interval = min(interval * 1.5, self.maximum)
+        latency = time.perf_counter() - started
+        self.latency = latency if self.latency is None else 0.75 * self.latency + 0.25 * latency
+        return True
+
+
+def upload_firmware_file(device, filename, print=logger.info, poll_interval=None,
+                         cancel: typing.Optional[threading.Event] = None):
+    """poll_interval: fixed OTA_GET_READY period, s, None adapts it to the flash time of the device.
+    cancel: stops the upload between chunks and aborts OTA on the device"""
+    ota_answer = device.start_ota()
+    if ota_answer != 0:
+        print(f"Cant start OTA with code {ota_answer}")
+        return
+    stats = UploadStats()
+    poller = ReadinessPoller(device, poll_interval)
+    with ImageFile(filename, OTA_CHUNK_SIZE) as image:
+        try:
+            for counter, ota_answer in stream_chunks(device, "chunk_ota", image, stats, cancel):
+                if ota_answer != 0:
+                    print(f"OTA update failed on {counter} step with code {ota_answer}")
+                    return
+                if not poller.wait():
+                    print(f"OTA update failed on {counter} step, device is busy for {poller.timeout} s")
+                    return
+                print(f"OTA progress: {counter + 1}/{image.chunks_number}, {stats.progress(len(image))}")
+        except UploadCancelled as e:
+            device.abort_ota(print=logger.debug)
+            print(f"OTA update: {e}")
+            return
+    logger.info(f"OTA upload: {stats}, {poller.polls} readiness polls")
+    if device.finalize_ota() == 0:
+        print("Successful OTA update")
+    else:
+        print("Failed finalize OTA update")
+
+
+def upload_model_file(device, filename, print=logger.info, cancel: typing.Optional[threading.Event] = None):
+    """cancel: stops the upload between chunks, the model is not finalized"""
+    with ImageFile(filename, MODEL_CHUNK_SIZE) as image:
+        model_post_send_answer = device.post_model_update_init(1, len(image), image.crc(device.crc))
+        if model_post_send_answer != 0:
+            print(f"Cant start model update with code {model_post_send_answer}")
+            return
+        stats = UploadStats()
+        try:
+            for counter, model_update_answer in stream_chunks(device, "post_model_chunk_send", image, stats, cancel):
+                if model_update_answer != 0:
+                    print(f"Model update failed on {counter} step with code {model_update_answer}")
+                    return
+                print(f"Model update progress: {counter + 1}")
+        except UploadCancelled as e:
+            print(f"Model update: {e}")
+            return
+    logger.info(f"Model upload: {stats}")
+    if device.post_model_finalize() == 0:
+        print("Successful model update")
+    else:
+        print("Failed finalize model update")
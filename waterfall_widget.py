@@ -0,0 +1,76 @@
+import numpy as np
+import pyqtgraph as pg
+from PySide2 import QtCore
+
+WATERFALL_COLORMAP = "viridis"
+INITIAL_ROWS = 1024
+
+
+class WaterfallWidget(pg.PlotWidget):
+    """Whole session at a glance: log10 resistance over time in cycle (x) against cycle index (y).
+
+    Rows are kept as color indices in a uint8 buffer doubled when full and shown through
+    a lookup table by a single ImageItem, so adding a cycle colors one row and the image is
+    not converted again. Log values are kept too, set_levels recolors from them."""
+    def __init__(self):
+        super().__init__()
+        self.getPlotItem().setLabel("left", "Cycle")
+        self.getPlotItem().setLabel("bottom", "Time", units="ds")
+        self.image_item = pg.ImageItem(axisOrder="row-major")
+        self.image_item.setLookupTable(pg.colormap.get(WATERFALL_COLORMAP).getLookupTable(nPts=256))
+        self.addItem(self.image_item)
+        self.rows = 0
+        self.levels = None
+        self._log_resistances = None
+        self._indices = None
+
+    def clear_rows(self):
+        self.rows = 0
+        self.levels = None
+        self._log_resistances = self._indices = None
+        self.image_item.clear()
+
+    def _grow(self, points):
+        capacity = INITIAL_ROWS if self._indices is None else 2 * len(self._indices)
+        log_resistances = np.empty((capacity, points), dtype=np.float32)
+        indices = np.empty((capacity, points), dtype=np.uint8)
+        if self._indices is not None:
+            log_resistances[:self.rows] = self._log_resistances[:self.rows]
+            indices[:self.rows] = self._indices[:self.rows]
+        self._log_resistances, self._indices = log_resistances, indices
+
+    def _color(self, log_resistances, out):
+        low, high = self.levels
+        np.clip((log_resistances - low) * (255 / (high - low)), 0, 255, out=log_resistances)
+        np.rint(log_resistances, out=log_resistances)
+        out[:] = log_resistances
+
+    def add_cycle(self, times, resistances):
+        self.add_cycles(times, np.asarray(resistances)[np.newaxis])
+
+    def add_cycles(self, times, resistances):
+        """Rows of resistances with the same times, the image is updated once"""
+        log_resistances = np.log10(np.maximum(np.asarray(resistances, dtype=np.float32), 1e-3))
+        if self._indices is not None and self._indices.shape[1] != log_resistances.shape[1]:
+            self.clear_rows()
+        while self._indices is None or self.rows + len(log_resistances) > len(self._indices):
+            self._grow(log_resistances.shape[1])
+        if self.levels is None:
+            # from the first cycle with a margin, later cycles out of it are clipped
+            low, high = float(log_resistances[0].min()), float(log_resistances[0].max())
+            margin = max(high - low, 0.1) * 0.25
+            self.levels = (low - margin, high + margin)
+        rows = slice(self.rows, self.rows + len(log_resistances))
+        self._log_resistances[rows] = log_resistances
+        self._color(log_resistances, self._indices[rows])
+        self.rows += len(log_resistances)
+        self.image_item.setImage(self._indices[:self.rows], autoLevels=False)
+        step = (times[-1] - times[0]) / max(len(times) - 1, 1)
+        self.image_item.setRect(QtCore.QRectF(times[0] - step / 2, 0, step * len(times), self.rows))
+
+    def set_levels(self, low, high):
+        """Color range of log10 resistance"""
+        self.levels = (low, high)
+        if self.rows:
+            self._color(self._log_resistances[:self.rows].copy(), self._indices[:self.rows])
+            self.image_item.setImage(self._indices[:self.rows], autoLevels=False)